@@ -0,0 +1,298 @@
+#!/usr/bin/env pybricks-micropython
+
+# BINARY TELEMETRY CODEC
+#
+# Shared by the EV3 (robo_v1/src/codec.py) and the server (roboserver_v2/src/codec.py).
+# Both copies have to stay identical, so only use what pybricks-micropython supports here.
+#
+# Stream layout:
+#   MAGIC, then frames of  kind (1 byte) | stream id (1 byte) | payload length (2 bytes, little endian) | payload
+#
+#   KIND_SCHEMA   payload = "<types>$<name>;<name>;..."  (sent once per stream, before its first record)
+#   KIND_RECORD   payload = values packed with struct format "<" + types
+#   KIND_CONSOLE  payload = message text
+#   KIND_SEQ      payload = sequence number (4 bytes) of the next record / console frame, the following
+#                 record and console frames are numbered implicitly (dataio.ResumableNetworkIOHandler)
+#   KIND_END      no payload, the rest of the data is unused (the zeros of a preallocated dataio.BinaryFileIOHandler
+#                 file)
+#
+# Resume request (server -> robot, dataio.ResumableNetworkIOHandler): RESUME_MAGIC | next needed sequence number
+#
+# Datagram layout (dataio.DatagramIOHandler), every datagram carries a single stream and can be decoded on its own:
+#   stream id (1 byte) | sequence number of the datagram within the stream (4 bytes) | schema frame | record frames
+
+# IMPORTS ----------------------------------------------------------------------------
+
+import struct
+
+
+# CONSTANTS --------------------------------------------------------------------------
+
+MAGIC = b"RBT1"
+
+KIND_SCHEMA = 1
+KIND_RECORD = 2
+KIND_CONSOLE = 3
+KIND_SEQ = 4
+KIND_END = 0
+
+HEADER_FORMAT = "<BBH"
+HEADER_SIZE = 4
+MAX_PAYLOAD = 0xFFFF
+MAX_STREAMS = 255
+
+CONSOLE_NAMES = ("console",)
+
+DATAGRAM_HEADER_FORMAT = "<BI"
+DATAGRAM_HEADER_SIZE = 5
+MAX_DATAGRAM = 1400
+HELLO = b"RBT1-HELLO"
+
+RESUME_MAGIC = b"RSUM"
+RESUME_FORMAT = "<4sI"
+RESUME_SIZE = 8
+
+
+def default_type(param_name):
+    """
+    time stamps need double precision, everything else is sent as 32 bit float
+
+    :param param_name: name of the logged parameter
+    :return: struct type character
+    """
+    if param_name.endswith("time"):
+        return "d"
+    return "f"
+
+
+def frame(kind, stream_id, payload):
+    if len(payload) > MAX_PAYLOAD:
+        payload = payload[:MAX_PAYLOAD]
+    return struct.pack(HEADER_FORMAT, kind, stream_id, len(payload)) + payload
+
+
+def seq_frame(seq):
+    return frame(KIND_SEQ, 0, struct.pack("<I", seq))
+
+
+def resume_request(seq):
+    return struct.pack(RESUME_FORMAT, RESUME_MAGIC, seq)
+
+
+def parse_resume_request(data):
+    magic, seq = struct.unpack(RESUME_FORMAT, data)
+    if magic != RESUME_MAGIC:
+        raise Exception("codec: invalid resume request")
+    return seq
+
+
+# ENCODER ----------------------------------------------------------------------------
+
+
+class Encoder:
+
+    def __init__(self):
+        """
+        Turns log calls into binary frames. A schema frame is emitted the first time a list of
+        parameter names is seen, afterwards only the packed values are sent.
+        """
+        self.streams = {}
+        self.started = False
+
+        # fast path for callers that pass the same name list object every time
+        self._last = (None, None)
+
+    def reset(self):
+        """
+        forget all streams, needed when the peer changes (e.g. after a reconnect)
+        """
+        self.streams = {}
+        self.started = False
+        self._last = (None, None)
+
+    def _start(self):
+        if self.started:
+            return b""
+        self.started = True
+        return MAGIC
+
+    def _add_stream(self, key, types=None):
+        if len(self.streams) >= MAX_STREAMS:
+            raise Exception("Encoder: too many streams")
+        if types is None:
+            types = "".join([default_type(name) for name in key])
+        stream_id = len(self.streams) + 1
+        payload = (types + "$" + ";".join(key)).encode('ascii')
+        stream = (stream_id, "<" + types, struct.calcsize("<" + types), frame(KIND_SCHEMA, stream_id, payload))
+        self.streams[key] = stream
+        return stream
+
+    def stream(self, param_names):
+        """
+        looks up a stream without emitting anything, the stream is created on first use
+
+        :param param_names: list of parameter names
+        :return: (stream id, struct format, record size, schema frame)
+        """
+        last = self._last
+        if param_names is last[0]:
+            return last[1]
+        key = tuple(param_names)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self._add_stream(key)
+        self._last = (param_names, stream)
+        return stream
+
+    def schema_frames(self):
+        """
+        :return: the schema frames of all known streams, e.g. to introduce them again after a reconnect
+        """
+        streams = sorted(self.streams.values())
+        return b"".join([stream[3] for stream in streams])
+
+    def pack_record(self, stream, values):
+        return struct.pack(HEADER_FORMAT, KIND_RECORD, stream[0], stream[2]) + struct.pack(stream[1], *values)
+
+    def declare(self, param_names, types):
+        """
+        announce a stream with explicit types instead of the defaults from default_type()
+
+        :param param_names: list of parameter names
+        :param types: struct type characters, one per parameter (e.g. "dfff")
+        :return: bytes that have to be sent before any record of this stream
+        """
+        key = tuple(param_names)
+        if key in self.streams:
+            return b""
+        stream = self._add_stream(key, types)
+        return self._start() + stream[3]
+
+    def encode_record(self, param_names, values):
+        last = self._last
+        data = b""
+        if param_names is last[0]:
+            stream = last[1]
+        else:
+            key = tuple(param_names)
+            stream = self.streams.get(key)
+            if stream is None:
+                stream = self._add_stream(key)
+                data = self._start() + stream[3]
+            self._last = (param_names, stream)
+
+        return data + self.pack_record(stream, values)
+
+    def encode_console(self, message):
+        return self._start() + frame(KIND_CONSOLE, 0, str(message).encode('utf-8'))
+
+
+# DECODER ----------------------------------------------------------------------------
+
+
+class Decoder:
+
+    def __init__(self):
+        """
+        Incremental decoder for the byte stream written by Encoder. Data can be fed in chunks of any size.
+        """
+        self.buffer = bytearray()
+        self.schemas = {}
+        self.magic_seen = False
+
+        # sequence numbers (only streams with KIND_SEQ frames), seq is the number of the next record
+        self.seq = None
+        self.lost = 0
+        self.restarts = 0
+
+    def feed(self, data):
+        """
+        adds received bytes and decodes all complete frames
+
+        :param data: received bytes
+        :return: list of (names, values) tuples, console messages are returned as (("console",), (message,))
+        """
+        self.buffer.extend(data)
+        buffer = self.buffer
+        pos = 0
+
+        if not self.magic_seen:
+            if len(buffer) < len(MAGIC):
+                return []
+            if bytes(buffer[:len(MAGIC)]) != MAGIC:
+                raise Exception("Decoder: stream does not start with " + str(MAGIC))
+            self.magic_seen = True
+            pos = len(MAGIC)
+
+        records = []
+        seqs = []
+        pos = decode_frames(buffer, pos, len(buffer), self.schemas, records, seqs)
+        del buffer[:pos]
+        if len(seqs) > 0 or self.seq is not None:
+            self._count(len(records), seqs)
+        return records
+
+    def _count(self, n, seqs):
+        seq = self.seq
+        index = 0
+        for i, value in seqs:
+            if seq is not None:
+                seq += i - index
+                if value > seq:
+                    self.lost += value - seq
+                elif value < seq:
+                    self.restarts += 1
+            seq = value
+            index = i
+        self.seq = seq + n - index
+
+
+def decode_frames(buffer, pos, end, schemas, records, seqs=None):
+    """
+    decodes all complete frames in buffer[pos:end]
+
+    :param buffer: bytes-like object
+    :param pos: position of the first frame header
+    :param end: end of the valid data
+    :param schemas: dict stream id -> (names, struct format), updated with received schema frames
+    :param records: list the decoded (names, values) tuples are appended to
+    :param seqs: optional list, gets (index in records, sequence number) for every KIND_SEQ frame
+    :return: position after the last complete frame
+    """
+    while end - pos >= HEADER_SIZE:
+        kind, stream_id, length = struct.unpack_from(HEADER_FORMAT, buffer, pos)
+        if kind == KIND_END:
+            break
+        if end - pos - HEADER_SIZE < length:
+            break
+        start = pos + HEADER_SIZE
+        pos = start + length
+
+        if kind == KIND_RECORD:
+            names, fmt = schemas[stream_id]
+            records.append((names, struct.unpack_from(fmt, buffer, start)))
+        elif kind == KIND_SCHEMA:
+            types, _names = bytes(buffer[start:pos]).decode('ascii').split("$")
+            schemas[stream_id] = (tuple(_names.split(";")), "<" + types)
+        elif kind == KIND_CONSOLE:
+            records.append((CONSOLE_NAMES, (bytes(buffer[start:pos]).decode('utf-8'),)))
+        elif kind == KIND_SEQ:
+            if seqs is not None:
+                seqs.append((len(records), struct.unpack_from("<I", buffer, start)[0]))
+        else:
+            raise Exception("Decoder: unknown frame kind " + str(kind))
+
+    return pos
+
+
+def decode_datagram(data):
+    """
+    decodes a datagram sent by dataio.DatagramIOHandler
+
+    :param data: received datagram
+    :return: (stream id, sequence number, list of (names, values) tuples)
+    """
+    stream_id, seq = struct.unpack_from(DATAGRAM_HEADER_FORMAT, data, 0)
+    records = []
+    decode_frames(data, DATAGRAM_HEADER_SIZE, len(data), {}, records)
+    return stream_id, seq, records
@@ -17,6 +17,10 @@ from global_vars import IO_HANDLER
 # COLOR SENSOR CODE -------------------------------------------------------------------------------------
 
 
+# created once, so the binary IO handler can recognise the stream without rebuilding the names
+LOG_NAMES = ["cs-time", "cs-v", "cs-e", "cs-i", "cs-d"]
+
+
 class ColorSensorHandler:
 
     def __init__(self,
@@ -156,7 +160,7 @@ class ColorSensorHandler:
             self.log_i += 1
             if self.log_i > self.log_every_nth:
                 self.log_i = 0
-                IO_HANDLER.log_params(param_names=["cs-time", "cs-v", "cs-e", "cs-i", "cs-d"],
+                IO_HANDLER.log_params(param_names=LOG_NAMES,
                                       values=[time.time(), self.raw_value, self.error, self.integral, self.derivative])
 
 
@@ -3,12 +3,15 @@
 # IMPORTS ----------------------------------------------------------------------------
 
 # micropython imports
+import _thread
 import socket
+import struct
 # pybricks imports
 import time
 
 from pybricks.hubs import EV3Brick
 # program import
+import codec
 from global_vars import HOST, PORT
 
 
@@ -42,16 +45,262 @@ class DummyIOHandler(IOHandler):
         pass
 
 
+# BATCHED SENDER ---------------------------------------------------------------------------
+
+
+# priority classes of queued data
+PRIORITY_EVENT = 0   # console messages, schema frames, gap reports: never dropped
+PRIORITY_SERIES = 1  # high rate cs-* / lf-* series: decimated and dropped when the link can't keep up
+
+MAX_DECIMATION = 64
+
+
+class BatchedSender:
+
+    def __init__(self, conn, buffer_size=16384, flush_period=0.05, flush_bytes=2048, poll_period=0.005,
+                 event_reserve=0.25, adapt_period=1.0, report_period=1.0):
+        """
+        Collects outgoing data in a preallocated, bounded buffer and sends it from its own thread,
+        so the sensor thread, the distance thread and the state loop never wait for the network.
+        Pending data is sent with a single send() every flush_period seconds, or earlier when flush_bytes are queued.
+
+        Data has a priority class: series data is dropped (and counted) when it doesn't fit, events wait for space.
+        The last event_reserve part of the buffer is kept free for events.
+        From the measured link throughput the sender computes a decimation factor for series data,
+        the IO handler only keeps every decimation-th record of a series.
+
+        :param conn: connected socket
+        :param buffer_size: size of the preallocated buffer in bytes
+        :param flush_period: max time in seconds between two flushes
+        :param flush_bytes: number of queued bytes that triggers a flush before flush_period is over
+        :param poll_period: how often the sender thread looks at the buffer
+        :param event_reserve: part of the buffer series data can't use
+        :param adapt_period: how often in seconds the decimation factor is recomputed
+        :param report_period: how often in seconds on_report is called (used to send gap reports)
+        """
+        self.conn = conn
+        self.buffer_size = buffer_size
+        self.series_limit = int(buffer_size * (1.0 - event_reserve))
+        self.flush_period = flush_period
+        self.flush_bytes = flush_bytes
+        self.poll_period = poll_period
+        self.adapt_period = adapt_period
+        self.report_period = report_period
+        self.on_report = None
+
+        # double buffering: callers write into self.buffer while the thread sends self.send_buffer
+        self.buffer = bytearray(buffer_size)
+        self.send_buffer = bytearray(buffer_size)
+        self.fill = 0
+        self.lock = _thread.allocate_lock()
+
+        # counters
+        self.sent_bytes = 0
+        self.dropped_bytes = 0
+        self.flushes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.max_blocked = 0.0
+
+        # adaptive decimation
+        self.decimation = 1
+        self.link_rate = None
+        self.series_bytes = 0
+
+        # threading
+        self.running = True
+        self.stopped = False
+        # set when a send failed, see _loop
+        self.failed = False
+        self.error = None
+        _thread.start_new_thread(self._loop, ())
+
+    @property
+    def queued_bytes(self):
+        return self.fill
+
+    def append(self, data, priority=PRIORITY_SERIES):
+        """
+        queues data for sending, only events wait if the buffer is full
+
+        :param data: bytes to send
+        :param priority: PRIORITY_EVENT or PRIORITY_SERIES
+        :return: False if the data was dropped
+        """
+        t0 = time.time()
+        n = len(data)
+        limit = self.series_limit if priority == PRIORITY_SERIES else self.buffer_size
+        queued = False
+
+        while True:
+            self.lock.acquire()
+            fill = self.fill
+            if not self.failed and fill + n <= limit:
+                self.buffer[fill:fill + n] = data
+                self.fill = fill + n
+                if priority == PRIORITY_SERIES:
+                    self.series_bytes += n
+                self.lock.release()
+                queued = True
+                break
+            # after a failed send nothing frees the buffer any more, events are dropped as well
+            if self.failed or priority == PRIORITY_SERIES or n > limit:
+                self.dropped_bytes += n
+                self.lock.release()
+                break
+            self.lock.release()
+            time.sleep(self.poll_period)
+
+        blocked = time.time() - t0
+        if blocked > self.max_blocked:
+            self.max_blocked = blocked
+        return queued
+
+    def _flush(self):
+        # swapping buffers is the only thing done while holding the lock
+        self.lock.acquire()
+        n = self.fill
+        self.buffer, self.send_buffer = self.send_buffer, self.buffer
+        self.fill = 0
+        self.lock.release()
+
+        if n == 0:
+            return
+
+        t0 = time.time()
+        view = memoryview(self.send_buffer)
+        sent = 0
+        while sent < n:
+            sent += self.conn.send(view[sent:n])
+
+        latency = time.time() - t0
+        self.last_flush_latency = latency
+        if latency > self.max_flush_latency:
+            self.max_flush_latency = latency
+        self.sent_bytes += n
+        self.flushes += 1
+
+        # send() only takes long once the socket buffer is full, so this approaches the link rate when it matters
+        rate = n / max(latency, 0.001)
+        self.link_rate = rate if self.link_rate is None else 0.8 * self.link_rate + 0.2 * rate
+
+    def _adapt(self, interval):
+        # bytes/s the series would need without decimation
+        offered = self.series_bytes * self.decimation / interval
+        self.series_bytes = 0
+        if self.link_rate is None:
+            return
+
+        budget = 0.8 * self.link_rate
+        decimation = 1
+        if offered > budget:
+            decimation = int(offered / budget) + 1
+        # the buffer filling up means the estimate is too optimistic
+        if self.fill > self.series_limit // 2:
+            decimation = max(decimation, 2 * self.decimation)
+        self.decimation = min(decimation, MAX_DECIMATION)
+
+    def _loop(self):
+        last_flush = time.time()
+        last_adapt = last_flush
+        last_report = last_flush
+        try:
+            while self.running:
+                time.sleep(self.poll_period)
+                t = time.time()
+                if self.fill >= self.flush_bytes or (self.fill > 0 and t - last_flush >= self.flush_period):
+                    self._flush()
+                    last_flush = t
+                if t - last_adapt >= self.adapt_period:
+                    self._adapt(t - last_adapt)
+                    last_adapt = t
+                if self.on_report is not None and t - last_report >= self.report_period:
+                    # right after a flush, so the report never has to wait for space
+                    # (this thread is the one freeing it)
+                    self._flush()
+                    self.on_report()
+                    last_report = t
+            self._flush()
+        except Exception as error:
+            # e.g. the server closed the connection: append() drops from now on instead of waiting
+            self.error = error
+            self.failed = True
+            print("BatchedSender: sending failed, " + str(error))
+        finally:
+            self.stopped = True
+
+    def stats(self):
+        return {
+            'queued_bytes': self.fill,
+            'sent_bytes': self.sent_bytes,
+            'dropped_bytes': self.dropped_bytes,
+            'flushes': self.flushes,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.max_flush_latency,
+            'max_blocked': self.max_blocked,
+            'link_rate': self.link_rate,
+            'decimation': self.decimation,
+            'failed': self.failed,
+        }
+
+    def close(self):
+        """
+        sends everything that is still queued and stops the sender thread
+        """
+        self.running = False
+        while not self.stopped:
+            time.sleep(self.poll_period)
+
+
+class SeriesCounter:
+
+    def __init__(self, first_name):
+        """
+        decimation state and gap counts of one logged series, reported to the server as
+        <prefix>-gap-time, <prefix>-dropped, <prefix>-decimated, <prefix>-decimation.
+        The prefix is the first parameter name of the series without "-time" ("lf" for lf-time, lf-e, ...),
+        so every series has its own reports, also series with the same first part (cs-time, ... and cs-v).
+        """
+        prefix = first_name[:-len("-time")] if first_name.endswith("-time") else first_name
+        self.report_names = [prefix + "-gap-time", prefix + "-dropped", prefix + "-decimated", prefix + "-decimation"]
+        self.count = 0
+        self.dropped = 0
+        self.decimated = 0
+        self.reported = None
+
+    def keep(self, decimation):
+        self.count += 1
+        if self.count >= decimation:
+            self.count = 0
+            return True
+        self.decimated += 1
+        return False
+
+
 # NETWORK IO HANDLER ---------------------------------------------------------------------------
 
 class NetworkIOHandler(IOHandler):
 
-    def __init__(self, host=HOST, port=PORT):
+    def __init__(self, host=HOST, port=PORT, batched=False, flush_period=0.05, flush_bytes=2048, buffer_size=16384):
+        """
+        Waits for the server to connect and sends all logged data over TCP.
+        With batched=True, print() messages are never dropped, while log_param(s) series are
+        decimated / dropped when the link is too slow (see BatchedSender).
+
+        :param host: IP of the EV3
+        :param port: port the server connects to
+        :param batched: queue data and send it from a BatchedSender thread instead of sending inline
+        :param flush_period: see BatchedSender
+        :param flush_bytes: see BatchedSender
+        :param buffer_size: see BatchedSender
+        """
         super().__init__()
 
         # networking
         self.host = host
         self.port = port
+        self.sender = None
+        self.series = {}
 
         ev3 = EV3Brick()
         try:
@@ -71,25 +320,417 @@ class NetworkIOHandler(IOHandler):
             ev3.speaker.say("connection failed")
             raise Exception("ColorSensorLogger_NetworkConnection: Connection to host failed")
 
+        if batched:
+            self.sender = BatchedSender(self.conn, buffer_size=buffer_size, flush_period=flush_period,
+                                        flush_bytes=flush_bytes)
+            self.sender.on_report = self._report_gaps
+
+    def _send(self, data, priority=PRIORITY_SERIES):
+        if self.sender is not None:
+            return self.sender.append(data, priority)
+        self.conn.send(data)
+        return True
+
+    def _send_params(self, param_names, values, priority):
+        string = "$".join([";".join([name for name in param_names]), ";".join([str(val) for val in values])]) + '\n'
+        data = string.encode('ascii')
+        return self._send(data, priority)
+
+    def _log_params(self, param_names, values, priority):
+        if self.sender is None:
+            self._send_params(param_names, values, priority)
+            return
+
+        series = None
+        if priority == PRIORITY_SERIES:
+            series = self.series.get(param_names[0])
+            if series is None:
+                series = SeriesCounter(param_names[0])
+                self.series[param_names[0]] = series
+            if not series.keep(self.sender.decimation):
+                return
+
+        if not self._send_params(param_names, values, priority) and series is not None:
+            series.dropped += 1
+
+    def _report_gaps(self):
+        for series in list(self.series.values()):
+            state = (series.dropped, series.decimated, self.sender.decimation)
+            if state == series.reported:
+                continue
+            series.reported = state
+            self._log_params(series.report_names, [time.time(), state[0], state[1], state[2]], PRIORITY_EVENT)
+
     def print(self, message):
         string = "console$" + str(message) + "\n"
         data = string.encode('ascii')
-        self.conn.send(data)
+        self._send(data, PRIORITY_EVENT)
 
     def log_param(self, param_name, value):
-        string = "$".join([param_name, str(value)]) + '\n'
-        data = string.encode('ascii')
-        self.conn.send(data)
+        self._log_params((param_name,), (value,), PRIORITY_SERIES)
 
     def log_params(self, param_names, values):
-        string = "$".join([";".join([name for name in param_names]), ";".join([str(val) for val in values])]) + '\n'
-        data = string.encode('ascii')
-        self.conn.send(data)
+        self._log_params(param_names, values, PRIORITY_SERIES)
 
     def __del__(self):
+        if self.sender is not None:
+            self.sender.close()
         self.conn.close()
 
 
+class BinaryNetworkIOHandler(NetworkIOHandler):
+
+    def __init__(self, host=HOST, port=PORT, batched=False, flush_period=0.05, flush_bytes=2048, buffer_size=16384):
+        """
+        NetworkIOHandler that sends length prefixed binary frames (see codec.py) instead of text lines.
+        Parameter names are only sent once per stream, values are struct packed.
+        The server has to be started with binary=True.
+        """
+        self.encoder = codec.Encoder()
+
+        # the sensor thread, the distance thread and the state loop all log, a schema frame
+        # must never be overtaken by a record of its stream
+        self.lock = _thread.allocate_lock()
+
+        super().__init__(host=host, port=port, batched=batched, flush_period=flush_period, flush_bytes=flush_bytes,
+                         buffer_size=buffer_size)
+
+    def declare(self, param_names, types):
+        """
+        optional: fixes the struct types of a stream before its first record is logged
+
+        :param param_names: list of parameter names
+        :param types: struct type characters, one per parameter (e.g. "dffff")
+        """
+        self.lock.acquire()
+        data = self.encoder.declare(param_names, types)
+        if len(data) > 0:
+            self._send(data, PRIORITY_EVENT)
+        self.lock.release()
+
+    def print(self, message):
+        self.lock.acquire()
+        self._send(self.encoder.encode_console(message), PRIORITY_EVENT)
+        self.lock.release()
+
+    def _send_params(self, param_names, values, priority):
+        self.lock.acquire()
+        stream_count = len(self.encoder.streams)
+        data = self.encoder.encode_record(param_names, values)
+        # a dropped schema frame would make the whole stream unreadable
+        if len(self.encoder.streams) != stream_count:
+            priority = PRIORITY_EVENT
+        queued = self._send(data, priority)
+        self.lock.release()
+        return queued
+
+
+# RESUMABLE NETWORK IO HANDLER ---------------------------------------------------------------------------
+
+
+class ResumableNetworkIOHandler(IOHandler):
+
+    def __init__(self, host=HOST, port=PORT, retransmit_period=10.0, ring_size=4096, flush_period=0.05,
+                 heartbeat_period=1.0):
+        """
+        Binary IO handler (see codec.py) that survives Wi-Fi drops, used with Server2.ResumingRobotServer.
+        Every record and console message gets a sequence number and is kept in a ring buffer for
+        retransmit_period seconds (at most ring_size entries). The ring is also the send queue:
+        a background thread sends new entries every flush_period seconds.
+        Connections are accepted in the background, so the program doesn't wait for the server.
+        A (re)connecting server first sends the sequence number it needs next, everything from there on is sent again.
+
+        :param host: IP of the EV3
+        :param port: port the server connects to
+        :param retransmit_period: how long in seconds entries can be sent again
+        :param ring_size: max number of entries in the ring buffer
+        :param flush_period: time in seconds between two sends
+        :param heartbeat_period: a sequence frame is sent after this many seconds without data, so the server
+                                 can tell an idle robot from a dead connection
+        """
+        super().__init__()
+
+        self.host = host
+        self.port = port
+        self.retransmit_period = retransmit_period
+        self.ring_size = ring_size
+        self.flush_period = flush_period
+        self.heartbeat_period = heartbeat_period
+
+        self.encoder = codec.Encoder()
+        self.ring = [None for _ in range(ring_size)]
+        self.ring_times = [0.0 for _ in range(ring_size)]
+        self.next_seq = 0
+        self.sent_seq = 0
+        self.lock = _thread.allocate_lock()
+
+        # counters
+        self.connects = 0
+        self.resent = 0
+        self.lost = 0
+
+        self.conn = None
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(1)
+        # accept() doubles as the wait between two sends
+        self.sock.settimeout(flush_period)
+
+        self.running = True
+        _thread.start_new_thread(self._loop, ())
+
+    def _append(self, data):
+        # caller holds the lock
+        slot = self.next_seq % self.ring_size
+        self.ring[slot] = data
+        self.ring_times[slot] = time.time()
+        self.next_seq += 1
+
+    def print(self, message):
+        data = codec.frame(codec.KIND_CONSOLE, 0, str(message).encode('utf-8'))
+        self.lock.acquire()
+        self._append(data)
+        self.lock.release()
+
+    def log_param(self, param_name, value):
+        self.log_params((param_name,), (value,))
+
+    def log_params(self, param_names, values):
+        self.lock.acquire()
+        stream_count = len(self.encoder.streams)
+        stream = self.encoder.stream(param_names)
+        data = self.encoder.pack_record(stream, values)
+        if len(self.encoder.streams) != stream_count:
+            # schema and first record share one sequence number, so the schema is resent with it
+            data = stream[3] + data
+        self._append(data)
+        self.lock.release()
+
+    def _oldest(self):
+        # oldest sequence number that can still be sent, caller holds the lock
+        oldest = max(0, self.next_seq - self.ring_size)
+        t_min = time.time() - self.retransmit_period
+        while oldest < self.next_seq and self.ring_times[oldest % self.ring_size] < t_min:
+            oldest += 1
+        return oldest
+
+    def _send_all(self, conn, data):
+        view = memoryview(data)
+        sent = 0
+        while sent < len(data):
+            sent += conn.send(view[sent:])
+
+    def _accept(self):
+        conn, addr = self.sock.accept()
+        # a reconnecting server replaces the current connection, which may be dead without having noticed yet
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        try:
+            conn.settimeout(5)
+            request = b""
+            while len(request) < codec.RESUME_SIZE:
+                chunk = conn.recv(codec.RESUME_SIZE - len(request))
+                if len(chunk) == 0:
+                    raise OSError("connection closed")
+                request += chunk
+            seq = codec.parse_resume_request(request)
+
+            self.lock.acquire()
+            oldest = self._oldest()
+            if seq < oldest:
+                self.lost += oldest - seq
+                seq = oldest
+            elif seq > self.next_seq:
+                # the server knows more records than this program run produced: the robot was restarted
+                seq = oldest
+            self.resent += self.next_seq - seq
+            self.sent_seq = seq
+            header = codec.MAGIC + self.encoder.schema_frames()
+            self.lock.release()
+
+            self._send_all(conn, header)
+            self.conn = conn
+            self.connects += 1
+        except Exception:
+            conn.close()
+
+    def _send_pending(self, last_send):
+        self.lock.acquire()
+        start = self.sent_seq
+        end = self.next_seq
+        if end - start > self.ring_size:
+            # overwritten before it could be sent
+            self.lost += end - self.ring_size - start
+            start = end - self.ring_size
+        frames = [self.ring[seq % self.ring_size] for seq in range(start, end)]
+        self.lock.release()
+
+        t = time.time()
+        if len(frames) == 0 and t - last_send < self.heartbeat_period:
+            return last_send
+
+        self._send_all(self.conn, codec.seq_frame(start) + b"".join(frames))
+        self.sent_seq = end
+        return t
+
+    def _loop(self):
+        last_send = time.time()
+        while self.running:
+            try:
+                self._accept()
+            except OSError:
+                pass
+
+            if self.conn is not None:
+                try:
+                    last_send = self._send_pending(last_send)
+                except OSError:
+                    self.conn.close()
+                    self.conn = None
+
+    def stats(self):
+        return {
+            'next_seq': self.next_seq,
+            'sent_seq': self.sent_seq,
+            'connected': self.conn is not None,
+            'connects': self.connects,
+            'resent': self.resent,
+            'lost': self.lost,
+        }
+
+    def __del__(self):
+        self.running = False
+        if self.conn is not None:
+            self.conn.close()
+        self.sock.close()
+
+
+# DATAGRAM IO HANDLER ---------------------------------------------------------------------------
+
+
+class DatagramBatch:
+
+    def __init__(self, stream_id, schema_frame, size):
+        """
+        datagram of one stream that is being filled, see codec.py for the layout
+        """
+        self.stream_id = stream_id
+        self.schema_frame = schema_frame
+        self.buffer = bytearray(size)
+        self.seq = 0
+        self.fill = 0
+        self.reset()
+
+    def reset(self):
+        header = struct.pack(codec.DATAGRAM_HEADER_FORMAT, self.stream_id, self.seq) + self.schema_frame
+        self.buffer[0:len(header)] = header
+        self.header_size = len(header)
+        self.fill = len(header)
+
+    def empty(self):
+        return self.fill == self.header_size
+
+
+class DatagramIOHandler(IOHandler):
+
+    def __init__(self, host=HOST, port=PORT, target=None, flush_period=0.05, max_datagram=codec.MAX_DATAGRAM):
+        """
+        Sends binary records (see codec.py) as UDP datagrams. Nothing waits for the server:
+        the program starts immediately and records logged while no server is known are discarded.
+        The server announces itself by sending codec.HELLO to host:port, the robot then sends to its address.
+        Every stream gets its own datagrams with their own sequence numbers, so the server can count lost
+        and reordered datagrams per stream.
+
+        :param host: IP of the EV3
+        :param port: port the server sends its hello to
+        :param target: optional (ip, port) of the server, if it is known in advance
+        :param flush_period: max time in seconds a record waits before its datagram is sent
+        :param max_datagram: max datagram size in bytes
+        """
+        super().__init__()
+
+        self.host = host
+        self.port = port
+        self.target = target
+        self.flush_period = flush_period
+        self.max_datagram = max_datagram
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.host, self.port))
+        self.sock.settimeout(flush_period)
+
+        self.encoder = codec.Encoder()
+        self.batches = {0: DatagramBatch(0, b"", max_datagram)}
+        self.lock = _thread.allocate_lock()
+
+        # counters
+        self.sent_datagrams = 0
+        self.discarded_records = 0
+
+        self.running = True
+        _thread.start_new_thread(self._loop, ())
+
+    def _send_batch(self, batch):
+        if self.target is not None:
+            try:
+                self.sock.sendto(memoryview(batch.buffer)[:batch.fill], self.target)
+                self.sent_datagrams += 1
+            except OSError:
+                pass
+        batch.seq += 1
+        batch.reset()
+
+    def _add(self, batch, data):
+        if self.target is None:
+            self.discarded_records += 1
+            return
+        n = len(data)
+        if batch.fill + n > self.max_datagram:
+            self._send_batch(batch)
+        batch.buffer[batch.fill:batch.fill + n] = data
+        batch.fill += n
+
+    def print(self, message):
+        self.lock.acquire()
+        data = codec.frame(codec.KIND_CONSOLE, 0, str(message).encode('utf-8')[:self.max_datagram - 16])
+        self._add(self.batches[0], data)
+        self.lock.release()
+
+    def log_param(self, param_name, value):
+        self.log_params((param_name,), (value,))
+
+    def log_params(self, param_names, values):
+        self.lock.acquire()
+        stream = self.encoder.stream(param_names)
+        batch = self.batches.get(stream[0])
+        if batch is None:
+            batch = DatagramBatch(stream[0], stream[3], self.max_datagram)
+            self.batches[stream[0]] = batch
+        self._add(batch, self.encoder.pack_record(stream, values))
+        self.lock.release()
+
+    def _loop(self):
+        while self.running:
+            # waiting for a hello also paces the flushes
+            try:
+                data, addr = self.sock.recvfrom(64)
+                if data == codec.HELLO:
+                    self.target = addr
+            except OSError:
+                pass
+
+            self.lock.acquire()
+            for batch in self.batches.values():
+                if not batch.empty():
+                    self._send_batch(batch)
+            self.lock.release()
+
+    def __del__(self):
+        self.running = False
+        self.sock.close()
+
+
 # FILE IO HANDLER ---------------------------------------------------------------------------
 
 
@@ -133,3 +774,187 @@ class FileIOHandler(IOHandler):
     def __del__(self):
         for file in self.files.values():
             file.close()
+
+
+# BINARY FILE IO HANDLER ---------------------------------------------------------------------------
+
+
+class BinaryFileIOHandler(IOHandler):
+
+    def __init__(self, path, file_size=16777216, block_size=4096, flush_blocks=8, buffer_size=65536,
+                 flush_period=0.5, poll_period=0.01):
+        """
+        Records everything into one file of binary frames (see codec.py), for full rate logging without a server.
+        Records of a stream are fixed size, all streams are interleaved in the order they are logged.
+        Logging only copies the frame into a RAM buffer, a background thread writes whole blocks of block_size
+        bytes at block aligned offsets. The file is filled with zeros when the handler is created, so the SD card
+        doesn't have to allocate while logging; behind the data there are only zeros (codec.KIND_END).
+        Records that don't fit into the buffer or the file are dropped and counted, console messages and
+        schema frames wait for space. Converted on the PC with roboserver_v2/src/binlog.py.
+
+        :param path: path of the log file, an existing file is overwritten
+        :param file_size: size of the preallocated file in bytes, logging stops when it is full
+        :param block_size: size of the blocks written to the file
+        :param flush_blocks: number of full blocks that triggers a write before flush_period is over
+        :param buffer_size: size of the RAM buffer in bytes
+        :param flush_period: max time in seconds full blocks wait in the buffer
+        :param poll_period: how often the writer thread looks at the buffer
+        """
+        super().__init__()
+
+        self.path = path
+        self.block_size = block_size
+        self.file_size = file_size // block_size * block_size
+        self.flush_bytes = flush_blocks * block_size
+        self.buffer_size = buffer_size
+        self.flush_period = flush_period
+        self.poll_period = poll_period
+
+        self.file = open(path, 'wb+')
+        zeros = bytearray(block_size)
+        for i in range(self.file_size // block_size):
+            self.file.write(zeros)
+        self.file.flush()
+        self.file.seek(0)
+
+        self.encoder = codec.Encoder()
+        # double buffering: log calls write into self.buffer while the thread writes self.write_buffer
+        self.buffer = bytearray(buffer_size)
+        self.write_buffer = bytearray(buffer_size)
+        self.fill = 0
+        # file offset of self.buffer[0]
+        self.offset = 0
+        self.lock = _thread.allocate_lock()
+
+        # counters
+        self.written_bytes = 0
+        self.dropped_records = 0
+        self.flushes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.max_blocked = 0.0
+
+        self.running = True
+        self.stopped = False
+        # set when writing the file failed, see _loop
+        self.failed = False
+        self.error = None
+        _thread.start_new_thread(self._loop, ())
+
+    def _append(self, data, wait):
+        # caller holds the lock, returns with the lock held
+        n = len(data)
+        if self.failed:
+            # nothing writes the buffer any more
+            self.dropped_records += 1
+            return False
+        t0 = time.time()
+        while self.fill + n > self.buffer_size or self.offset + self.fill + n > self.file_size:
+            # no waiting for space once the writer thread has stopped, it would never come
+            if self.stopped or not wait or self.offset + self.fill + n > self.file_size or n > self.buffer_size:
+                self.dropped_records += 1
+                return False
+            self.lock.release()
+            time.sleep(self.poll_period)
+            self.lock.acquire()
+        self.buffer[self.fill:self.fill + n] = data
+        self.fill += n
+        blocked = time.time() - t0
+        if blocked > self.max_blocked:
+            self.max_blocked = blocked
+        return True
+
+    def print(self, message):
+        self.lock.acquire()
+        self._append(self.encoder.encode_console(message), True)
+        self.lock.release()
+
+    def log_param(self, param_name, value):
+        self.log_params((param_name,), (value,))
+
+    def log_params(self, param_names, values):
+        self.lock.acquire()
+        stream_count = len(self.encoder.streams)
+        data = self.encoder.encode_record(param_names, values)
+        # a dropped schema frame would make the whole stream unreadable
+        self._append(data, len(self.encoder.streams) != stream_count)
+        self.lock.release()
+
+    def _flush(self, final=False):
+        self.lock.acquire()
+        n = self.fill
+        if not final:
+            # only whole blocks, the rest stays in the buffer
+            n = n // self.block_size * self.block_size
+        if n == 0:
+            self.lock.release()
+            return
+        rest = self.fill - n
+        self.buffer, self.write_buffer = self.write_buffer, self.buffer
+        self.buffer[0:rest] = self.write_buffer[n:n + rest]
+        self.fill = rest
+        offset = self.offset
+        self.offset += n
+        self.lock.release()
+
+        t0 = time.time()
+        self.file.seek(offset)
+        self.file.write(memoryview(self.write_buffer)[:n])
+        self.file.flush()
+        latency = time.time() - t0
+        self.last_flush_latency = latency
+        if latency > self.max_flush_latency:
+            self.max_flush_latency = latency
+        self.written_bytes += n
+        self.flushes += 1
+
+    def _loop(self):
+        last_flush = time.time()
+        try:
+            while self.running:
+                time.sleep(self.poll_period)
+                t = time.time()
+                if self.fill >= self.flush_bytes or \
+                        (self.fill >= self.block_size and t - last_flush >= self.flush_period):
+                    self._flush()
+                    last_flush = t
+            self._flush(True)
+        except Exception as error:
+            # e.g. the SD card is full or was removed: logging drops from now on instead of waiting
+            self.error = error
+            self.failed = True
+            print("BinaryFileIOHandler: writing failed, " + str(error))
+        finally:
+            try:
+                self.file.close()
+            except Exception:
+                # after a failed write the file object still holds the bytes it couldn't write
+                pass
+            # close() waits for this
+            self.stopped = True
+
+    def stats(self):
+        return {
+            'buffered_bytes': self.fill,
+            'written_bytes': self.written_bytes,
+            'free_bytes': self.file_size - self.offset - self.fill,
+            'dropped_records': self.dropped_records,
+            'flushes': self.flushes,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.max_flush_latency,
+            'max_blocked': self.max_blocked,
+            'failed': self.failed,
+        }
+
+    def close(self):
+        """
+        writes everything that is still buffered and closes the file
+        """
+        if not self.running:
+            return
+        self.running = False
+        while not self.stopped:
+            time.sleep(self.poll_period)
+
+    def __del__(self):
+        self.close()
@@ -24,6 +24,11 @@ PORT = 65433
 # INPUT + OUTPUT
 import dataio
 # IO_HANDLER = dataio.NetworkIOHandler(host=HOST, port=PORT)
+# IO_HANDLER = dataio.BinaryNetworkIOHandler(host=HOST, port=PORT)
+# IO_HANDLER = dataio.BinaryNetworkIOHandler(host=HOST, port=PORT, batched=True)
+# IO_HANDLER = dataio.DatagramIOHandler(host=HOST, port=PORT)
+# IO_HANDLER = dataio.ResumableNetworkIOHandler(host=HOST, port=PORT)
+# IO_HANDLER = dataio.BinaryFileIOHandler("/home/robot/robot.log")  # offline, convert with binlog.py
 IO_HANDLER = dataio.DummyIOHandler()
 
 
@@ -238,6 +238,8 @@ class LineFollowing(State):
     LEFT = 0
     RIGHT = 1
 
+    LOG_NAMES = ["lf-time", "lf-e", "lf-i", "lf-d", "lf-u"]
+
     def __init__(self, n, Kp, Ki, Kd, side, log_every_nth=None):
         """
         PID line follower
@@ -374,7 +376,7 @@ class LineFollowing(State):
             self.log_i += 1
             if self.log_i > self.log_every_nth:
                 self.log_i = 0
-                IO_HANDLER.log_params(param_names=["lf-time", "lf-e", "lf-i", "lf-d", "lf-u"],
+                IO_HANDLER.log_params(param_names=LineFollowing.LOG_NAMES,
                                        values=[time.time(), error, integral, derivative, u])
                 # IO_HANDLER.log_param(param_name="lf-time", value=time.time())
 
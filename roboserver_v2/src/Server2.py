@@ -1,11 +1,21 @@
-import collections
-import math
-import shutil
 import socket
 import os
 import threading
 import time
-import function
+
+import align
+import archive
+import batchparse
+import catalog
+import codec
+import datagram
+import filewriter
+import liveplot
+import lod
+import parsecache
+import ringbuffer
+import runstore
+import timeslice
 
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
@@ -21,91 +31,401 @@ FIRST_PORT = 65433  # Port to listen on (non-privileged ports are > 1023)
 
 class RobotServer:
 
-    def __init__(self, host, port, data_root=DATA_ROOT, listeners=None, print_params=False):
+    # bytes read from the socket at once
+    READ_SIZE = 65536
+
+    def __init__(self, host, port, data_root=DATA_ROOT, listeners=None, print_params=False, binary=False, start=True,
+                 columnar=False, flush_policy=None, robot_build=None, retention=None):
+        """
+        :param data_root: run catalog directory, every RobotServer writes to its own new run (see catalog.RunCatalog)
+        :param robot_build: version / name of the robot program, stored in the catalog index
+        :param retention: catalog.RetentionPolicy for the old runs of the catalog, None keeps all
+        """
 
         # connection params
         self.host: str = host
         self.port: int = port
-
-        # save to file params
-        self.data_root = data_root
-        if os.path.exists(self.data_root):
-            shutil.rmtree(self.data_root)
-        os.makedirs(self.data_root, exist_ok=False)
-        self.files = {
-            'console': open(os.path.join(self.data_root, 'console.txt'), 'w+')
-        }
-        self.file_keys = []
+        self.binary: bool = binary  # robot uses dataio.BinaryNetworkIOHandler
+
+        # save to file params: a new run directory, older runs are kept (or pruned in the background)
+        self.catalog = catalog.RunCatalog(data_root, retention)
+        self.run_id, self.data_root = self.catalog.new_run(robot_build, info={
+            'host': host, 'port': port, 'binary': binary, 'columnar': columnar})
+        self.files = {}
+        # number of received values per parameter, stored in the catalog index when the run ends
+        self.samples = {}
+        # files are written by a writer thread, so a slow disk doesn't slow down receiving (see filewriter.FlushPolicy)
+        self.writer = filewriter.FileWriter(flush_policy)
+        # columnar=True: values go to float64 column files of a runstore.RunStore instead of one text line each,
+        # console messages are still written as text
+        self.store = runstore.RunStore(self.data_root) if columnar else None
+        # set by finish
+        self.finished = False
 
         if listeners is None:
             listeners = {}
         self.listeners = listeners
         self.listeners['console'] = [lambda value: print(value)]
+        # array listeners get all values of a parameter that arrived in one read as float64 array (text mode)
+        self.array_listeners = {}
+        self._open_file('console')
+
 
+        # start=False: only used as file / listener sink, e.g. by ingest.IngestServer
+        if not start:
+            return
 
         # server init
+        self.connect()
+
+        # starting
+        self.thread = threading.Thread(target=self.receive)
+        self.thread.start()
+
+    def connect(self):
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             print("connecting")
             self.sock.connect((self.host, self.port))
             self.sock.settimeout(20)
-            self.sockFile = self.sock.makefile()
             print("connected")
 
         except:
             raise Exception("ColorSensorLogger_NetworkConnection: Establishing connection to host failed")
 
-        # starting
-        self.thread = threading.Thread(target=self.receive_data)
-        self.thread.start()
+    def receive(self):
+        try:
+            if self.binary:
+                self.receive_binary_data()
+            else:
+                self.receive_data()
+        finally:
+            # also after a connection error, the writer thread is a daemon and would lose the buffered values
+            self.finish()
+
+    def finish(self):
+        """
+        writes the buffered values to disk and ends the run in the catalog, only the first call does anything
+        """
+        if self.finished:
+            return
+        self.finished = True
+        if self.store is not None:
+            self.store.close()
+        self.writer.close()
+        self.catalog.finish_run(self.run_id, self.samples)
+        # level of detail pyramids for LodFilePlot
+        lod.build_in_background(self.data_root, list(self.samples.keys()))
 
     def add_listener(self, param_name, func):
         if param_name not in self.listeners.keys():
             self.listeners[param_name] = []
         self.listeners[param_name].append(func)
 
+    def add_array_listener(self, param_name, func):
+        if param_name not in self.array_listeners.keys():
+            self.array_listeners[param_name] = []
+        self.array_listeners[param_name].append(func)
+
+    def _open_file(self, name):
+        self.files[name] = self.writer.open(os.path.join(self.data_root, name + '.txt'), 'wb+', event=name == 'console')
+        if name not in self.listeners.keys():
+            self.listeners[name] = []
+        return self.files[name]
+
     def receive_data(self):
+        # one reusable buffer, the socket writes straight into it
+        buffer = bytearray(self.READ_SIZE)
+        view = memoryview(buffer)
+        fill = 0
 
-        #try:
         while True:
-            string = self.sockFile.readline().rstrip()
-            # print(string)
-            if len(string) == 0:
-                continue
-            _names, _values = string.split("$")
-            names = _names.split(";")
-            values = _values.split(";")
+            if fill == len(buffer):
+                # a single line longer than the buffer
+                view.release()
+                buffer.extend(bytearray(len(buffer)))
+                view = memoryview(buffer)
+
+            n = self.sock.recv_into(view[fill:])
+            if n == 0:
+                break
+            fill += n
 
-            for i in range(len(names)):
-                name = names[i]
-                value = values[i]
+            end = buffer.rfind(b"\n", 0, fill)
+            if end == -1:
+                continue
 
+            # all complete lines of this read are parsed together, the incomplete rest moves to the front
+            self.handle_lines(bytes(view[:end]))
+            rest = fill - end - 1
+            view[:rest] = bytes(view[end + 1:fill])
+            fill = rest
+
+    def handle_lines(self, chunk):
+        """
+        saves and dispatches a block of complete "name;name$value;value" lines in one pass.
+        Lines are grouped by their names, the values of a group are split at once and written to file
+        with one write per parameter. Listeners get the values as bytes (float() accepts them).
+
+        :param chunk: bytes containing complete lines
+        """
+        groups = {}
+        for line in chunk.split(b"\n"):
+            _names, sep, _values = line.rstrip().partition(b"$")
+            if len(sep) == 0:
+                continue
+            if _names == b"console":
+                self.handle_values(codec.CONSOLE_NAMES, (_values.decode('utf-8'),))
+                continue
+            group = groups.get(_names)
+            if group is None:
+                group = []
+                groups[_names] = group
+            group.append(_values)
+
+        for _names, rows in groups.items():
+            names = _names.decode('ascii').split(";")
+            k = len(names)
+            # every line is checked, a line with a value too many and one with a value too few would give
+            # the right total but shift all later values of the group
+            if not all(row.count(b";") == k - 1 for row in rows):
+                # lines with a wrong number of values, fall back to one line at a time
+                for row in rows:
+                    row_values = row.split(b";")
+                    if len(row_values) == k:
+                        self.handle_values(names, row_values)
+                continue
+            values = b";".join(rows).split(b";")
+
+            columns = []
+            for j in range(k):
+                name = names[j]
+                self.samples[name] = self.samples.get(name, 0) + len(rows)
+                if name not in self.listeners:
+                    self.listeners[name] = []
+                column = values[j::k]
+                if self.store is None:
+                    file = self.files.get(name)
+                    if file is None:
+                        file = self._open_file(name)
+                    file.write(b"\n".join(column) + b"\n")
+
+                if self.store is not None or name in self.array_listeners:
+                    # 'E' placeholders and other broken values become NaN instead of stopping the thread
+                    array, _valid = batchparse.to_float64(np.array(column))
+                    columns.append(array)
+                    for listener in self.array_listeners.get(name, []):
+                        listener(array)
+
+            if self.store is not None:
+                self.store.extend(names, columns)
+            else:
+                self.writer.end_record(len(rows))
+
+            # listeners are called row by row, so x / y pairs of LiveSubPlot stay together
+            for i in range(len(rows)):
+                for j in range(k):
+                    for listener in self.listeners[names[j]]:
+                        listener(values[i * k + j])
+
+    def receive_binary_data(self):
+        decoder = codec.Decoder()
+        buffer = bytearray(self.READ_SIZE)
+        view = memoryview(buffer)
+        while True:
+            n = self.sock.recv_into(buffer)
+            if n == 0:
+                break
+            for names, values in decoder.feed(view[:n]):
+                self.handle_values(names, values)
+
+    def handle_values(self, names, values):
+        """
+        saves received values to file and passes them to the listeners
+
+        :param names: parameter names
+        :param values: values in the same order, as str / bytes (text mode) or numbers (binary mode)
+        """
+        columnar = self.store is not None and names != codec.CONSOLE_NAMES
+        if columnar:
+            self.store.append(names, values)
+
+        for i in range(len(names)):
+            name = names[i]
+            value = values[i]
+            self.samples[name] = self.samples.get(name, 0) + 1
+
+            if columnar:
+                if name not in self.listeners:
+                    self.listeners[name] = []
+            else:
                 # add parameter if name not seen yet
-                if name not in self.file_keys:
-                    self.files[name] = open(os.path.join(self.data_root, name+'.txt'), 'w+')
-                    self.file_keys.append(name)
-
-                    if name not in self.listeners.keys():
-                        self.listeners[name] = []
+                file = self.files.get(name)
+                if file is None:
+                    file = self._open_file(name)
 
                 # save to file
-                self.files[name].write(value)
-                self.files[name].write("\n")
-                self.files[name].flush()
+                file.write((value if isinstance(value, bytes) else str(value).encode('utf-8')) + b"\n")
+
+            # call listeners
+            for listener in self.listeners[name]:
+                # print(f"listeners: {self.listeners[name]}")
+                # print(f"listener")
+                listener(value)
+
+        if not columnar:
+            self.writer.end_record()
+
+    def handle_columns(self, names, columns):
+        """
+        saves a block of records of one stream and passes them to the listeners, the sink of ingest.IngestServer
+
+        :param names: parameter names
+        :param columns: float64 array with the values of the block for every parameter, console messages are
+                        a list of str
+        """
+        if names == codec.CONSOLE_NAMES:
+            for message in columns[0]:
+                self.handle_values(names, (message,))
+            return
+        count = len(columns[0])
+        if count == 0:
+            return
+
+        for j in range(len(names)):
+            name = names[j]
+            self.samples[name] = self.samples.get(name, 0) + count
+            if name not in self.listeners:
+                self.listeners[name] = []
+            if self.store is None:
+                file = self.files.get(name)
+                if file is None:
+                    file = self._open_file(name)
+                file.write(("\n".join(map(str, columns[j].tolist())) + "\n").encode('ascii'))
+            for listener in self.array_listeners.get(name, []):
+                listener(columns[j])
+
+        if self.store is not None:
+            self.store.extend(names, columns)
+        else:
+            self.writer.end_record(count)
+
+        # listeners are called row by row, so x / y pairs of LiveSubPlot stay together
+        if any(len(self.listeners[name]) > 0 for name in names):
+            for row in np.column_stack(columns).tolist():
+                for j in range(len(names)):
+                    for listener in self.listeners[names[j]]:
+                        listener(row[j])
+
+    def write_stats(self):
+        """
+        :return: queue depth, flush latency, ... of the writer thread, see filewriter.FileWriter.stats
+        """
+        return self.writer.stats()
+
+
+class DatagramRobotServer(RobotServer):
+
+    def __init__(self, host, port, data_root=DATA_ROOT, listeners=None, reorder_window=8, max_delay=0.1,
+                 report_period=5.0):
+        """
+        RobotServer for a robot using dataio.DatagramIOHandler. Doesn't block until the robot is up,
+        reorders datagrams and prints loss / reordering statistics per stream every report_period seconds.
+        """
+        self.reorder_window = reorder_window
+        self.max_delay = max_delay
+        self.report_period = report_period
+        super().__init__(host, port, data_root=data_root, listeners=listeners, binary=True)
+
+    def connect(self):
+        self.receiver = datagram.DatagramReceiver(self.host, self.port, self.handle_values,
+                                                  reorder_window=self.reorder_window, max_delay=self.max_delay,
+                                                  report_period=self.report_period)
+
+    def receive(self):
+        try:
+            self.receiver.run()
+        finally:
+            self.finish()
+
+    def stats(self):
+        return self.receiver.stats()
 
-                # call listeners
-                for listener in self.listeners[name]:
-                    # print(f"listeners: {self.listeners[name]}")
-                    # print(f"listener")
-                    listener(value)
 
-        #except:
-        #    raise Exception("ColorSensorLogger_NetworkConnection: Connection to host failed")
+class ResumingRobotServer(RobotServer):
+
+    def __init__(self, host, port, data_root=DATA_ROOT, listeners=None, timeout=5.0, max_backoff=5.0):
+        """
+        RobotServer for a robot using dataio.ResumableNetworkIOHandler. A dropped connection is opened again
+        (with exponential backoff) and the robot resends everything after the last record that was written to file,
+        so the stored run stays complete across short Wi-Fi drops.
+
+        :param timeout: seconds without any data (the robot sends heartbeats) after that the connection is dropped
+        :param max_backoff: max time in seconds between two connection attempts
+        """
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+
+        # sequence number of the next record that is needed, everything before is written to file
+        self.next_seq = 0
+        self.reconnects = 0
+        self.lost = 0
+        self.restarts = 0
+        super().__init__(host, port, data_root=data_root, listeners=listeners, binary=True)
+
+    def connect(self):
+        # connecting is done by the receiving thread, as it has to be repeated
+        pass
+
+    def _open(self):
+        backoff = 0.1
+        while True:
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                sock.sendall(codec.resume_request(self.next_seq))
+                return sock
+            except OSError:
+                time.sleep(backoff)
+                backoff = min(2 * backoff, self.max_backoff)
+
+    def receive(self):
+        try:
+            self._resume()
+        finally:
+            self.finish()
+
+    def _resume(self):
+        while True:
+            self.sock = self._open()
+            print(f"connected, resuming at record {self.next_seq}")
+
+            decoder = codec.Decoder()
+            decoder.seq = self.next_seq
+            try:
+                while True:
+                    data = self.sock.recv(4096)
+                    if len(data) == 0:
+                        break
+                    for names, values in decoder.feed(data):
+                        self.handle_values(names, values)
+                    self.next_seq = decoder.seq
+            except OSError:
+                pass
+
+            self.sock.close()
+            self.reconnects += 1
+            self.lost += decoder.lost
+            self.restarts += decoder.restarts
+            print(f"connection lost after record {self.next_seq}, reconnecting "
+                  f"(records lost so far: {self.lost}, robot restarts: {self.restarts})")
 
 
 class LiveSubPlot:
 
-    def __init__(self, server, x_name, y_name, max_x_diff=None, ylim=None, xlim=None):
+    def __init__(self, server, x_name, y_name, max_x_diff=None, ylim=None, xlim=None, capacity=1 << 16):
+        """
+        :param capacity: max number of samples in the window, see ringbuffer.SharedRingBuffer
+        """
         self.x_name = x_name
         self.y_name = y_name
         self.server = server
@@ -113,71 +433,81 @@ class LiveSubPlot:
         self.ylim = ylim
         self.xlim = xlim
 
-        self.x_deque = collections.deque(np.array([]))
-        self.y_deque = collections.deque(np.array([]))
+        # written by the receiver thread, the plot draws from snapshots of it
+        self.buffer = ringbuffer.SharedRingBuffer(capacity, window=max_x_diff)
 
         self.server.add_listener(self.x_name, self.x_listener)
         self.server.add_listener(self.y_name, self.y_listener)
 
-        self.next_x = None
-        self.next_y = None
+        # last x received: a y value is shown at the last x before it (a streaming as-of join, see align.asof),
+        # which pairs the values of a record (time first) and also works for y of another series or rate
+        self.last_x = None
 
     def x_listener(self, value):
-        self.next_x = (float(value))
-        if self.next_y is not None:
-            self.x_deque.append(self.next_x)
-            self.y_deque.append(self.next_y)
-            self.next_x = None
-            self.next_y = None
-
-        while not len(self.x_deque) == 0 and self.x_deque[-1] - self.x_deque[0] > self.max_x_diff:
-            self.x_deque.popleft()
-            self.y_deque.popleft()
-
-        # print(f"{self.x_name}   x-listener: len(x) = {len(self.x_deque)},  len(y) = {len(self.y_deque)}")
+        self.last_x = runstore.to_float(value)
 
     def y_listener(self, value):
-        self.next_y = (float(value))
-        if self.next_x is not None:
-            self.x_deque.append(self.next_x)
-            self.y_deque.append(self.next_y)
-            self.next_x = None
-            self.next_y = None
+        if self.last_x is None:
+            return
+        self.buffer.append(self.last_x, runstore.to_float(value))
 
-        while not len(self.x_deque) == 0 and self.x_deque[-1] - self.x_deque[0] > self.max_x_diff:
-            self.x_deque.popleft()
-            self.y_deque.popleft()
+        # print(f"{self.x_name}   y-listener: len = {len(self.buffer)}")
 
-        # print(f"{self.x_name}   y-listener: len(x) = {len(self.x_deque)},  len(y) = {len(self.y_deque)}")
+    def snapshot(self):
+        """
+        :return: (x, y) read only copies of the window, see ringbuffer.SharedRingBuffer.snapshot
+        """
+        times, columns = self.buffer.snapshot()
+        return times, columns[0]
 
     @property
     def x_data(self):
-        return self.x_deque
+        return self.snapshot()[0]
 
     @property
     def y_data(self):
-        return self.y_deque
+        return self.snapshot()[1]
 
 
 class LivePlot:
 
-    def __init__(self, subplots, plot_rows, plot_columns):
+    def __init__(self, subplots, plot_rows, plot_columns, blit=True, fps=30):
+        """
+        :param blit: persistent lines that are blitted over a cached background (see liveplot.BlitAnimator),
+                     False to clear and plot every axes each frame
+        :param fps: frames per second of the blitted plot
+        """
         self.subplots = subplots
         self.fig = plt.figure()
         self.axes = []
         self.ani = None
+        self.animator = None
 
         for i in range(len(self.subplots)):
             self.axes.append(self.fig.add_subplot(plot_rows, plot_columns,  i+1))
 
+        if blit:
+            self.animator = liveplot.BlitAnimator(self.fig, 1 / fps)
+            for j in range(len(self.subplots)):
+                subplot = self.subplots[j]
+                self.animator.add(self.axes[j], subplot.snapshot, window=subplot.max_x_diff, xlim=subplot.xlim,
+                                  ylim=subplot.ylim)
+
     def start(self):
+        if self.animator is not None:
+            self.animator.start()
+            return
         self.ani = animation.FuncAnimation(self.fig, self.draw_plot, interval=250)
         plt.show()
 
     def draw_plot(self, i):
         for j in range(len(self.axes)):
+            x, y = self.subplots[j].snapshot()
+            if len(x) > 0:
+                x0, x1 = self.subplots[j].xlim if self.subplots[j].xlim is not None else (x[0], x[-1])
+                x, y = liveplot.decimate(x, y, x0, x1, self.axes[j].bbox.width)
             self.axes[j].clear()
-            self.axes[j].plot(self.subplots[j].x_data, self.subplots[j].y_data)
+            self.axes[j].plot(x, y)
             if self.subplots[j].ylim is not None:
                 self.axes[j].set_ylim(self.subplots[j].ylim)
             if self.subplots[j].xlim is not None:
@@ -186,38 +516,53 @@ class LivePlot:
 
 class FileSubPlot:
 
-    def __init__(self, x_name, y_name, max_x_diff=None, data_root=DATA_ROOT, ylim=None, xlim=None):
+    def __init__(self, x_name, y_name, max_x_diff=None, data_root=DATA_ROOT, ylim=None, xlim=None, t_range=None,
+                 tolerance=None):
+        """
+        :param t_range: (t0, t1) in seconds since the start of the run, only this window is read from the files;
+                        None reads the whole run
+        :param tolerance: if y_name has its own time parameter (e.g. cs-v shown over lf-time), every x gets the last
+                          y value recorded up to tolerance seconds before it (see align.asof), None for no limit
+        """
         self.x_name = x_name
         self.y_name = y_name
-        self.data_root = data_root
+        # a catalog directory shows its newest run
+        self.data_root = catalog.resolve_run(data_root)
+        data_root = self.data_root
         self.max_x_diff = max_x_diff
         self.xlim = xlim
         self.ylim = ylim
 
-        x_path = os.path.join(data_root, x_name+".txt")
-        y_path = os.path.join(data_root, y_name + ".txt")
-
-        x_file = open(x_path, 'r')
-        y_file = open(y_path, 'r')
-
-        self.x_array = []
-        self.y_array = []
+        # y recorded with other time stamps than x (another series or rate) is paired by time, not by line number
+        y_time = align.time_name(y_name)
+        joined = y_time != x_name and has_parameter(data_root, y_time)
+
+        if t_range is not None:
+            self.x_array, ys = timeslice.load_window(data_root, x_name, [] if joined else [y_name], t_range[0],
+                                                     t_range[1], relative=True)
+        else:
+            self.x_array = load_column(data_root, x_name)
+            ys = [] if joined else [load_column(data_root, y_name)]
+
+        if joined:
+            y_t0 = None
+            y_t1 = None
+            if t_range is not None and len(self.x_array) > 0:
+                y_t0 = None if tolerance is None else self.x_array[0] - tolerance
+                y_t1 = self.x_array[-1]
+            y_times, (y_values,) = timeslice.load_window(data_root, y_time, [y_name], y_t0, y_t1)
+            ys = [align.asof(y_times, y_values, self.x_array, tolerance)]
+        self.y_array = ys[0]
 
-        for line in x_file.readlines():
-            if len(line) == 0:
-                continue
-            self.x_array.append(float(line.strip()))
-
-        for line in y_file.readlines():
-            if len(line) == 0:
-                continue
-            if len(self.y_array) >= len(self.x_array):
-                break
-            self.y_array.append(float(line.strip()))
         length = min(len(self.x_array), len(self.y_array))
+        if len(self.x_array) != len(self.y_array):
+            print(f"FileSubPlot: {x_name} has {len(self.x_array)} values, {y_name} {len(self.y_array)}, "
+                  f"showing the first {length}")
         self.x_array = self.x_array[:length]
         self.y_array = self.y_array[:length]
 
+        self.gap_times = load_gap_times(data_root, y_name)
+
     @property
     def x_data(self):
         return self.x_array
@@ -227,6 +572,68 @@ class FileSubPlot:
         return self.y_array
 
 
+def has_parameter(data_root, param_name):
+    """
+    :return: True if a stored run has values of a parameter
+    """
+    if runstore.is_run_store(data_root):
+        return param_name in runstore.RunReader(data_root).names
+    if archive.is_archive(data_root):
+        return param_name in archive.ArchiveReader(data_root).names
+    return os.path.exists(os.path.join(data_root, param_name + ".txt"))
+
+
+def load_column(data_root, param_name):
+    """
+    reads all values of a parameter of a stored run, written as text file, as runstore column or archived
+
+    :param data_root: directory of the stored run
+    :param param_name: name of the parameter
+    :return: float64 array (memory mapped for a runstore), empty if the parameter doesn't exist
+    """
+    if runstore.is_run_store(data_root):
+        reader = runstore.RunReader(data_root)
+        if param_name not in reader.names:
+            return np.zeros(0)
+        return reader.column(param_name)
+    if archive.is_archive(data_root):
+        reader = archive.ArchiveReader(data_root)
+        if param_name not in reader.names:
+            return np.zeros(0)
+        return reader.column(param_name)
+
+    path = os.path.join(data_root, param_name + ".txt")
+    if not os.path.exists(path):
+        return np.zeros(0)
+    # parsed once, later loads map the .npy sidecar
+    return parsecache.load(path)
+
+
+def load_gap_times(data_root, param_name):
+    """
+    reads the gap reports a batched NetworkIOHandler sends for a series (<prefix>-gap-time, <prefix>-dropped,
+    <prefix>-decimated) and returns the times at which records of the series were dropped
+
+    :param data_root: directory of the stored run
+    :param param_name: any parameter of the series, e.g. "lf-e"
+    :return: list of times, empty if the run has no gap reports
+    """
+    # reports of a series logged on its own (e.g. log_param("cs-v")), otherwise of the record stream of the prefix
+    prefix = param_name
+    if not has_parameter(data_root, prefix + "-gap-time"):
+        prefix = param_name.split("-")[0]
+    times = load_column(data_root, prefix + "-gap-time")
+    dropped = load_column(data_root, prefix + "-dropped")
+
+    gap_times = []
+    last = 0.0
+    for i in range(min(len(times), len(dropped))):
+        if dropped[i] > last:
+            gap_times.append(times[i])
+        last = dropped[i]
+    return gap_times
+
+
 class FilePlot:
 
     def __init__(self, subplots, plot_rows, plot_columns):
@@ -240,7 +647,10 @@ class FilePlot:
 
         for j in range(len(self.axes)):
             self.axes[j].clear()
-            self.axes[j].plot(self.subplots[j].x_data, self.subplots[j].y_data)
+            self._draw(j)
+            # records dropped by the robot because the link was too slow
+            for gap_time in self.subplots[j].gap_times:
+                self.axes[j].axvline(gap_time, color='r', alpha=0.3)
             if self.subplots[j].ylim is not None:
                 self.axes[j].set_ylim(self.subplots[j].ylim)
             if self.subplots[j].xlim is not None:
@@ -248,6 +658,76 @@ class FilePlot:
 
         plt.show()
 
+    def _draw(self, j):
+        self.axes[j].plot(self.subplots[j].x_data, self.subplots[j].y_data)
+
+
+class LodFileSubPlot:
+
+    def __init__(self, x_name, y_name, data_root=DATA_ROOT, ylim=None, xlim=None):
+        """
+        stored parameter shown by a LodFilePlot, only the level of detail pyramid (see lod.Pyramid) is loaded,
+        raw values are read (see timeslice) when the visible range has fewer values than the plot has pixels
+        """
+        self.x_name = x_name
+        self.y_name = y_name
+        self.data_root = catalog.resolve_run(data_root)
+        self.xlim = xlim
+        self.ylim = ylim
+        self.pyramid = lod.load_or_build(self.data_root, x_name, y_name)
+        self.gap_times = load_gap_times(self.data_root, y_name)
+
+    def bounds(self):
+        return self.pyramid.bounds()
+
+    def view(self, x0, x1, pixels):
+        """
+        :return: (x, min, max, mean) arrays for the range [x0, x1] of a plot pixels wide
+        """
+        level = self.pyramid.level_for(x0, x1, pixels)
+        if level is None:
+            x, (y,) = timeslice.load_window(self.data_root, self.x_name, [self.y_name], x0, x1)
+            return x, y, y, y
+        return self.pyramid.window(level, x0, x1)
+
+
+class LodFilePlot(FilePlot):
+
+    def __init__(self, subplots, plot_rows, plot_columns):
+        """
+        FilePlot for long runs: every subplot shows min / max band and mean of the pyramid level matching the
+        visible range and the pixel width, and switches the level while panning and zooming, so redrawing takes
+        the same time for any length of the run
+
+        :param subplots: list of LodFileSubPlot
+        """
+        self.lines = {}
+        self.bands = {}
+        super().__init__(subplots, plot_rows, plot_columns)
+
+    def _draw(self, j):
+        bounds = self.subplots[j].bounds()
+        if bounds is None:
+            return
+        self.lines[j], = self.axes[j].plot([], [])
+        self.bands[j] = None
+        self._update(j, bounds[0], bounds[1])
+        self.axes[j].set_xlim(bounds)
+        self.axes[j].callbacks.connect('xlim_changed', lambda axes, j=j: self._update(j, *axes.get_xlim()))
+
+    def _update(self, j, x0, x1):
+        axes = self.axes[j]
+        pixels = max(1, int(axes.get_window_extent().width))
+        x, low, high, mean = self.subplots[j].view(x0, x1, pixels)
+        self.lines[j].set_data(x, mean)
+        if self.bands[j] is not None:
+            self.bands[j].remove()
+        self.bands[j] = axes.fill_between(x, low, high, color=self.lines[j].get_color(), alpha=0.3, linewidth=0)
+        if self.subplots[j].ylim is None:
+            axes.relim()
+            axes.autoscale_view(scalex=False)
+        axes.figure.canvas.draw_idle()
+
 
 if __name__ == "__main__":
 
@@ -255,11 +735,22 @@ if __name__ == "__main__":
 
     print("1: socket connection + live plotting")
     print("2: plotting stored data")
+    print("3: datagram connection + live plotting")
+    print("4: resuming connection + live plotting")
+    print("5: socket connection + live plotting, stored as float64 columns (runstore)")
+    print("6: plotting stored data of long runs (level of detail pyramid)")
 
     command = input().strip()
 
-    if command == '1':
-        rs1 = RobotServer(host=HOST, port=FIRST_PORT, data_root=DATA_ROOT)
+    if command in ['1', '3', '4', '5']:
+        if command == '1':
+            rs1 = RobotServer(host=HOST, port=FIRST_PORT, data_root=DATA_ROOT)
+        elif command == '5':
+            rs1 = RobotServer(host=HOST, port=FIRST_PORT, data_root=DATA_ROOT, columnar=True)
+        elif command == '3':
+            rs1 = DatagramRobotServer(host=HOST, port=FIRST_PORT, data_root=DATA_ROOT)
+        else:
+            rs1 = ResumingRobotServer(host=HOST, port=FIRST_PORT, data_root=DATA_ROOT)
 
         time.sleep(1)
 
@@ -279,4 +770,11 @@ if __name__ == "__main__":
         sp4 = FileSubPlot(data_root=DATA_ROOT, x_name="lf-time", y_name="lf-u", max_x_diff=10, ylim=[-250, 250])
         plot = FilePlot([sp1, sp2, sp3, sp4], plot_rows=2, plot_columns=2)
 
+    if command == '6':
+        sp1 = LodFileSubPlot(data_root=DATA_ROOT, x_name="lf-time", y_name="lf-e", ylim=[-100, 100])
+        sp2 = LodFileSubPlot(data_root=DATA_ROOT, x_name="lf-time", y_name="lf-i", ylim=[-50, 50])
+        sp3 = LodFileSubPlot(data_root=DATA_ROOT, x_name="lf-time", y_name="lf-d", ylim=[-150, 150])
+        sp4 = LodFileSubPlot(data_root=DATA_ROOT, x_name="lf-time", y_name="lf-u", ylim=[-250, 250])
+        plot = LodFilePlot([sp1, sp2, sp3, sp4], plot_rows=2, plot_columns=2)
+
 
@@ -1,4 +1,3 @@
-import collections
 import socket
 import os
 import threading
@@ -6,7 +5,11 @@ import time
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 
-import numpy as np
+import batchparse
+import filewriter
+import liveplot
+import parsecache
+import ringbuffer
 
 DATA_ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'data1'))
 HOST = '192.168.138.227'  # Standard loopback interface address (localhost)
@@ -14,15 +17,24 @@ PORT = 65433  # Port to listen on (non-privileged ports are > 1023)
 
 HOST = '127.0.0.1'
 
+# columns of RoboServer.buffer
+V1, V2, V3, E, I, D = range(6)
+
+
 class RoboServer:
 
+    # bytes received with one recv_into(), a block can hold many lines
+    READ_SIZE = 65536
+
     def __init__(self,
                  host: str,
                  port: int,
                  show_plot: bool = True,
                  plotted_time: int = 10,
                  save_to_file: bool = True,
-                 save_file_directory: str = DATA_ROOT
+                 save_file_directory: str = DATA_ROOT,
+                 flush_policy: filewriter.FlushPolicy = None,
+                 blit: bool = True
                  ):
 
         """
@@ -35,6 +47,9 @@ class RoboServer:
         :param plotted_time: how many seconds should be visible in plot
         :param save_to_file: Write data to data directory? [True/False]
         :param save_file_directory: path of data directory. Defaults to /data
+        :param flush_policy: when the writer thread writes the files to disk, see filewriter.FlushPolicy
+        :param blit: update persistent lines over a cached background (see liveplot.BlitAnimator) instead of
+                     clearing and plotting the axes every frame
         """
 
         # connection params
@@ -44,6 +59,7 @@ class RoboServer:
         # plot params
         self.show_plot: bool = show_plot
         self.plotted_time: int = plotted_time
+        self.animator = None
 
         # save to file params
         self.save_to_file: bool = save_to_file
@@ -54,13 +70,9 @@ class RoboServer:
 
             # temporary storage for plotting data
             self.time_t0 = None
-            self.time_deque = collections.deque(np.array([]))
-            self.value1_deque = collections.deque(np.array([]))
-            self.value2_deque = collections.deque(np.array([]))
-            self.value3_deque = collections.deque(np.array([]))
-            self.error_deque = collections.deque(np.array([]))
-            self.integral_deque = collections.deque(np.array([]))
-            self.derivative_deque = collections.deque(np.array([]))
+            # columns v1, v2, v3, e, i, d, see the V1 ... D column indices; written by the socket thread,
+            # the plot draws from snapshots of it
+            self.buffer = ringbuffer.SharedRingBuffer(columns=6, window=self.plotted_time)
 
             # plotting
             self.fig = plt.figure()
@@ -74,21 +86,29 @@ class RoboServer:
 
         # File storage
         if self.save_to_file:
-            self.file_time = open(os.path.join(self.save_file_directory, "1_time.txt"), 'w+')
-            self.file_v1 = open(os.path.join(self.save_file_directory, "v1.txt"), 'w+')
-            self.file_v2 = open(os.path.join(self.save_file_directory, "v2.txt"), 'w+')
-            self.file_v3 = open(os.path.join(self.save_file_directory, "2_v3.txt"), 'w+')
-            self.file_e = open(os.path.join(self.save_file_directory, "3_e.txt"), 'w+')
-            self.file_d = open(os.path.join(self.save_file_directory, "5_d.txt"), 'w+')
-            self.file_i = open(os.path.join(self.save_file_directory, "4_i.txt"), 'w+')
+            # the files are written by a writer thread, a slow disk doesn't hold up the socket thread
+            self.writer = filewriter.FileWriter(flush_policy)
+            self.file_time = self.writer.open(os.path.join(self.save_file_directory, "1_time.txt"), 'wb+')
+            self.file_v1 = self.writer.open(os.path.join(self.save_file_directory, "v1.txt"), 'wb+')
+            self.file_v2 = self.writer.open(os.path.join(self.save_file_directory, "v2.txt"), 'wb+')
+            self.file_v3 = self.writer.open(os.path.join(self.save_file_directory, "2_v3.txt"), 'wb+')
+            self.file_e = self.writer.open(os.path.join(self.save_file_directory, "3_e.txt"), 'wb+')
+            self.file_d = self.writer.open(os.path.join(self.save_file_directory, "5_d.txt"), 'wb+')
+            self.file_i = self.writer.open(os.path.join(self.save_file_directory, "4_i.txt"), 'wb+')
 
         # threading
-        self.thread_lock = threading.Lock()
         self.socket_thread = threading.Thread(target=self._receive_data)
 
         # start functionality
         self.socket_thread.start()
-        if self.show_plot:
+        if self.show_plot and blit:
+            self.animator = liveplot.BlitAnimator(self.fig)
+            self.animator.add(self.ax_v3, lambda: self._snapshot(V3), self.plotted_time, ylim=[0, 100])
+            self.animator.add(self.ax_e, lambda: self._snapshot(E), self.plotted_time, ylim=[-25, 25])
+            self.animator.add(self.ax_i, lambda: self._snapshot(I), self.plotted_time, ylim=[-50, 50])
+            self.animator.add(self.ax_d, lambda: self._snapshot(D), self.plotted_time, ylim=[-50, 50])
+            self.animator.start()
+        elif self.show_plot:
             # self.ani = animation.FuncAnimation(self.fig, self._draw_plot, interval=200)
             time.sleep(5)
             plt.show()
@@ -102,122 +122,120 @@ class RoboServer:
             print("connecting")
             sock.connect((self.host, self.port))
             sock.settimeout(20)
-            sockFile = sock.makefile()
             print("connected")
 
+            # one reusable buffer, the socket writes straight into it (as in Server2.RobotServer.receive_data)
+            buffer = bytearray(self.READ_SIZE)
+            view = memoryview(buffer)
+            fill = 0
+
             while True:
-                data = sockFile.readline()
-                if not data:
+                if fill == len(buffer):
+                    # a single line longer than the buffer
+                    view.release()
+                    buffer.extend(bytearray(len(buffer)))
+                    view = memoryview(buffer)
+
+                n = sock.recv_into(view[fill:])
+                if n == 0:
                     break
-                string = data# .decode('ascii')
-                params = string.split(",")
-
-                print(f"v={float(params[3]): .3f}   e={float(params[4]): .3f}   i={float(params[5]): .3f}    d={float(params[6]): .3f}")
-
-                if self.save_to_file:
-                    self.file_time.write(params[0])
-                    self.file_v1.write(params[1])
-                    self.file_v2.write(params[2])
-                    self.file_v3.write(params[3])
-                    self.file_e.write(params[4])
-                    self.file_i.write(params[5])
-                    self.file_d.write(params[6])
-                    self.file_time.write("\n")
-                    self.file_v1.write("\n")
-                    self.file_v2.write("\n")
-                    self.file_v3.write("\n")
-                    self.file_e.write("\n")
-                    self.file_i.write("\n")
-                    # self.file_d.write("\n")
-                    self.file_time.flush()
-                    self.file_v1.flush()
-                    self.file_v2.flush()
-                    self.file_v3.flush()
-                    self.file_e.flush()
-                    self.file_i.flush()
-                    self.file_d.flush()
-                if self.show_plot:
-
-                    self.thread_lock.acquire()
-
-                    _time = float(params[0])
-                    if self.time_t0 is None:
-                        self.time_t0 = _time
-                        _time = 0
-                    else:
-                        _time = _time - self.time_t0
-                    self.time_deque.append(_time)
-                    self.value1_deque.append(float(params[1]))
-                    self.value2_deque.append(float(params[2]))
-                    self.value3_deque.append(float(params[3]))
-                    self.error_deque.append(float(params[4]))
-                    self.integral_deque.append(float(params[5]))
-                    self.derivative_deque.append(float(params[6]))
-
-                    while len(self.time_deque) > 0 and _time - self.time_deque[0] > self.plotted_time:
-                        self.time_deque.popleft()
-                        self.value1_deque.popleft()
-                        self.value2_deque.popleft()
-                        self.value3_deque.popleft()
-                        self.error_deque.popleft()
-                        self.integral_deque.popleft()
-                        self.derivative_deque.popleft()
-
-                    self.thread_lock.release()
+                fill += n
+
+                end = buffer.rfind(b"\n", 0, fill)
+                if end == -1:
+                    continue
+
+                # all complete lines of this read are handled together, the incomplete rest moves to the front
+                self._handle_lines(bytes(view[:end + 1]))
+                rest = fill - end - 1
+                view[:rest] = bytes(view[end + 1:fill])
+                fill = rest
 
         except:
             raise Exception("ColorSensorLogger_NetworkConnection: Connection to host failed")
+        finally:
+            # also after a connection error, the writer thread is a daemon and would lose the buffered values
+            if self.save_to_file:
+                self.writer.close()
+
+    def _handle_lines(self, chunk):
+        """
+        saves and plots a block of complete "time,v1,v2,v3,e,i,d" lines, parsed at once with batchparse
+
+        :param chunk: bytes with complete lines
+        """
+        values, valid = batchparse.parse_csv_block(chunk, 7)
+        # lines with a wrong number of values or without a valid time can't be placed
+        values = values[valid[:, 0]]
+        if len(values) > 0:
+            last = values[-1]
+            print(f"v={last[3]: .3f}   e={last[4]: .3f}   i={last[5]: .3f}    d={last[6]: .3f}")
+
+        if self.save_to_file:
+            files = [self.file_time, self.file_v1, self.file_v2, self.file_v3, self.file_e, self.file_i, self.file_d]
+            lines = chunk.replace(b"\r", b"").split(b"\n")[:-1]
+            fields = b",".join(lines).split(b",")
+            if len(fields) != 7 * len(lines):
+                # lines with a wrong number of values are skipped
+                lines = [line for line in lines if line.count(b",") == 6]
+                fields = b",".join(lines).split(b",")
+            # the values are stored as they were received, one write per file
+            for j in range(7):
+                if len(lines) > 0:
+                    files[j].write(b"\n".join(fields[j::7]) + b"\n")
+            self.writer.end_record(len(lines))
+
+        if self.show_plot and len(values) > 0:
+            if self.time_t0 is None:
+                self.time_t0 = values[0, 0]
+            # the buffer is only locked for the append, never while the plot draws
+            self.buffer.extend(values[:, 0] - self.time_t0, values[:, 1:].T)
+
+    def _snapshot(self, column):
+        # times and values of the same records
+        times, columns = self.buffer.snapshot()
+        return times, columns[column]
 
     def _draw_plot(self, i):
 
-        # locking plotting data, as it shouldn't be changed while access
-        self.thread_lock.acquire()
+        # private copy of the plotting data, the socket thread keeps receiving while it is drawn
+        times, columns = self.buffer.snapshot()
 
         # v1, v2 not needed as rgb is not used
 
         # self.ax_v1.clear()
-        # self.ax_v1.plot(self.time_deque, self.value1_deque)
+        # self.ax_v1.plot(times, columns[V1])
 
         # self.ax_v2.clear()
-        # self.ax_v2.plot(self.time_deque, self.value2_deque)
+        # self.ax_v2.plot(times, columns[V2])
 
         self.ax_v3.clear()
-        self.ax_v3.plot(self.time_deque, self.value3_deque)
+        self.ax_v3.plot(times, columns[V3])
         self.ax_v3.set_ylim([0, 100])
 
         self.ax_e.clear()
-        self.ax_e.plot(self.time_deque, self.error_deque)
+        self.ax_e.plot(times, columns[E])
         self.ax_e.set_ylim([-25, 25])
 
         self.ax_i.clear()
-        self.ax_i.plot(self.time_deque, self.integral_deque)
+        self.ax_i.plot(times, columns[I])
         self.ax_i.set_ylim([-50, 50])
 
         self.ax_d.clear()
-        self.ax_d.plot(self.time_deque, self.derivative_deque)
+        self.ax_d.plot(times, columns[D])
         self.ax_d.set_ylim([-50, 50])
 
-        # plotting data no longer accessed
-        self.thread_lock.release()
-
 
 def draw_plot_with_stored_data():
 
-    file_time = open(os.path.join(DATA_ROOT, "1_time.txt"), 'r')
-    file_v1 = open(os.path.join(DATA_ROOT, "v1.txt"), 'r')
-    file_v2 = open(os.path.join(DATA_ROOT, "v2.txt"), 'r')
-    file_v3 = open(os.path.join(DATA_ROOT, "2_v3.txt"), 'r')
-    file_e = open(os.path.join(DATA_ROOT, "3_e.txt"), 'r')
-    file_i = open(os.path.join(DATA_ROOT, "4_i.txt"), 'r')
-    file_d = open(os.path.join(DATA_ROOT, "5_d.txt"), 'r')
-
-    times_array = [float(line.strip()) for line in file_time.readlines()]
-    v1_array = [float(line.strip()) for line in file_v1.readlines()]
-    v2_array = [float(line.strip()) for line in file_v2.readlines()]
-    v3_array = [float(line.strip()) for line in file_v3.readlines()]
-    e_array = [float(line.strip()) for line in file_e.readlines()]
-    i_array = [float(line.strip()) for line in file_i.readlines()]
-    d_array = [float(line.strip()) for line in file_d.readlines()]
+    # parsed once, later loads map the .npy sidecars (see parsecache)
+    times_array = parsecache.load(os.path.join(DATA_ROOT, "1_time.txt"))
+    v1_array = parsecache.load(os.path.join(DATA_ROOT, "v1.txt"))
+    v2_array = parsecache.load(os.path.join(DATA_ROOT, "v2.txt"))
+    v3_array = parsecache.load(os.path.join(DATA_ROOT, "2_v3.txt"))
+    e_array = parsecache.load(os.path.join(DATA_ROOT, "3_e.txt"))
+    i_array = parsecache.load(os.path.join(DATA_ROOT, "4_i.txt"))
+    d_array = parsecache.load(os.path.join(DATA_ROOT, "5_d.txt"))
 
     fig = plt.figure()
     # v1, v2 not needed as rgb is not used
@@ -1,12 +1,16 @@
 import collections
 import math
-import shutil
 import socket
 import os
 import threading
 import time
 import function
 
+import archive
+import catalog
+import filewriter
+import timeslice
+
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 
@@ -20,6 +24,50 @@ HOST, PORT = '127.0.0.1', 65433
 
 deques_lock = threading.Lock()
 
+# all loggers of a session write to the same run directory of the catalog at DATA_ROOT (l0, l1, ...)
+session_lock = threading.Lock()
+_session = {}
+
+
+def session_run(info=None):
+    """
+    :return: (catalog, run id, run directory) of this session, the run is created on the first call
+    """
+    with session_lock:
+        if 'run_id' not in _session:
+            _session['catalog'] = catalog.RunCatalog(DATA_ROOT)
+            _session['run_id'], _session['root'] = _session['catalog'].new_run(info=info)
+        return _session['catalog'], _session['run_id'], _session['root']
+
+
+def join_session(info=None):
+    """
+    session_run for a logger writing to the run, it has to call leave_session when it is done
+
+    :return: (catalog, run id, run directory) of this session
+    """
+    session = session_run(info)
+    with session_lock:
+        _session['loggers'] = _session.get('loggers', 0) + 1
+        _session.setdefault('samples', {})
+    return session
+
+
+def leave_session(samples):
+    """
+    adds the sample counts of a logger that is done to the session run, the run is finished in the catalog
+    when the last logger of the session left
+
+    :param samples: dict {l<N>/<i>_<name>: number of values}
+    """
+    with session_lock:
+        _session['samples'].update(samples)
+        _session['loggers'] -= 1
+        if _session['loggers'] > 0:
+            return
+        run_catalog, run_id, samples = _session['catalog'], _session['run_id'], dict(_session['samples'])
+    run_catalog.finish_run(run_id, samples)
+
 
 class Plot:
 
@@ -56,7 +104,14 @@ class RobotServer:
 
     _count = 0
 
-    def __init__(self, host, port, to_file=True, plot=None, plotted_time=10, plot_boundaries_dict=None):
+    def __init__(self, host, port, to_file=True, plot=None, plotted_time=10, plot_boundaries_dict=None,
+                 connect=True, logger_num=None, writer=None):
+        """
+        :param connect: connect to the Logger_NetworkConnection, with False the values are passed in
+                        by a MultiplexedRobotServer (see start_channel and handle_params)
+        :param logger_num: number of the data directory l<logger_num>, defaults to the count of servers
+        :param writer: filewriter.FileWriter writing the files, a new one if None
+        """
 
         # connection params
         self.host: str = host
@@ -70,13 +125,22 @@ class RobotServer:
 
         # save to file params
         self.to_file: bool = to_file
-        self.data_root = os.path.join(DATA_ROOT, 'l'+str(RobotServer._count))
-        if os.path.exists(self.data_root):
-            shutil.rmtree(self.data_root)
+        # channels of a MultiplexedRobotServer are counted by it
+        session = join_session if connect else session_run
+        _catalog, _run_id, run_root = session(info={'server': 'Server_GeneralLogger', 'host': host})
+        self.logger_name = 'l'+str(RobotServer._count if logger_num is None else logger_num)
+        self.data_root = os.path.join(run_root, self.logger_name)
         os.makedirs(self.data_root, exist_ok=False)
         self.files = []
+        # number of stored values per file l<N>/<i>_<name>, stored in the catalog index when the session ends
+        self.sample_names = []
+        self.samples = {}
+        self.writer = writer if writer is not None else filewriter.FileWriter()
+        # set by finish
+        self.finished = False
 
         # plotting
+        self.time_t0 = None
         if self.plot is not None:
             self.time_idx = -1
             self.deques = []
@@ -87,6 +151,9 @@ class RobotServer:
         # updating server count
         RobotServer._count += 1
 
+        if not connect:
+            return
+
         # server init
 
         try:
@@ -99,75 +166,109 @@ class RobotServer:
 
             init_string = self.sockFile.readline().rstrip()
             init_params = init_string.split(",")
-
-            j = 0
-            for i, param_name in enumerate(init_params):
-                if self.to_file:
-                    self.files.append(open(os.path.join(self.data_root, f"{i}_{param_name}.txt"), 'w+'))
-                if self.plot is not None:
-                    if not param_name == "time":
-                        ax = self.plot.create_subplot()
-                        self.axes.append(ax)
-                        self.plot_names.append(param_name)
-                        j += 1
-                    self.deques.append(collections.deque(np.array([])))
-                if param_name == "time":
-                    self.time_idx = i
-
-            if self.plot is not None:
-                self.plot.add_drawing_function(self.draw_plot)
-                if self.time_idx == -1:
-                    raise Exception("if plot is shown one parameter must be named 'time'")
+            self.start_channel(init_params)
         except:
+            # the other loggers of the session don't wait for this one
+            self.finish()
             raise Exception("ColorSensorLogger_NetworkConnection: Establishing connection to host failed")
 
         # starting
         self.thread = threading.Thread(target=self.receive_data)
         self.thread.start()
 
+    def start_channel(self, init_params):
+        """
+        creates the files and subplots for the parameters of the header line
+
+        :param init_params: parameter names
+        """
+        j = 0
+        for i, param_name in enumerate(init_params):
+            if self.to_file:
+                self.files.append(self.writer.open(os.path.join(self.data_root, f"{i}_{param_name}.txt"), 'w+'))
+                self.sample_names.append(f"{self.logger_name}/{i}_{param_name}")
+                self.samples[self.sample_names[-1]] = 0
+            if self.plot is not None:
+                if not param_name == "time":
+                    ax = self.plot.create_subplot()
+                    self.axes.append(ax)
+                    self.plot_names.append(param_name)
+                    j += 1
+                self.deques.append(collections.deque(np.array([])))
+            if param_name == "time":
+                self.time_idx = i
+
+        if self.plot is not None:
+            self.plot.add_drawing_function(self.draw_plot)
+            if self.time_idx == -1:
+                raise Exception("if plot is shown one parameter must be named 'time'")
+
     def receive_data(self):
 
         try:
-            time_t0 = None
             while True:
-                string = self.sockFile.readline().rstrip()
-                params = string.split(",")
-
-                # print(params, self.time_idx)
+                string = self.sockFile.readline()
+                if not string:
+                    break
+                params = string.rstrip().split(",")
+                self.handle_params(params)
 
-                if self.to_file:
-                    # print(len(self.files))
-                    # print(params)
-                    for i in range(len(params)):
-                        self.files[i].write(params[i])
-                        self.files[i].write("\n")
-                        self.files[i].flush()
-
-                if self.plot is not None:
+        except:
+            raise Exception("ColorSensorLogger_NetworkConnection: Connection to host failed")
+        finally:
+            # also after a connection error, the writer thread is a daemon and would lose the buffered values
+            self.finish()
+
+    def finish(self):
+        """
+        writes the buffered values to disk and leaves the session run (see leave_session), only the first call
+        does anything
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self.writer.close()
+        leave_session(self.samples)
+
+    def handle_params(self, params):
+        """
+        saves and plots the values of one line
+
+        :param params: values as str, in the order of the header line
+        """
+
+        # print(params, self.time_idx)
+
+        if self.to_file:
+            # print(len(self.files))
+            # print(params)
+            for i in range(len(params)):
+                self.files[i].write(params[i] + "\n")
+                self.samples[self.sample_names[i]] += 1
+            self.writer.end_record()
 
-                    deques_lock.acquire()
+        if self.plot is not None:
 
-                    _time = float(params[self.time_idx])
-                    if time_t0 is None:
-                        time_t0 = _time
-                        _time = 0
-                    else:
-                        _time = _time - time_t0
+            deques_lock.acquire()
 
-                    for i in range(len(params)):
-                        if i == self.time_idx:
-                            self.deques[i].append(_time)
-                        else:
-                            self.deques[i].append(params[i])
+            _time = float(params[self.time_idx])
+            if self.time_t0 is None:
+                self.time_t0 = _time
+                _time = 0
+            else:
+                _time = _time - self.time_t0
 
-                    while len(self.deques[self.time_idx]) > 0 and _time - self.deques[self.time_idx][0] > self.plotted_time:
-                        for deque in self.deques:
-                            deque.popleft()
+            for i in range(len(params)):
+                if i == self.time_idx:
+                    self.deques[i].append(_time)
+                else:
+                    self.deques[i].append(params[i])
 
-                    deques_lock.release()
+            while len(self.deques[self.time_idx]) > 0 and _time - self.deques[self.time_idx][0] > self.plotted_time:
+                for deque in self.deques:
+                    deque.popleft()
 
-        except:
-            raise Exception("ColorSensorLogger_NetworkConnection: Connection to host failed")
+            deques_lock.release()
 
     def draw_plot(self, i):
         #print(i)
@@ -198,14 +299,99 @@ class RobotServer:
         deques_lock.release()
 
 
-def draw_plot_with_stored_data(logger_num, boundaries=None, width=2):
+class MultiplexedRobotServer:
+
+    def __init__(self, host, port, to_file=True, plot=None, plotted_time=10, plot_boundaries_dict=None):
+        """
+        Receives all loggers of a test_client.ChannelConnection over a single connection and thread.
+        Every channel is demultiplexed into its own RobotServer (without connection), so channel <id>
+        is stored in l<id> just like the logger on port + <id> of a RobotServer per logger.
+
+        :param host: IP of the EV3
+        :param port: port of the ChannelConnection
+        """
+        self.host = host
+        self.port = port
+        self.to_file = to_file
+        self.plot = plot
+        self.plotted_time = plotted_time
+        self.plot_boundaries_dict = plot_boundaries_dict
+        self.channels = {}
+        # one writer thread for the files of all channels
+        self.writer = filewriter.FileWriter()
+
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            print("connecting")
+            self.sock.connect((self.host, self.port))
+            self.sock.settimeout(20)
+            self.sockFile = self.sock.makefile()
+            print("connected")
+        except:
+            raise Exception("MultiplexedRobotServer: Establishing connection to host failed")
+
+        # the session run is finished when all channels and the other loggers of the session are done
+        join_session(info={'server': 'Server_GeneralLogger', 'host': host})
+
+        # starting
+        self.thread = threading.Thread(target=self.receive_data)
+        self.thread.start()
+
+    def receive_data(self):
+
+        try:
+            while True:
+                string = self.sockFile.readline()
+                if not string:
+                    break
+                tag, _, values = string.rstrip().partition(",")
+                if not tag.lstrip("#").isdigit():
+                    # broken or partial line, only this line is lost and not the connection of all channels
+                    continue
+                if tag.startswith("#"):
+                    # header line of a new channel
+                    channel_id = int(tag[1:])
+                    channel = RobotServer(self.host, self.port, to_file=self.to_file, plot=self.plot,
+                                          plotted_time=self.plotted_time, plot_boundaries_dict=self.plot_boundaries_dict,
+                                          connect=False, logger_num=channel_id, writer=self.writer)
+                    deques_lock.acquire()
+                    try:
+                        channel.start_channel(values.split(","))
+                    finally:
+                        deques_lock.release()
+                    self.channels[channel_id] = channel
+                    print(f"channel {channel_id}: {values}")
+                    continue
+                channel = self.channels.get(int(tag))
+                if channel is not None:
+                    channel.handle_params(values.split(","))
+
+        except:
+            raise Exception("MultiplexedRobotServer: Connection to host failed")
+        finally:
+            self.writer.close()
+            samples = {}
+            for channel in self.channels.values():
+                samples.update(channel.samples)
+            leave_session(samples)
+
+
+def draw_plot_with_stored_data(logger_num, boundaries=None, width=2, t_range=None):
+    """
+    :param t_range: (t0, t1) in seconds since the start of the run, only this window is read from the files;
+                    None reads the whole run
+    """
 
     if boundaries is None:
         boundaries = {}
     boundaries_keys = boundaries.keys()
 
-    data_root = os.path.join(DATA_ROOT, f"l{logger_num}")
-    paths = sorted(os.listdir(data_root))
+    data_root = os.path.join(catalog.resolve_run(DATA_ROOT), f"l{logger_num}")
+    if archive.is_archive(data_root):
+        paths = sorted(archive.ArchiveReader(data_root).names)
+    else:
+        # only the value files, not the .idx.npz indexes of timeslice
+        paths = sorted(path[:-len(".txt")] for path in os.listdir(data_root) if path.endswith(".txt"))
 
     heigth = math.ceil((len(paths)-1)/width)
 
@@ -214,37 +400,25 @@ def draw_plot_with_stored_data(logger_num, boundaries=None, width=2):
 
     time_idx = None
     for i, path in enumerate(paths):
-        if "_time.txt" in path:
+        if path.endswith("_time"):
             time_idx = i
         else:
-            names.append(path.split('_')[-1].split('.')[0].strip())
-
-    files = [open(os.path.join(data_root, path), 'r') for path in paths]
-    arrays = []
-    min_array_len = None
-    for i, file in enumerate(files):
-        if i == time_idx:
-            org_times_array = [float(line.strip()) for line in file.readlines()]
-            times_array = [org_times_array[i] - org_times_array[0] for i in range(len(org_times_array))]
-            arrays.append(times_array)
-        else:
-            arrays.append([float(line.strip()) for line in file.readlines()])
+            names.append(path.split('_')[-1].strip())
 
-        if min_array_len is None:
-            min_array_len = len(arrays[i])
-        else:
-            min_array_len = len(arrays[i]) if len(arrays[i]) < min_array_len else min_array_len
+    time_name = paths[time_idx]
+    value_names = [paths[j] for j in range(len(paths)) if j != time_idx]
+    bounds = timeslice.time_bounds(data_root, time_name)
+    start = 0.0 if bounds is None else bounds[0]
+    t0, t1 = (None, None) if t_range is None else (t_range[0] + start, t_range[1] + start)
+    times_array, arrays = timeslice.load_window(data_root, time_name, value_names, t0, t1)
+    times_array = times_array - start
 
-    i = 0
-    for j in range(len(arrays)):
-        if j == time_idx:
-            continue
+    for i in range(len(arrays)):
         axes[i % width, math.floor(i / width)].clear()
         axes[i % width, math.floor(i / width)].set_title(names[i])
         if names[i] in boundaries_keys:
             axes[i % width, math.floor(i / width)].set_ylim(boundaries[names[i]])
-        axes[i % width, math.floor(i / width)].plot(arrays[time_idx][:min_array_len], arrays[j][:min_array_len])
-        i += 1
+        axes[i % width, math.floor(i / width)].plot(times_array, arrays[i])
     plt.show()
 
 
@@ -254,6 +428,7 @@ if __name__ == "__main__":
 
     print("1: socket connection + live plotting")
     print("2: plotting stored data")
+    print("3: all loggers over one connection (test_client.ChannelConnection) + live plotting")
 
     command = input().strip()
 
@@ -272,6 +447,17 @@ if __name__ == "__main__":
             time.sleep(0.5)
         time.sleep(1000)
 
+    if command == '3':
+        plot = Plot(plot_rows=2, plot_columns=2)
+        mrs = MultiplexedRobotServer(host=HOST, port=FIRST_PORT, to_file=True, plot=plot)
+        time.sleep(2)
+        plt.show()
+        time.sleep(2)
+        for i in range(2000):
+            plot.draw_plot(i)
+            time.sleep(0.5)
+        time.sleep(1000)
+
     if command == '2':
         print()
         print("What Loggers do you use?")
@@ -0,0 +1,221 @@
+import sys
+import time
+
+import numpy as np
+
+import runstore
+import timeslice
+
+BACKWARD = "backward"   # last sample at or before the query time
+FORWARD = "forward"     # first sample at or after the query time
+NEAREST = "nearest"     # closest sample, the earlier one on a tie
+
+LINEAR = "linear"       # linear interpolation between the samples around the query time
+PREVIOUS = BACKWARD
+
+
+def time_name(param_name):
+    """
+    :return: the time parameter recorded with a parameter, e.g. "lf-time" for "lf-e"
+    """
+    if runstore.is_time_name(param_name):
+        return param_name
+    return param_name.split("-")[0] + "-time"
+
+
+def _sorted(times, values):
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    length = min(len(times), len(values))
+    times = times[:length]
+    values = values[:length]
+    # samples without a valid time stamp can't be placed
+    valid = ~np.isnan(times)
+    if not valid.all():
+        times = times[valid]
+        values = values[valid]
+    if len(times) > 1 and np.any(times[1:] < times[:-1]):
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        values = values[order]
+    return times, values
+
+
+def asof_indices(times, query, tolerance=None, direction=BACKWARD):
+    """
+    :param times: sorted sample times
+    :param query: query times, any order
+    :param tolerance: max distance in seconds between query and sample time, None for no limit
+    :param direction: BACKWARD, FORWARD or NEAREST
+    :return: index of the matching sample for every query time, -1 where there is none
+    """
+    query = np.asarray(query, dtype=np.float64)
+    n = len(times)
+    if n == 0:
+        return np.full(len(query), -1, dtype=np.int64)
+
+    if direction == BACKWARD:
+        index = np.searchsorted(times, query, side='right') - 1
+    elif direction == FORWARD:
+        index = np.searchsorted(times, query, side='left')
+    elif direction == NEAREST:
+        after = np.clip(np.searchsorted(times, query, side='left'), 0, n - 1)
+        before = np.clip(after - 1, 0, n - 1)
+        use_after = np.abs(times[after] - query) < np.abs(query - times[before])
+        index = np.where(use_after, after, before)
+    else:
+        raise Exception(f"asof_indices: unknown direction {direction}")
+
+    found = (index >= 0) & (index < n)
+    index = np.where(found, index, -1)
+    if tolerance is not None:
+        distance = np.abs(times[np.clip(index, 0, n - 1)] - query)
+        index = np.where(found & (distance <= tolerance), index, -1)
+    # NaN query times match nothing
+    index[np.isnan(query)] = -1
+    return index
+
+
+def asof(times, values, query, tolerance=None, direction=BACKWARD):
+    """
+    as-of join of one stream onto query times
+
+    :param times: sample times of the stream (sorted here if they aren't)
+    :param values: sample values of the stream
+    :param query: query times
+    :param tolerance: see asof_indices
+    :param direction: see asof_indices
+    :return: float64 array with a value per query time, NaN where no sample matches
+    """
+    times, values = _sorted(times, values)
+    index = asof_indices(times, query, tolerance, direction)
+    result = np.full(len(index), np.nan)
+    found = index >= 0
+    result[found] = values[index[found]]
+    return result
+
+
+def join(base_times, streams, tolerance=None, direction=BACKWARD):
+    """
+    aligns any number of streams to the samples of a base stream
+
+    :param base_times: times of the base stream, e.g. lf-time
+    :param streams: dict name -> (times, values), e.g. {"cs-v": (cs_time, cs_v)}
+    :param tolerance: see asof_indices
+    :param direction: see asof_indices
+    :return: dict name -> float64 array of the length of base_times
+    """
+    return {name: asof(times, values, base_times, tolerance, direction) for name, (times, values) in streams.items()}
+
+
+def uniform_grid(streams, period, t0=None, t1=None):
+    """
+    :return: times t0, t0 + period, ... <= t1, by default over the time all streams have samples
+    """
+    if t0 is None:
+        t0 = max(float(np.nanmin(times)) for times, values in streams.values() if len(times) > 0)
+    if t1 is None:
+        t1 = min(float(np.nanmax(times)) for times, values in streams.values() if len(times) > 0)
+    return t0 + np.arange(int(np.floor((t1 - t0) / period + 1e-9)) + 1) * period
+
+
+def resample(streams, period, t0=None, t1=None, method=LINEAR, tolerance=None):
+    """
+    resamples streams of different rates to one uniform time grid
+
+    :param streams: dict name -> (times, values)
+    :param period: grid period in seconds
+    :param t0: first grid time, None for the latest first sample of the streams
+    :param t1: last grid time, None for the earliest last sample of the streams
+    :param method: LINEAR, or a direction of asof_indices (PREVIOUS / BACKWARD, FORWARD, NEAREST)
+    :param tolerance: max gap in seconds between the samples a grid value is taken from, None for no limit;
+                      longer gaps (e.g. dropped records) give NaN instead of a made up value
+    :return: (grid, dict name -> float64 array of the length of grid)
+    """
+    grid = uniform_grid(streams, period, t0, t1)
+    result = {}
+    for name, (times, values) in streams.items():
+        times, values = _sorted(times, values)
+        if method != LINEAR:
+            result[name] = asof(times, values, grid, tolerance, method)
+            continue
+        if len(times) == 0:
+            result[name] = np.full(len(grid), np.nan)
+            continue
+        resampled = np.interp(grid, times, values, left=np.nan, right=np.nan)
+        if tolerance is not None:
+            after = np.clip(np.searchsorted(times, grid, side='left'), 0, len(times) - 1)
+            before = np.clip(after - 1, 0, len(times) - 1)
+            exact = times[after] == grid
+            resampled[(times[after] - times[before] > tolerance) & ~exact] = np.nan
+        result[name] = resampled
+    return grid, result
+
+
+def load_streams(data_root, names, t0=None, t1=None):
+    """
+    loads parameters of a stored run together with their own time parameter (see time_name)
+
+    :param data_root: directory of the run
+    :param names: parameter names, e.g. ["lf-e", "cs-v"]
+    :param t0: start of the time range, None for the start of the run
+    :param t1: end of the time range, None for the end of the run
+    :return: dict name -> (times, values)
+    """
+    series = {}
+    for name in names:
+        series.setdefault(time_name(name), []).append(name)
+    streams = {}
+    for x_name, y_names in series.items():
+        times, ys = timeslice.load_window(data_root, x_name, y_names, t0, t1)
+        for i in range(len(y_names)):
+            streams[y_names[i]] = (times, ys[i])
+    return streams
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(duration=3600.0):
+    """
+    joins an hour of 100 Hz cs-v with jitter onto 200 Hz lf-time, vectorized and with a loop over the samples
+    """
+    rng = np.random.default_rng(0)
+    lf_time = 1.7e9 + np.arange(int(duration * 200)) / 200 + rng.uniform(0, 0.001, int(duration * 200))
+    cs_time = 1.7e9 + np.arange(int(duration * 100)) / 100 + rng.uniform(0, 0.003, int(duration * 100))
+    cs_v = np.sin(cs_time)
+
+    t0 = time.perf_counter()
+    joined = asof(cs_time, cs_v, lf_time, tolerance=0.02)
+    t_vectorized = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    looped = []
+    j = 0
+    cs_list = cs_time.tolist()
+    for t in lf_time.tolist():
+        while j + 1 < len(cs_list) and cs_list[j + 1] <= t:
+            j += 1
+        looped.append(cs_v[j] if cs_list[j] <= t and t - cs_list[j] <= 0.02 else float('nan'))
+    t_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    grid, resampled = resample({"lf-e": (lf_time, np.cos(lf_time)), "cs-v": (cs_time, cs_v)}, 0.01, tolerance=0.05)
+    t_resample = time.perf_counter() - t0
+
+    print(f"as-of join of {len(cs_time)} onto {len(lf_time)} samples: vectorized {t_vectorized * 1000:.0f} ms, "
+          f"loop {t_loop * 1000:.0f} ms, equal: {np.array_equal(joined, np.array(looped), equal_nan=True)}")
+    print(f"resampling both to {len(grid)} grid points: {t_resample * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+
+    # usage: python align.py                          (benchmark)
+    #        python align.py <run directory> <period> <name> ...   (prints the resampled parameters)
+    if len(sys.argv) > 3:
+        grid_times, columns = resample(load_streams(sys.argv[1], sys.argv[3:]), float(sys.argv[2]))
+        print("time " + " ".join(sys.argv[3:]))
+        for k in range(len(grid_times)):
+            print(f"{grid_times[k]:.6f} " + " ".join(f"{columns[name][k]:.6g}" for name in sys.argv[3:]))
+    else:
+        benchmark()
@@ -0,0 +1,318 @@
+import json
+import lzma
+import os
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+
+import batchparse
+import parsecache
+import runstore
+
+ARCHIVE = "archive.rla"
+MAGIC = b"RLA1"
+ARCHIVE_VERSION = 1
+# footer: offset of the JSON index, then MAGIC again
+FOOTER = struct.Struct("<Q4s")
+# values read from the source files at once, bounds the memory of archiving
+BLOCK_RECORDS = 1 << 20
+# text files that are no numbers and stay as they are
+TEXT_NAMES = ("console",)
+
+CODECS = {
+    'zlib': (lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+    'lzma': (lambda data, level: lzma.compress(data, preset=6 if level is None else level), lzma.decompress),
+}
+
+
+def _shuffle(values):
+    # the n-th bytes of all float64 values next to each other: sign / exponent bytes of
+    # similar values are equal and compress much better than the interleaved values
+    return np.ascontiguousarray(values.astype(runstore.COLUMN_DTYPE).view(np.uint8).reshape(-1, 8).T).tobytes()
+
+
+def _unshuffle(data, count):
+    return np.frombuffer(data, dtype=np.uint8).reshape(8, count).T.copy().view(runstore.COLUMN_DTYPE).reshape(-1)
+
+
+def is_archive(data_root):
+    return os.path.exists(os.path.join(data_root, ARCHIVE))
+
+
+# WRITER -------------------------------------------------------------------------------------------------
+
+
+def _source_names(data_root):
+    if runstore.is_run_store(data_root):
+        return runstore.RunReader(data_root).names
+    names = sorted(name[:-len(".txt")] for name in os.listdir(data_root) if name.endswith(".txt"))
+    return [name for name in names if name.split("-")[-1] not in TEXT_NAMES]
+
+
+def _source_blocks(data_root, name):
+    # float64 arrays of at most about BLOCK_RECORDS values
+    if runstore.is_run_store(data_root):
+        column = runstore.RunReader(data_root).column(name)
+        for start in range(0, len(column), BLOCK_RECORDS):
+            yield np.array(column[start:start + BLOCK_RECORDS])
+        return
+    with open(os.path.join(data_root, name + ".txt"), 'rb') as file:
+        rest = b""
+        while True:
+            data = file.read(BLOCK_RECORDS * 8)
+            if len(data) == 0:
+                break
+            block = rest + data
+            end = block.rfind(b"\n") + 1
+            rest = block[end:]
+            if end > 0:
+                yield batchparse.parse_csv_block(block[:end], 1)[0][:, 0]
+        if len(rest.strip()) > 0:
+            yield batchparse.parse_csv_block(rest + b"\n", 1)[0][:, 0]
+
+
+def write_archive(data_root, codec='zlib', level=None, chunk_records=65536, remove_source=False):
+    """
+    Archives a finished run (text files or runstore columns) as <data_root>/archive.rla: every parameter in
+    compressed chunks of chunk_records values, with an index of the chunk offsets and, for time parameters,
+    the time bounds of every chunk. Chunk i of all parameters of a series holds the same records,
+    so a time range only needs the chunks overlapping it (see ArchiveReader.load_window).
+
+    :param data_root: directory of the run (for Server_GeneralLogger runs: the l<N> directory)
+    :param codec: 'zlib' or 'lzma'
+    :param level: compression level of the codec, None for its default
+    :param chunk_records: number of values per chunk
+    :param remove_source: delete the archived text / column files afterwards
+    :return: (size of the source files, size of the archive) in bytes
+    """
+    if codec not in CODECS:
+        raise Exception(f"write_archive: unknown codec {codec}, use one of {list(CODECS.keys())}")
+    compress = CODECS[codec][0]
+    names = _source_names(data_root)
+    path = os.path.join(data_root, ARCHIVE)
+    columns = {}
+
+    # written under another name first, a reader never sees half an archive
+    with open(path + ".tmp", 'wb') as file:
+        file.write(MAGIC)
+
+        def write_chunk(values, chunks):
+            data = compress(_shuffle(values), level)
+            entry = {'offset': file.tell(), 'size': len(data), 'records': len(values)}
+            if not np.isnan(values).all():
+                entry['min'] = float(np.nanmin(values))
+                entry['max'] = float(np.nanmax(values))
+            file.write(data)
+            chunks.append(entry)
+
+        for name in names:
+            chunks = []
+            pending = []
+            pending_count = 0
+            for block in _source_blocks(data_root, name):
+                pending.append(block)
+                pending_count += len(block)
+                if pending_count >= chunk_records:
+                    values = np.concatenate(pending)
+                    for start in range(0, len(values) - chunk_records + 1, chunk_records):
+                        write_chunk(values[start:start + chunk_records], chunks)
+                    rest = values[len(values) // chunk_records * chunk_records:]
+                    pending = [rest]
+                    pending_count = len(rest)
+            if pending_count > 0:
+                write_chunk(np.concatenate(pending), chunks)
+            columns[name] = {
+                'count': sum(chunk['records'] for chunk in chunks),
+                'time': runstore.is_time_name(name),
+                'chunks': chunks,
+            }
+
+        index_offset = file.tell()
+        file.write(json.dumps({
+            'version': ARCHIVE_VERSION,
+            'created': time.time(),
+            'codec': codec,
+            'chunk_records': chunk_records,
+            'columns': columns,
+        }).encode('utf-8'))
+        file.write(FOOTER.pack(index_offset, MAGIC))
+    os.replace(path + ".tmp", path)
+
+    source_size = 0
+    for name in names:
+        for source in _source_files(data_root, name):
+            source_size += os.path.getsize(source)
+            if remove_source:
+                os.remove(source)
+    if remove_source and runstore.is_run_store(data_root):
+        os.remove(os.path.join(data_root, runstore.MANIFEST))
+    return source_size, os.path.getsize(path)
+
+
+def _source_files(data_root, name):
+    # the files of a parameter, including the sidecars of timeslice, lod and parsecache
+    files = []
+    for suffix in [".txt", ".txt.idx.npz", runstore.COLUMN_SUFFIX, ".lod.npz"]:
+        source = os.path.join(data_root, name + suffix)
+        if os.path.exists(source):
+            files.append(source)
+    return files + parsecache.sidecar_paths(os.path.join(data_root, name + ".txt"))
+
+
+def archive_run(run_root, codec='zlib', level=None, remove_source=False):
+    """
+    archives a run directory and, for Server_GeneralLogger runs, each of its l<N> directories
+
+    :return: (size of the source files, size of the archives) in bytes
+    """
+    directories = [run_root] + [os.path.join(run_root, name) for name in sorted(os.listdir(run_root))
+                                if name.startswith("l") and name[1:].isdigit()]
+    total = [0, 0]
+    for directory in directories:
+        if len(_source_names(directory)) == 0:
+            continue
+        sizes = write_archive(directory, codec, level, remove_source=remove_source)
+        total[0] += sizes[0]
+        total[1] += sizes[1]
+    return total[0], total[1]
+
+
+# READER -------------------------------------------------------------------------------------------------
+
+
+class ArchiveReader:
+
+    def __init__(self, data_root):
+        """
+        reads the parameters of an archived run, only the chunks that are needed are decompressed
+
+        :param data_root: directory with the archive.rla
+        """
+        self.path = os.path.join(data_root, ARCHIVE)
+        with open(self.path, 'rb') as file:
+            file.seek(-FOOTER.size, os.SEEK_END)
+            index_offset, magic = FOOTER.unpack(file.read(FOOTER.size))
+            if magic != MAGIC:
+                raise Exception(f"ArchiveReader: {self.path} is no run archive")
+            file.seek(index_offset)
+            self.index = json.loads(file.read(os.path.getsize(self.path) - FOOTER.size - index_offset))
+        self.decompress = CODECS[self.index['codec']][1]
+
+    @property
+    def names(self):
+        return list(self.index['columns'].keys())
+
+    def count(self, name):
+        return self.index['columns'][name]['count']
+
+    def _chunks(self, name):
+        info = self.index['columns'].get(name)
+        if info is None:
+            raise Exception(f"ArchiveReader: no parameter {name} in {self.path}")
+        return info['chunks']
+
+    def time_bounds(self, name):
+        """
+        :return: (first, last) time of a time parameter, None if it has no values
+        """
+        chunks = [chunk for chunk in self._chunks(name) if 'min' in chunk]
+        if len(chunks) == 0:
+            return None
+        return chunks[0]['min'], chunks[-1]['max']
+
+    def chunks_between(self, time_name, t0=None, t1=None):
+        """
+        :return: (first chunk, end chunk) of the chunks of a time parameter overlapping [t0, t1]
+        """
+        chunks = self._chunks(time_name)
+        first = 0
+        end = len(chunks)
+        # chunks without a number in it are kept, they can't be placed
+        while first < end and t0 is not None and 'max' in chunks[first] and chunks[first]['max'] < t0:
+            first += 1
+        while end > first and t1 is not None and 'min' in chunks[end - 1] and chunks[end - 1]['min'] > t1:
+            end -= 1
+        return first, end
+
+    def read_chunks(self, name, first=0, end=None):
+        """
+        :return: float64 array with the values of the chunks first ... end - 1 of a parameter
+        """
+        chunks = self._chunks(name)[first:end]
+        if len(chunks) == 0:
+            return np.zeros(0)
+        arrays = []
+        with open(self.path, 'rb') as file:
+            for chunk in chunks:
+                file.seek(chunk['offset'])
+                arrays.append(_unshuffle(self.decompress(file.read(chunk['size'])), chunk['records']))
+        return np.concatenate(arrays)
+
+    def column(self, name):
+        return self.read_chunks(name)
+
+    def load_window(self, x_name, y_names, t0=None, t1=None):
+        """
+        :return: (x, [y, ...]) float64 arrays of the records with t0 <= x <= t1
+        """
+        first, end = self.chunks_between(x_name, t0, t1)
+        x = self.read_chunks(x_name, first, end)
+        ys = [self.read_chunks(name, first, end) for name in y_names]
+        length = min([len(x)] + [len(y) for y in ys])
+        mask = np.ones(length, dtype=bool)
+        if t0 is not None:
+            mask &= x[:length] >= t0
+        if t1 is not None:
+            mask &= x[:length] <= t1
+        return x[:length][mask], [y[:length][mask] for y in ys]
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(data_root, window=10.0):
+    """
+    archives lf-time / lf-e of a text run (e.g. the one written by the timeslice benchmark) with both codecs
+    and compares size and the time to read a window seconds slice
+    """
+    import shutil
+    import timeslice
+
+    for codec in CODECS.keys():
+        copy = os.path.join(data_root, "archive_" + codec)
+        os.makedirs(copy, exist_ok=True)
+        for name in ["lf-time", "lf-e"]:
+            shutil.copyfile(os.path.join(data_root, name + ".txt"), os.path.join(copy, name + ".txt"))
+        t0 = time.perf_counter()
+        source_size, archive_size = write_archive(copy, codec, remove_source=True)
+        t_write = time.perf_counter() - t0
+
+        reader = ArchiveReader(copy)
+        first, last = reader.time_bounds("lf-time")
+        middle = (first + last) / 2
+        t0 = time.perf_counter()
+        x, (y,) = reader.load_window("lf-time", ["lf-e"], middle, middle + window)
+        t_window = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        reader.column("lf-e")
+        t_full = time.perf_counter() - t0
+
+        x_text, (y_text,) = timeslice.load_window(data_root, "lf-time", ["lf-e"], middle, middle + window)
+        print(f"{codec}: {source_size / 1e6:.1f}MB text -> {archive_size / 1e6:.1f}MB in {t_write:.2f}s, "
+              f"{window:.0f}s window {t_window * 1000:.1f} ms ({len(x)} values, equal: "
+              f"{np.array_equal(x, x_text) and np.array_equal(y, y_text)}), whole lf-e {t_full * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+
+    # usage: python archive.py <run directory> [zlib | lzma] [remove]
+    #        python archive.py benchmark <directory with lf-time.txt / lf-e.txt>
+    if len(sys.argv) > 2 and sys.argv[1] == 'benchmark':
+        benchmark(sys.argv[2])
+    else:
+        sizes = archive_run(sys.argv[1], codec=sys.argv[2] if len(sys.argv) > 2 else 'zlib',
+                            remove_source='remove' in sys.argv[3:])
+        print(f"{sizes[0] / 1e6:.1f}MB -> {sizes[1] / 1e6:.1f}MB")
@@ -0,0 +1,272 @@
+import io
+import sys
+import time
+
+import numpy as np
+
+# characters a float written by str() or the robot can consist of
+NUMBER_CHARS = b"0123456789+-.eE"
+
+NEWLINE = ord("\n")
+SPACE_CHAR = ord(" ")
+ZERO_CHAR = ord("0")
+NINE_CHAR = ord("9")
+
+# lookup table indexed with the byte values of a block
+NUMBER = np.zeros(256, dtype=bool)
+NUMBER[list(NUMBER_CHARS + b" \t\r\n,;")] = True
+
+
+def to_float64(fields):
+    """
+    converts an array of byte strings to float64, fields that are no number (e.g. the 'E' placeholders
+    of test_client.Logger.log_specific_params) become NaN instead of raising
+
+    :param fields: numpy array of dtype S (any shape)
+    :return: (values, valid) float64 array and bool mask, both shaped like fields
+    """
+    try:
+        return fields.astype(np.float64), np.ones(fields.shape, dtype=bool)
+    except ValueError:
+        pass
+
+    # only fields made of number characters can be converted, everything else is masked right away
+    stripped = np.char.strip(fields)
+    valid = (np.char.str_len(stripped) > 0) & (np.char.str_len(np.char.translate(stripped, None, NUMBER_CHARS)) == 0)
+    values = np.full(fields.shape, np.nan)
+    try:
+        values[valid] = stripped[valid].astype(np.float64)
+    except ValueError:
+        # number characters in an impossible order ("1.2.3", "-"), rare enough to check one by one
+        for index in zip(*np.nonzero(valid)):
+            try:
+                values[index] = float(stripped[index])
+            except ValueError:
+                valid[index] = False
+    return values, valid
+
+
+def _parse_lines(lines, column_count, sep):
+    # slow path on arrays of lines for blocks the C parser refuses (empty fields, "1.2.3", ...)
+    values = np.full((len(lines), column_count), np.nan)
+    valid = np.zeros((len(lines), column_count), dtype=bool)
+    if len(lines) == 0:
+        return values, valid
+
+    shaped = np.char.count(lines, sep) == column_count - 1
+    fields = np.array(sep.join(lines[shaped].tolist()).split(sep))
+    if len(fields) == 0:
+        return values, valid
+    row_values, row_valid = to_float64(fields.reshape(-1, column_count))
+    values[shaped] = row_values
+    valid[shaped] = row_valid
+    return values, valid
+
+
+def _count(mask, start, end):
+    # number of True entries of mask in every range [start, end)
+    positions = np.flatnonzero(mask)
+    return np.searchsorted(positions, end) - np.searchsorted(positions, start)
+
+
+def _ranges(size, start, end):
+    # bool mask of length size that is True in every (non-overlapping) range [start, end)
+    marks = np.zeros(size + 1, dtype=np.int8)
+    marks[start] += 1
+    marks[end] -= 1
+    return np.cumsum(marks[:-1], dtype=np.int8) > 0
+
+
+def _loadtxt(block, sep):
+    return np.loadtxt(io.BytesIO(block), delimiter=sep.decode('ascii'), comments=None, ndmin=2, dtype=np.float64)
+
+
+def _lines(buf, prefix):
+    # line ends, start of the values behind the prefix and the lines of the stream that have values
+    newlines = np.flatnonzero(buf == NEWLINE)
+    line_start = np.r_[0, newlines[:-1] + 1]
+    selected = newlines - line_start >= len(prefix)
+    if len(prefix) > 0:
+        # the first len(prefix) bytes of every line at once
+        head = buf[np.minimum(line_start[:, None] + np.arange(len(prefix)), len(buf) - 1)]
+        selected &= (head == np.frombuffer(prefix, dtype=np.uint8)).all(axis=1)
+    value_start = np.minimum(line_start + len(prefix), newlines)
+    rows = selected & (_count(buf > SPACE_CHAR, value_start, newlines) > 0)
+    return newlines, value_start, rows
+
+
+def separator_counts(block, sep=b",", prefix=b""):
+    """
+    counts the separators of the lines parse_block returns rows for, e.g. to tell lines with a wrong number of values
+    from lines with 'E' placeholders (both are masked completely) or to find the column counts of a block
+
+    :param block: bytes with complete lines
+    :param sep: value separator (single byte)
+    :param prefix: only lines starting with prefix are counted
+    :return: int array with the number of separators of every row of parse_block(block, ..., sep, prefix)
+    """
+    if not block.endswith(b"\n"):
+        block += b"\n"
+    buf = np.frombuffer(block, dtype=np.uint8)
+    newlines, value_start, rows = _lines(buf, prefix)
+    return _count(buf == sep[0], value_start, newlines)[rows]
+
+
+def parse_block(block, column_count, sep=b",", prefix=b""):
+    """
+    parses lines of separated values with a known number of columns into a 2-D array.
+    Line borders, separator counts and invalid fields are found with array operations on the raw bytes,
+    the numbers are converted by the C parser of np.loadtxt, no Python code runs per line.
+
+    :param block: bytes with complete lines
+    :param column_count: number of values per line
+    :param sep: value separator (single byte)
+    :param prefix: only lines starting with prefix are parsed, the values follow the prefix
+    :return: (values, valid) float64 array and bool mask of shape (number of non-empty lines, column_count),
+             lines with a wrong number of values are masked completely
+    """
+    if len(block.strip()) == 0:
+        return np.zeros((0, column_count)), np.zeros((0, column_count), dtype=bool)
+    if not block.endswith(b"\n"):
+        block += b"\n"
+
+    # clean blocks of a single stream go to the C parser as they are
+    line_count = block.count(b"\n")
+    if len(prefix) == 0 or block.count(prefix) == line_count:
+        try:
+            values = _loadtxt(block.replace(prefix, b"") if len(prefix) > 0 else block, sep)
+            if values.shape == (line_count, column_count):
+                return values, np.ones(values.shape, dtype=bool)
+        except ValueError:
+            pass
+
+    buf = np.frombuffer(block, dtype=np.uint8)
+    # value lines of the stream (their values start behind the prefix) and lines with the right number of values
+    newlines, value_start, rows = _lines(buf, prefix)
+    shaped = rows & (_count(buf == sep[0], value_start, newlines) == column_count - 1)
+
+    values = np.full((np.count_nonzero(rows), column_count), np.nan)
+    valid = np.zeros(values.shape, dtype=bool)
+    if not shaped.any():
+        return values, valid
+    data = buf
+    if len(prefix) > 0 or not shaped.all():
+        data = buf[_ranges(len(buf), value_start[shaped], newlines[shaped] + 1)]
+
+    # fields without a digit or with characters no number has (e.g. 'E', empty fields) are replaced by "0" and masked
+    borders = np.flatnonzero((data == sep[0]) | (data == NEWLINE))
+    field_start = np.r_[0, borders[:-1] + 1]
+    digit = (data >= ZERO_CHAR) & (data <= NINE_CHAR)
+    bad = (_count(digit, field_start, borders) == 0) | (_count(~NUMBER[data], field_start, borders) > 0)
+    bad_fields = np.flatnonzero(bad)
+    if len(bad_fields) > 0:
+        length = borders[bad_fields] - field_start[bad_fields]
+        removed = np.cumsum(length) - length
+        characters = np.repeat(field_start[bad_fields] - removed, length) + np.arange(length.sum())
+        # after removing their characters the bad fields end right at the shifted border
+        data = np.insert(np.delete(data, characters), borders[bad_fields] - removed - length, ZERO_CHAR)
+
+    try:
+        shaped_values = _loadtxt(data.tobytes(), sep)
+        shaped_valid = np.ones(shaped_values.shape, dtype=bool)
+    except ValueError:
+        lines = np.array(data.tobytes().split(b"\n")[:-1])
+        shaped_values, shaped_valid = _parse_lines(lines, column_count, sep)
+    shaped_values.flat[bad_fields] = np.nan
+    shaped_valid.flat[bad_fields] = False
+
+    values[shaped[rows]] = shaped_values
+    valid[shaped[rows]] = shaped_valid
+    return values, valid
+
+
+def parse_csv_block(block, column_count=7):
+    """
+    parses the comma separated lines of Server_ColorSensorLogger (time, v1, v2, v3, e, i, d)
+    or of a Server_GeneralLogger value stream
+
+    :param block: bytes with complete lines
+    :param column_count: number of columns
+    :return: (values, valid) see parse_block
+    """
+    return parse_block(block, column_count, b",")
+
+
+def parse_named_block(block, names):
+    """
+    parses Server2 "name;name$value;value" lines of one stream (e.g. the lf-* names), lines of other streams are skipped
+
+    :param block: bytes with complete lines
+    :param names: parameter names of the stream
+    :return: (values, valid) see parse_block
+    """
+    prefix = ";".join(names).encode('ascii') + b"$"
+    return parse_block(block, len(names), b";", prefix)
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def _per_line_csv(block):
+    # what Server_ColorSensorLogger._receive_data does for every line
+    rows = []
+    for line in block.decode('ascii').split("\n"):
+        if len(line) == 0:
+            continue
+        params = line.split(",")
+        rows.append([float(param) for param in params])
+    return rows
+
+
+def _per_line_named(block):
+    # what Server2.RobotServer.receive_data did for every line
+    rows = []
+    for line in block.decode('ascii').split("\n"):
+        line = line.rstrip()
+        if len(line) == 0:
+            continue
+        _names, _values = line.split("$")
+        rows.append([float(value) for value in _values.split(";")])
+    return rows
+
+
+def benchmark(line_count=200000, repeat=3):
+    rng = np.random.default_rng(0)
+    data = rng.normal(0, 50, (line_count, 5))
+    data[:, 0] = 1.7e9 + np.arange(line_count) * 0.005
+
+    csv_block = "\n".join([",".join([str(value) for value in row] + ["0", "0"]) for row in data]).encode('ascii')
+    named_block = "\n".join(["lf-time;lf-e;lf-i;lf-d;lf-u$" + ";".join([str(value) for value in row])
+                             for row in data]).encode('ascii')
+
+    def best(func, *args):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    names = ["lf-time", "lf-e", "lf-i", "lf-d", "lf-u"]
+    for title, per_line, batch in [
+        ("csv (7 columns)", lambda: _per_line_csv(csv_block), lambda: parse_csv_block(csv_block, 7)),
+        ("names$values", lambda: _per_line_named(named_block), lambda: parse_named_block(named_block, names)),
+    ]:
+        t_line = best(per_line)
+        t_batch = best(batch)
+        print(f"{title:16s} {line_count} lines: per line {t_line * 1000:8.1f} ms   batch {t_batch * 1000:8.1f} ms"
+              f"   speedup {t_line / t_batch:4.1f}x")
+
+    # 1% of the lines with 'E' placeholders, as written by test_client.Logger.log_specific_params
+    broken = data.astype(str)
+    broken[::100, 2] = 'E'
+    broken_block = "\n".join([",".join(row) for row in broken]).encode('ascii')
+    t_batch = best(lambda: parse_csv_block(broken_block, 5))
+    values, valid = parse_csv_block(broken_block, 5)
+    print(f"{'csv with E':16s} {line_count} lines: batch {t_batch * 1000:8.1f} ms, "
+          f"{np.count_nonzero(~valid)} fields masked (per line parser raises ValueError)")
+
+
+if __name__ == "__main__":
+
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
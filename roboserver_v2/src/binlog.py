@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+import catalog
+import codec
+import runstore
+
+READ_SIZE = 1 << 20
+
+
+def read_records(path):
+    """
+    reads a log file written by dataio.BinaryFileIOHandler, up to the unused zeros behind the data
+
+    :param path: path of the log file
+    :return: generator of lists of (names, values) tuples, console messages as (("console",), (message,))
+    """
+    schemas = {}
+    with open(path, 'rb') as file:
+        buffer = file.read(READ_SIZE)
+        if buffer[:len(codec.MAGIC)] != codec.MAGIC:
+            if buffer[:codec.HEADER_SIZE] == bytes(codec.HEADER_SIZE):
+                # nothing was logged
+                return
+            raise Exception(f"read_records: {path} does not start with {codec.MAGIC}")
+        pos = len(codec.MAGIC)
+        while True:
+            records = []
+            pos = codec.decode_frames(buffer, pos, len(buffer), schemas, records)
+            if len(records) > 0:
+                yield records
+            if len(buffer) - pos >= codec.HEADER_SIZE and buffer[pos] == codec.KIND_END:
+                return
+            data = file.read(READ_SIZE)
+            if len(data) == 0:
+                return
+            buffer = buffer[pos:] + data
+            pos = 0
+
+
+def convert_log(path, data_root, columnar=True, robot_build=None):
+    """
+    stores the records of a dataio.BinaryFileIOHandler log file as a new run of a run catalog
+
+    :param path: path of the log file
+    :param data_root: run catalog directory
+    :param columnar: store the values as runstore columns instead of one text file per parameter
+    :param robot_build: version / name of the robot program, stored in the catalog index
+    :return: (run id, run directory)
+    """
+    run_catalog = catalog.RunCatalog(data_root)
+    run_id, run_root = run_catalog.new_run(robot_build, info={'source': os.path.abspath(path),
+                                                               'columnar': columnar})
+    store = runstore.RunStore(run_root) if columnar else None
+    files = {}
+    samples = {}
+
+    def text_file(name):
+        if name not in files:
+            files[name] = open(os.path.join(run_root, name + ".txt"), 'w')
+        return files[name]
+
+    for records in read_records(path):
+        # records of one stream are stored together
+        streams = {}
+        for names, values in records:
+            if names == codec.CONSOLE_NAMES:
+                text_file(names[0]).write(values[0] + "\n")
+                samples[names[0]] = samples.get(names[0], 0) + 1
+                continue
+            streams.setdefault(names, []).append(values)
+        for names, rows in streams.items():
+            columns = np.array(rows, dtype=np.float64).T
+            for i in range(len(names)):
+                samples[names[i]] = samples.get(names[i], 0) + len(rows)
+            if store is not None:
+                store.extend(names, list(columns))
+            else:
+                for i in range(len(names)):
+                    text_file(names[i]).write("".join(repr(value) + "\n" for value in columns[i].tolist()))
+
+    if store is not None:
+        store.close()
+    for file in files.values():
+        file.close()
+    run_catalog.finish_run(run_id, samples)
+    return run_id, run_root
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(directory, record_count=100000):
+    """
+    logs record_count lf-* records with dataio.FileIOHandler (a text file and a flush per value) and
+    with dataio.BinaryFileIOHandler, compares the time spent in the log calls and converts the binary log
+    """
+    import dataio
+
+    names = ["lf-time", "lf-e", "lf-i", "lf-d", "lf-u"]
+    os.makedirs(os.path.join(directory, "text"), exist_ok=True)
+
+    handler = dataio.FileIOHandler(os.path.join(directory, "text"))
+    t0 = time.perf_counter()
+    for i in range(record_count):
+        handler.log_params(names, [time.time(), 1.5, -2.25, 3.125, -4.0])
+    t_text = time.perf_counter() - t0
+    del handler
+
+    path = os.path.join(directory, "robot.log")
+    t0 = time.perf_counter()
+    # the loop logs much faster than the robot, the buffer has to hold what arrives between two polls
+    handler = dataio.BinaryFileIOHandler(path, buffer_size=1 << 20)
+    t_prealloc = time.perf_counter() - t0
+    handler.print("start")
+    t0 = time.perf_counter()
+    for i in range(record_count):
+        handler.log_params(names, [time.time(), 1.5, -2.25, 3.125, -4.0])
+    t_binary = time.perf_counter() - t0
+    handler.print("end")
+    handler.close()
+    print(f"{record_count} records: text files {t_text:.2f}s, binary log {t_binary:.2f}s "
+          f"(+{t_prealloc:.2f}s preallocating)")
+    print(handler.stats())
+
+    t0 = time.perf_counter()
+    run_id, run_root = convert_log(path, os.path.join(directory, "runs"))
+    reader = runstore.RunReader(run_root)
+    print(f"converted in {time.perf_counter() - t0:.2f}s: {reader.count('lf-e')} lf-e values in {run_root}")
+
+
+if __name__ == "__main__":
+
+    # usage: python binlog.py <log file> <catalog directory> [text]
+    #        python binlog.py benchmark <directory>
+    if len(sys.argv) > 2 and sys.argv[1] == 'benchmark':
+        benchmark(sys.argv[2])
+    else:
+        print(convert_log(sys.argv[1], sys.argv[2], columnar='text' not in sys.argv[3:])[1])
@@ -0,0 +1,278 @@
+import datetime
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import archive
+import runstore
+
+INDEX = "index.json"
+INDEX_VERSION = 1
+RUN_NAME_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class RetentionPolicy:
+
+    def __init__(self, max_runs=None, max_bytes=None, max_age=None, keep_latest=1):
+        """
+        which finished runs the catalog deletes, the oldest runs go first
+
+        :param max_runs: max number of runs kept, None for no limit
+        :param max_bytes: max size of all runs together in bytes, None for no limit
+        :param max_age: max age of a run in seconds, None for no limit
+        :param keep_latest: number of the newest runs that are never deleted
+        """
+        self.max_runs = max_runs
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep_latest = keep_latest
+
+
+def directory_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+
+class RunCatalog:
+
+    def __init__(self, root, retention=None):
+        """
+        Every session is written to its own run directory <root>/<YYYYmmdd-HHMMSS>, nothing is deleted on start.
+        <root>/index.json lists all runs with start / end time, parameters, sample counts, size and robot build,
+        so listing runs doesn't have to look into the run directories.
+        Runs are deleted according to the RetentionPolicy in a background thread.
+
+        :param root: directory of the catalog, created if it doesn't exist
+        :param retention: RetentionPolicy, None keeps all runs
+        """
+        self.root = root
+        self.retention = retention
+        os.makedirs(self.root, exist_ok=True)
+        self.lock = threading.Lock()
+        # runs of this process that are still written, never pruned
+        self.active = set()
+        self.prune_thread = None
+        self.runs = self._load_index()
+
+    # INDEX -----------------------------------------------------------------------------------------------
+
+    def _load_index(self):
+        path = os.path.join(self.root, INDEX)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as file:
+            return json.load(file)['runs']
+
+    def _write_index(self):
+        # called with the lock held
+        path = os.path.join(self.root, INDEX)
+        with open(path + ".tmp", 'w') as file:
+            json.dump({'version': INDEX_VERSION, 'runs': self.runs}, file, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def list_runs(self):
+        """
+        :return: list of the run entries of the index, oldest first
+        """
+        with self.lock:
+            self.runs = self._load_index()
+            return sorted(self.runs.values(), key=lambda run: run['start'])
+
+    def run_path(self, run_id):
+        return os.path.join(self.root, run_id)
+
+    def latest(self):
+        """
+        :return: directory of the newest run, None if there is none
+        """
+        runs = self.list_runs()
+        return None if len(runs) == 0 else self.run_path(runs[-1]['id'])
+
+    # RUNS ------------------------------------------------------------------------------------------------
+
+    def new_run(self, robot_build=None, info=None):
+        """
+        creates the directory of a new run and adds it to the index
+
+        :param robot_build: version / name of the program running on the robot
+        :param info: dict with additional information (e.g. host, port, wire format)
+        :return: (run id, run directory)
+        """
+        start = time.time()
+        name = datetime.datetime.fromtimestamp(start).strftime(RUN_NAME_FORMAT)
+        with self.lock:
+            self.runs = self._load_index()
+            run_id = name
+            i = 1
+            while run_id in self.runs or os.path.exists(self.run_path(run_id)):
+                run_id = f"{name}-{i}"
+                i += 1
+            os.makedirs(self.run_path(run_id))
+            self.runs[run_id] = {
+                'id': run_id,
+                'start': start,
+                'end': None,
+                'robot_build': robot_build,
+                'info': info if info is not None else {},
+                'parameters': [],
+                'samples': {},
+                'bytes': None,
+            }
+            self.active.add(run_id)
+            self._write_index()
+        self.prune()
+        return run_id, self.run_path(run_id)
+
+    def update_run(self, run_id, **fields):
+        with self.lock:
+            self.runs = self._load_index()
+            self.runs[run_id].update(fields)
+            self._write_index()
+
+    def finish_run(self, run_id, samples=None):
+        """
+        stores end time, parameters, sample counts and size of a run in the index
+
+        :param run_id: id returned by new_run
+        :param samples: dict {parameter name: number of values}
+        """
+        samples = samples if samples is not None else {}
+        self.update_run(run_id, end=time.time(), parameters=sorted(samples.keys()), samples=samples,
+                        bytes=directory_size(self.run_path(run_id)))
+        with self.lock:
+            self.active.discard(run_id)
+        self.prune()
+
+    # RETENTION -------------------------------------------------------------------------------------------
+
+    def prune(self):
+        """
+        deletes the runs the RetentionPolicy doesn't keep, in a background thread
+        """
+        if self.retention is None:
+            return
+        if self.prune_thread is not None and self.prune_thread.is_alive():
+            return
+        self.prune_thread = threading.Thread(target=self._prune, daemon=True)
+        self.prune_thread.start()
+
+    def expired_runs(self):
+        """
+        :return: ids of the runs the RetentionPolicy doesn't keep, oldest first
+        """
+        policy = self.retention
+        runs = self.list_runs()
+        candidates = runs[:max(0, len(runs) - policy.keep_latest)]
+        candidates = [run for run in candidates if run['id'] not in self.active]
+
+        now = time.time()
+        total = sum(run['bytes'] or 0 for run in runs)
+        count = len(runs)
+        expired = []
+        for run in candidates:
+            too_old = policy.max_age is not None and now - run['start'] > policy.max_age
+            too_many = policy.max_runs is not None and count > policy.max_runs
+            too_big = policy.max_bytes is not None and total > policy.max_bytes
+            if not (too_old or too_many or too_big):
+                continue
+            if run['end'] is None and not too_old:
+                # maybe still written by another server
+                continue
+            expired.append(run['id'])
+            count -= 1
+            total -= run['bytes'] or 0
+        return expired
+
+    def _prune(self):
+        for run_id in self.expired_runs():
+            # removed from the index first, so a half deleted run is never listed
+            with self.lock:
+                self.runs = self._load_index()
+                self.runs.pop(run_id, None)
+                self._write_index()
+            shutil.rmtree(self.run_path(run_id), ignore_errors=True)
+
+    def rebuild_index(self, source=None):
+        """
+        creates the index from the run directories, e.g. after the index file was lost
+        (start time from the directory name, samples from the runstore manifest, the archive index or the line count
+        of the text files)
+
+        :param source: RunCatalog with an index of the same runs (e.g. the catalog a converted copy was made of),
+                       defaults to this catalog; start / end time, robot build and info of its entries are kept
+        """
+        try:
+            previous = {run['id']: run for run in (self if source is None else source).list_runs()}
+        except (OSError, ValueError, KeyError):
+            # a broken index is rebuilt from the directories alone
+            previous = {}
+        runs = {}
+        for run_id in sorted(os.listdir(self.root)):
+            path = self.run_path(run_id)
+            if not os.path.isdir(path):
+                continue
+            try:
+                start = datetime.datetime.strptime(run_id[:15], RUN_NAME_FORMAT).timestamp()
+            except ValueError:
+                continue
+            samples = {}
+            if runstore.is_run_store(path):
+                reader = runstore.RunReader(path)
+                samples = {name: reader.count(name) for name in reader.names}
+            if archive.is_archive(path):
+                reader = archive.ArchiveReader(path)
+                samples = {name: reader.count(name) for name in reader.names}
+            for name in os.listdir(path):
+                if name.endswith(".txt"):
+                    with open(os.path.join(path, name), 'rb') as file:
+                        samples[name[:-4]] = file.read().count(b"\n")
+            entry = previous.get(run_id, {})
+            runs[run_id] = {
+                'id': run_id,
+                'start': entry.get('start', start),
+                'end': entry.get('end') or os.path.getmtime(path),
+                'robot_build': entry.get('robot_build'),
+                'info': entry.get('info', {}),
+                'parameters': sorted(samples.keys()),
+                'samples': samples,
+                'bytes': directory_size(path),
+            }
+        with self.lock:
+            self.runs = runs
+            self._write_index()
+
+
+def resolve_run(path):
+    """
+    :param path: run directory or catalog directory
+    :return: the run directory, the newest run for a catalog
+    """
+    if os.path.exists(os.path.join(path, INDEX)):
+        latest = RunCatalog(path).latest()
+        if latest is None:
+            raise Exception(f"resolve_run: catalog {path} has no runs")
+        return latest
+    return path
+
+
+if __name__ == "__main__":
+
+    # usage: python catalog.py <catalog directory> [rebuild]
+    catalog = RunCatalog(sys.argv[1])
+    if len(sys.argv) > 2 and sys.argv[2] == 'rebuild':
+        catalog.rebuild_index()
+    for run in catalog.list_runs():
+        duration = "running" if run['end'] is None else f"{run['end'] - run['start']:8.1f}s"
+        samples = sum(run['samples'].values())
+        size = "?" if run['bytes'] is None else f"{run['bytes'] / 1e6:.1f}MB"
+        print(f"{run['id']:20s} {duration:>9s} {len(run['parameters']):3d} parameters {samples:9d} samples "
+              f"{size:>8s}  build={run['robot_build']}")
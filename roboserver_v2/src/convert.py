@@ -0,0 +1,208 @@
+import concurrent.futures
+import os
+import re
+import shutil
+import sys
+import time
+
+import numpy as np
+
+import batchparse
+import catalog
+import runstore
+
+# bytes of a text file parsed at once, bounds the memory of a conversion
+BLOCK_SIZE = 1 << 22
+# text files copied as they are instead of being converted to float64
+TEXT_NAMES = ("console",)
+
+LAYOUT_SERVER2 = "server2"                  # <name>.txt, e.g. lf-time.txt
+LAYOUT_COLOR_SENSOR = "color_sensor"        # 1_time.txt, v1.txt, 2_v3.txt, ... of Server_ColorSensorLogger
+LAYOUT_GENERAL_LOGGER = "general_logger"    # l<N>/<i>_<name>.txt of Server_GeneralLogger
+
+LOGGER_DIRECTORY = re.compile(r"^l(\d+)$")
+FILE_NUMBER = re.compile(r"^\d+_")
+# gap report parameters of dataio.SeriesCounter, <prefix>-gap-time, <prefix>-dropped, ...
+REPORT_SUFFIXES = ("-gap-time", "-dropped", "-decimated", "-decimation")
+
+
+def _text_files(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.endswith(".txt") and os.path.isfile(os.path.join(directory, name)))
+
+
+def _logger_directories(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if LOGGER_DIRECTORY.match(name) and os.path.isdir(os.path.join(directory, name)))
+
+
+def run_columns(run_root):
+    """
+    :param run_root: directory of a text run
+    :return: (layout, [(series, parameter name, path), ...]), the parameters of one series were recorded together
+             and should have the same number of values
+    """
+    columns = []
+    loggers = _logger_directories(run_root)
+    if len(loggers) > 0:
+        for logger in loggers:
+            for file_name in _text_files(os.path.join(run_root, logger)):
+                name = logger + "-" + FILE_NUMBER.sub("", file_name[:-len(".txt")])
+                columns.append((logger, name, os.path.join(run_root, logger, file_name)))
+        return LAYOUT_GENERAL_LOGGER, columns
+
+    files = _text_files(run_root)
+    if "1_time.txt" in files:
+        for file_name in files:
+            columns.append(("color_sensor", FILE_NUMBER.sub("", file_name[:-len(".txt")]),
+                            os.path.join(run_root, file_name)))
+        return LAYOUT_COLOR_SENSOR, columns
+
+    for file_name in files:
+        name = file_name[:-len(".txt")]
+        columns.append((_series(name), name, os.path.join(run_root, file_name)))
+    return LAYOUT_SERVER2, columns
+
+
+def _series(name):
+    # the gap reports of a series are a series of their own, they have a value per gap and not per record
+    for suffix in REPORT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)] + "-gap-time"
+    return name.split("-")[0]
+
+
+def find_runs(root):
+    """
+    :param root: directory with runs of any of the text layouts, e.g. a data1 / data2 directory or a run catalog
+    :return: list of run directories, runs already stored as runstore are skipped
+    """
+    runs = []
+    for directory, dirs, files in os.walk(root):
+        if runstore.is_run_store(directory):
+            dirs[:] = []
+            continue
+        if len(_logger_directories(directory)) > 0 or any(name.endswith(".txt") for name in files):
+            runs.append(directory)
+            # the l<N> directories belong to this run
+            dirs[:] = [name for name in dirs if not LOGGER_DIRECTORY.match(name)]
+        dirs.sort()
+    return runs
+
+
+def _read_blocks(path):
+    # whole lines, at most about BLOCK_SIZE bytes each
+    with open(path, 'rb') as file:
+        rest = b""
+        while True:
+            data = file.read(BLOCK_SIZE)
+            if len(data) == 0:
+                break
+            block = rest + data
+            end = block.rfind(b"\n") + 1
+            rest = block[end:]
+            if end > 0:
+                yield block[:end]
+        if len(rest.strip()) > 0:
+            yield rest + b"\n"
+
+
+def convert_run(run_root, output_root, force=False):
+    """
+    converts a text run to a runstore.RunStore, one column after the other in blocks of BLOCK_SIZE bytes
+
+    :param run_root: directory of the text run
+    :param output_root: directory of the converted run, created if it doesn't exist
+    :param force: convert again if output_root already has a closed run store
+    :return: report dict with layout, counts and invalid values per parameter and the ragged series
+    """
+    t0 = time.time()
+    layout, columns = run_columns(run_root)
+    report = {'run': run_root, 'output': output_root, 'layout': layout, 'skipped': False}
+    if not force and runstore.is_run_store(output_root) and runstore.RunReader(output_root).closed:
+        report['skipped'] = True
+        return report
+
+    os.makedirs(output_root, exist_ok=True)
+    store = runstore.RunStore(output_root, info={'source': os.path.abspath(run_root), 'layout': layout})
+    counts = {}
+    invalid = {}
+    series = {}
+    for group, name, path in columns:
+        if name.split("-")[-1] in TEXT_NAMES:
+            shutil.copyfile(path, os.path.join(output_root, name + ".txt"))
+            continue
+        counts[name] = 0
+        invalid[name] = 0
+        series.setdefault(group, []).append(name)
+        for block in _read_blocks(path):
+            values, valid = batchparse.parse_csv_block(block, 1)
+            store.extend([name], [values[:, 0]])
+            counts[name] += len(values)
+            invalid[name] += int(len(valid) - np.count_nonzero(valid))
+
+    # parameters of a series with different numbers of values, the plots used to cut them silently
+    ragged = {}
+    for group, names in series.items():
+        lengths = {name: counts[name] for name in names}
+        if len(set(lengths.values())) > 1:
+            ragged[group] = lengths
+    store.info['ragged'] = ragged
+    store.close()
+
+    report.update({'counts': counts, 'invalid': invalid, 'ragged': ragged, 'seconds': time.time() - t0})
+    return report
+
+
+def convert_all(root, output, workers=None, force=False):
+    """
+    converts all text runs below root with a process pool, one run per process at a time
+
+    :param root: directory searched for text runs (see find_runs)
+    :param output: directory of the converted runs, same relative paths as below root
+    :param workers: number of processes, None for the number of CPUs
+    :param force: also convert runs that were converted before
+    :return: list of the reports of convert_run, {'run': run directory, 'error': message} for the runs that failed
+    """
+    runs = find_runs(root)
+    reports = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(convert_run, run, os.path.normpath(os.path.join(output, os.path.relpath(run, root))),
+                               force): run for run in runs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as error:
+                # a broken run doesn't stop the conversion of the others
+                report = {'run': futures[future], 'error': repr(error)}
+            print_report(report)
+            reports.append(report)
+
+    # the runs of a catalog stay a catalog, with robot build and info of the original index
+    for directory, dirs, files in os.walk(root):
+        if catalog.INDEX in files:
+            catalog.RunCatalog(os.path.join(output, os.path.relpath(directory, root))).rebuild_index(
+                catalog.RunCatalog(directory))
+    return reports
+
+
+def print_report(report):
+    if 'error' in report:
+        print(f"{report['run']}: failed, {report['error']}")
+        return
+    if report['skipped']:
+        print(f"{report['run']}: already converted")
+        return
+    records = sum(report['counts'].values())
+    invalid = sum(report['invalid'].values())
+    print(f"{report['run']}: {report['layout']}, {len(report['counts'])} parameters, {records} values "
+          f"({invalid} no number) in {report['seconds']:.2f}s -> {report['output']}")
+    for group, lengths in report['ragged'].items():
+        print(f"    ragged {group}: " + ", ".join(f"{name}={count}" for name, count in lengths.items()))
+
+
+if __name__ == "__main__":
+
+    # usage: python convert.py <directory with text runs> <output directory> [workers] [force]
+    convert_all(sys.argv[1], sys.argv[2], workers=int(sys.argv[3]) if len(sys.argv) > 3 else None,
+                force='force' in sys.argv[4:])
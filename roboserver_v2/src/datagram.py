@@ -0,0 +1,193 @@
+import socket
+import time
+
+import codec
+
+
+class DatagramStream:
+
+    def __init__(self, stream_id, reorder_window=8, max_delay=0.1):
+        """
+        Puts the datagrams of one stream back into order and keeps loss / reordering statistics.
+        Datagrams are held back until the gap before them is closed, but at most reorder_window datagrams
+        or max_delay seconds. After that the gap is counted as lost: fresh data is more important than complete data.
+
+        :param stream_id: stream id from the datagram header
+        :param reorder_window: max number of datagrams held back while waiting for a missing one
+        :param max_delay: max time in seconds a datagram is held back
+        """
+        self.stream_id = stream_id
+        self.reorder_window = reorder_window
+        self.max_delay = max_delay
+        self.names = None
+
+        self.next_seq = None
+        self.max_seq = None
+        self.pending = {}
+
+        # statistics
+        self.received = 0
+        self.delivered = 0
+        self.lost = 0
+        self.reordered = 0
+        self.late = 0
+        self.duplicates = 0
+
+    def add(self, seq, records, now):
+        """
+        :param seq: sequence number of the datagram
+        :param records: decoded records of the datagram
+        :param now: arrival time
+        :return: list of record lists that can be handed on, in order
+        """
+        self.received += 1
+        if self.names is None and len(records) > 0:
+            self.names = records[0][0]
+
+        if self.next_seq is None:
+            self.next_seq = seq
+            self.max_seq = seq
+
+        if seq <= self.reorder_window < self.next_seq - seq - self.reorder_window:
+            # a new stream starting far behind anything that could be a late datagram: the robot was restarted
+            self.next_seq = seq
+            self.max_seq = seq
+            self.pending = {}
+        if seq < self.next_seq:
+            # the gap was already given up on
+            self.late += 1
+            return []
+        if seq in self.pending:
+            self.duplicates += 1
+            return []
+        if seq < self.max_seq:
+            self.reordered += 1
+        else:
+            self.max_seq = seq
+
+        self.pending[seq] = (now, records)
+        return self.release(now)
+
+    def release(self, now):
+        """
+        hands on all datagrams that are in order, skips gaps that waited too long
+
+        :param now: current time
+        :return: list of record lists, in order
+        """
+        ready = []
+        while len(self.pending) > 0:
+            if self.next_seq in self.pending:
+                ready.append(self.pending.pop(self.next_seq)[1])
+                self.next_seq += 1
+                continue
+
+            oldest = min(self.pending.keys())
+            if len(self.pending) > self.reorder_window or now - self.pending[oldest][0] > self.max_delay:
+                self.lost += oldest - self.next_seq
+                self.next_seq = oldest
+            else:
+                break
+
+        self.delivered += len(ready)
+        return ready
+
+    def stats(self):
+        passed = self.delivered + self.lost
+        return {
+            'names': self.names,
+            'received': self.received,
+            'delivered': self.delivered,
+            'lost': self.lost,
+            'loss_rate': self.lost / passed if passed > 0 else 0.0,
+            'reordered': self.reordered,
+            'late': self.late,
+            'duplicates': self.duplicates,
+        }
+
+
+class DatagramReceiver:
+
+    def __init__(self, robot_host, robot_port, handle_values, local_port=0, reorder_window=8, max_delay=0.1,
+                 hello_period=1.0, report_period=5.0):
+        """
+        Receives the datagrams of a dataio.DatagramIOHandler.
+        As long as nothing arrives, a hello is sent to the robot every hello_period seconds,
+        so it doesn't matter whether robot or server is started first.
+
+        :param robot_host: IP of the EV3
+        :param robot_port: port the DatagramIOHandler is bound to
+        :param handle_values: function(names, values) called for every record, in order
+        :param local_port: local UDP port, 0 picks a free one
+        :param reorder_window: see DatagramStream
+        :param max_delay: see DatagramStream
+        :param hello_period: time in seconds without data after that a hello is sent
+        :param report_period: statistics are printed every report_period seconds, None to disable
+        """
+        self.robot_addr = (robot_host, robot_port)
+        self.handle_values = handle_values
+        self.reorder_window = reorder_window
+        self.max_delay = max_delay
+        self.hello_period = hello_period
+        self.report_period = report_period
+
+        self.streams = {}
+        self.running = True
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('', local_port))
+        self.sock.settimeout(max_delay)
+
+    def _dispatch(self, ready):
+        for records in ready:
+            for names, values in records:
+                self.handle_values(names, values)
+
+    def run(self):
+        last_data = None
+        last_hello = None
+        last_report = time.time()
+
+        while self.running:
+            now = time.time()
+            if last_data is None or now - last_data > self.hello_period:
+                if last_hello is None or now - last_hello > self.hello_period:
+                    self.sock.sendto(codec.HELLO, self.robot_addr)
+                    last_hello = now
+
+            try:
+                data, addr = self.sock.recvfrom(65536)
+            except socket.timeout:
+                data = None
+
+            now = time.time()
+            if data is not None:
+                last_data = now
+                stream_id, seq, records = codec.decode_datagram(data)
+                stream = self.streams.get(stream_id)
+                if stream is None:
+                    stream = DatagramStream(stream_id, self.reorder_window, self.max_delay)
+                    self.streams[stream_id] = stream
+                self._dispatch(stream.add(seq, records, now))
+
+            for stream in self.streams.values():
+                if len(stream.pending) > 0:
+                    self._dispatch(stream.release(now))
+
+            if self.report_period is not None and now - last_report > self.report_period:
+                last_report = now
+                self.print_stats()
+
+    def stats(self):
+        return {stream_id: stream.stats() for stream_id, stream in self.streams.items()}
+
+    def print_stats(self):
+        for stream_id, stats in self.stats().items():
+            names = "console" if stream_id == 0 else ";".join(stats['names'] or ())
+            print(f"stream {stream_id} ({names}): received={stats['received']} lost={stats['lost']} "
+                  f"({100 * stats['loss_rate']:.1f}%) reordered={stats['reordered']} late={stats['late']} "
+                  f"duplicates={stats['duplicates']}")
+
+    def close(self):
+        self.running = False
+        self.sock.close()
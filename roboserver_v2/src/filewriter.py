@@ -0,0 +1,265 @@
+import os
+import sys
+import threading
+import time
+
+
+class FlushPolicy:
+
+    def __init__(self, period=0.1, records=1000, on_event=True, buffer_size=1 << 20, fsync=False):
+        """
+        when the FileWriter thread writes its buffered data to disk, whatever happens first
+
+        :param period: max time in seconds data stays buffered, None for no limit
+        :param records: max number of records (see FileWriter.end_record) buffered, None for no limit
+        :param on_event: flush right after a write to an event file (e.g. console messages)
+        :param buffer_size: max number of buffered bytes
+        :param fsync: also os.fsync() the files on every flush (survives a power loss of the PC, much slower)
+        """
+        self.period = period
+        self.records = records
+        self.on_event = on_event
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+
+
+class WriterFile:
+
+    def __init__(self, writer, path, mode, event):
+        """
+        file like object returned by FileWriter.open, write() only buffers the data for the writer thread
+        """
+        self.writer = writer
+        self.path = path
+        self.event = event
+        self.text = 'b' not in mode
+        self.file = open(path, mode if not self.text else mode + 'b')
+        self.chunks = []
+
+    def write(self, data):
+        if self.text:
+            data = data.encode('utf-8')
+        self.writer.add(self, data)
+
+    def flush(self):
+        # the writer thread decides when data is written, see FlushPolicy
+        pass
+
+    def close(self):
+        self.writer.close_file(self)
+
+
+class FileWriter:
+
+    def __init__(self, policy=None, max_buffered=16 << 20, poll_period=0.5):
+        """
+        Writes the files of a server from its own thread, so a slow disk never blocks the socket thread
+        (and with it the TCP receive window and the robot). Writes are collected per file in memory and written
+        with one write() + flush() per file when the FlushPolicy says so.
+
+        :param policy: FlushPolicy, defaults to FlushPolicy()
+        :param max_buffered: max number of buffered bytes, the socket thread waits when the disk is that far behind
+        :param poll_period: max time in seconds the writer thread sleeps if the policy has no period
+        """
+        self.policy = policy if policy is not None else FlushPolicy()
+        self.max_buffered = max_buffered
+        self.poll_period = poll_period
+        self.files = []
+        self.closing = []
+        # only held for appending / swapping chunk lists, never while writing to disk
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+        # buffered since the last flush
+        self.pending_bytes = 0
+        self.pending_records = 0
+        self.oldest = None
+
+        # metrics
+        self.bytes_written = 0
+        self.records_written = 0
+        self.flushes = 0
+        self.max_buffered_bytes = 0
+        self.max_buffered_records = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.max_blocked = 0.0
+
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def open(self, path, mode='wb+', event=False):
+        """
+        :param path: path of the file
+        :param mode: mode as for open(), text modes take str in write()
+        :param event: a write to this file is an event (see FlushPolicy.on_event)
+        :return: WriterFile
+        """
+        file = WriterFile(self, path, mode, event)
+        with self.lock:
+            self.files.append(file)
+        return file
+
+    def add(self, file, data):
+        if self.pending_bytes > self.max_buffered:
+            self._wait_for_disk()
+        with self.lock:
+            file.chunks.append(data)
+            self.pending_bytes += len(data)
+            if self.oldest is None:
+                self.oldest = time.time()
+        if (file.event and self.policy.on_event) or self.pending_bytes >= self.policy.buffer_size:
+            self.wakeup.set()
+
+    def end_record(self, count=1):
+        """
+        marks the end of count records, used by the records limit of the FlushPolicy
+        """
+        with self.lock:
+            self.pending_records += count
+        if self.policy.records is not None and self.pending_records >= self.policy.records:
+            self.wakeup.set()
+
+    def _wait_for_disk(self):
+        t0 = time.time()
+        self.wakeup.set()
+        while self.pending_bytes > self.max_buffered and self.running:
+            time.sleep(0.001)
+        blocked = time.time() - t0
+        if blocked > self.max_blocked:
+            self.max_blocked = blocked
+
+    def close_file(self, file):
+        with self.lock:
+            self.closing.append(file)
+        self.wakeup.set()
+
+    def _due(self):
+        policy = self.policy
+        if self.oldest is not None and policy.period is not None and time.time() - self.oldest >= policy.period:
+            return True
+        if policy.records is not None and self.pending_records >= policy.records:
+            return True
+        return self.pending_bytes >= policy.buffer_size
+
+    def _loop(self):
+        while self.running:
+            timeout = self.poll_period
+            if self.oldest is not None and self.policy.period is not None:
+                timeout = max(0.0, self.oldest + self.policy.period - time.time())
+            # set by events, full buffers, the records limit and close
+            woken = self.wakeup.wait(timeout)
+            self.wakeup.clear()
+            if woken or self._due():
+                self._flush()
+        self._flush()
+
+    def _flush(self):
+        # swap the chunk lists, the socket thread continues with empty ones while this thread writes
+        with self.lock:
+            files = [(file, file.chunks) for file in self.files if len(file.chunks) > 0]
+            for file, chunks in files:
+                file.chunks = []
+            closing = self.closing
+            self.closing = []
+            for file in closing:
+                self.files.remove(file)
+            n_bytes = self.pending_bytes
+            n_records = self.pending_records
+            if n_bytes > self.max_buffered_bytes:
+                self.max_buffered_bytes = n_bytes
+            if n_records > self.max_buffered_records:
+                self.max_buffered_records = n_records
+            self.pending_records = 0
+            self.oldest = None
+
+        t0 = time.time()
+        for file, chunks in files:
+            file.file.write(b"".join(chunks))
+            file.file.flush()
+            if self.policy.fsync:
+                os.fsync(file.file.fileno())
+        for file in closing:
+            file.file.close()
+
+        with self.lock:
+            self.pending_bytes -= n_bytes
+
+        if len(files) > 0:
+            latency = time.time() - t0
+            self.last_flush_latency = latency
+            if latency > self.max_flush_latency:
+                self.max_flush_latency = latency
+            self.flushes += 1
+        self.bytes_written += n_bytes
+        self.records_written += n_records
+
+    def stats(self):
+        return {
+            'buffered_records': self.pending_records,
+            'buffered_bytes': self.pending_bytes,
+            'max_buffered_records': self.max_buffered_records,
+            'max_buffered_bytes': self.max_buffered_bytes,
+            'bytes_written': self.bytes_written,
+            'records_written': self.records_written,
+            'flushes': self.flushes,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.max_flush_latency,
+            'max_blocked': self.max_blocked,
+        }
+
+    def close(self):
+        """
+        writes everything that is buffered, closes all files and stops the writer thread
+        """
+        if not self.running:
+            return
+        with self.lock:
+            self.closing.extend(self.files)
+        self.running = False
+        self.wakeup.set()
+        self.thread.join()
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(directory, record_count=100000):
+    """
+    writes record_count records of 5 values with a flush per value (like the servers did)
+    and through a FileWriter, and compares the time the socket thread is busy
+    """
+    names = ["lf-time", "lf-e", "lf-i", "lf-d", "lf-u"]
+    rows = [[str(time.time() + i * 0.005), "1.5", "-2.25", "3.125", "-4.0"] for i in range(record_count)]
+    os.makedirs(directory, exist_ok=True)
+
+    files = [open(os.path.join(directory, name + ".txt"), 'wb+') for name in names]
+    t0 = time.perf_counter()
+    for row in rows:
+        for i in range(len(names)):
+            files[i].write(row[i].encode('utf-8'))
+            files[i].write(b"\n")
+            files[i].flush()
+    t_inline = time.perf_counter() - t0
+    for file in files:
+        file.close()
+
+    writer = FileWriter()
+    files = [writer.open(os.path.join(directory, name + ".txt")) for name in names]
+    t0 = time.perf_counter()
+    for row in rows:
+        for i in range(len(names)):
+            files[i].write(row[i].encode('utf-8') + b"\n")
+        writer.end_record()
+    t_queued = time.perf_counter() - t0
+    writer.close()
+
+    print(f"{record_count} records: flush per value {t_inline:.2f}s, writer thread {t_queued:.2f}s in the socket thread")
+    print(writer.stats())
+
+
+if __name__ == "__main__":
+
+    # usage: python filewriter.py <directory>
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else "writer_benchmark")
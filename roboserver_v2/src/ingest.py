@@ -0,0 +1,501 @@
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+import batchparse
+import codec
+
+# wire formats
+FORMAT_TEXT = 'text'  # Server2 / dataio.NetworkIOHandler: "name;name$value;value" lines
+FORMAT_BINARY = 'binary'  # dataio.BinaryNetworkIOHandler: codec.py frames
+FORMAT_CSV_HEADER = 'csv-header'  # Server_GeneralLogger / test_client: header line, then comma separated values
+FORMAT_CSV = 'csv'  # Server_ColorSensorLogger: comma separated values without header (time, v1, v2, v3, e, i, d)
+FORMAT_CHANNELS = 'channels'  # test_client.ChannelConnection: "#<id>,name,name" headers, "<id>,value,value" lines
+FORMAT_AUTO = 'auto'  # detected from the first bytes of the stream
+
+# column names of the Server_ColorSensorLogger lines
+COLOR_SENSOR_NAMES = ("time", "v1", "v2", "v3", "e", "i", "d")
+
+# a stream whose first line is longer than this is not one of the formats
+MAX_SNIFF = 4096
+
+
+# PARSERS ------------------------------------------------------------------------------------------------
+
+
+# names of the Server2 line streams in a block, console messages and ChannelConnection headers
+STREAM_NAMES = re.compile(rb"^([^$\n]*)\$", re.M)
+CONSOLE_LINE = re.compile(rb"^console\$([^\n]*)", re.M)
+CHANNEL_HEADER = re.compile(rb"^#(\d+),([^\n]*)", re.M)
+
+
+def _complete_lines(buffer, data):
+    # the complete lines received so far, the incomplete rest stays in the buffer
+    buffer.extend(data)
+    end = buffer.rfind(b"\n")
+    if end == -1:
+        return None
+    block = bytes(buffer[:end + 1])
+    del buffer[:end + 1]
+    return block
+
+
+def _add_block(blocks, names, block, sep, prefix=b"", counts=None):
+    """
+    parses the lines of one stream of a block at once (see batchparse.parse_block) and adds its columns to blocks,
+    lines with a wrong number of values are dropped, values that are no number (e.g. 'E') become NaN
+
+    :param counts: batchparse.separator_counts of the block if they are known already
+    """
+    values, valid = batchparse.parse_block(block, len(names), sep, prefix)
+    if not valid.all():
+        # lines with a wrong number of values are masked completely, like lines of 'E' placeholders
+        if counts is None:
+            counts = batchparse.separator_counts(block, sep, prefix)
+        values = values[counts == len(names) - 1]
+    if len(values) > 0:
+        # one contiguous array per parameter
+        blocks.append((names, list(np.ascontiguousarray(values.T))))
+
+
+class TextParser:
+
+    def __init__(self):
+        """
+        incremental parser for "name;name$value;value" lines
+        """
+        self.buffer = bytearray()
+        # the same name lists arrive in every block, only split them once
+        self.names = {}
+
+    def feed(self, data):
+        block = _complete_lines(self.buffer, data)
+        if block is None:
+            return []
+
+        blocks = []
+        # every stream of the block, in the order they first appear
+        for _names in dict.fromkeys(STREAM_NAMES.findall(block)):
+            if _names == b"console":
+                messages = [message.decode('ascii', errors='replace').rstrip()
+                            for message in CONSOLE_LINE.findall(block)]
+                blocks.append((codec.CONSOLE_NAMES, [messages]))
+                continue
+            names = self.names.get(_names)
+            if names is None:
+                names = tuple(_names.decode('ascii', errors='replace').split(";"))
+                self.names[_names] = names
+            _add_block(blocks, names, block, b";", _names + b"$")
+        return blocks
+
+
+class HeaderCsvParser:
+
+    def __init__(self):
+        """
+        incremental parser for a header line with the parameter names followed by comma separated value lines
+        """
+        self.buffer = bytearray()
+        self.names = None
+
+    def feed(self, data):
+        block = _complete_lines(self.buffer, data)
+        if block is None:
+            return []
+
+        if self.names is None:
+            block = block.lstrip()
+            if len(block) == 0:
+                return []
+            header, _, block = block.partition(b"\n")
+            self.names = tuple(header.decode('ascii', errors='replace').rstrip().split(","))
+        blocks = []
+        _add_block(blocks, self.names, block, b",")
+        return blocks
+
+
+class CsvParser:
+
+    def __init__(self):
+        """
+        incremental parser for comma separated value lines without header, the names are
+        COLOR_SENSOR_NAMES for lines of 7 values and "column<i>" otherwise
+        """
+        self.buffer = bytearray()
+        self.names = {}
+
+    def feed(self, data):
+        block = _complete_lines(self.buffer, data)
+        if block is None:
+            return []
+
+        blocks = []
+        counts = batchparse.separator_counts(block, b",")
+        # a block per number of values, usually there is only one
+        for count in np.unique(counts).tolist():
+            names = self.names.get(count + 1)
+            if names is None:
+                if count + 1 == len(COLOR_SENSOR_NAMES):
+                    names = COLOR_SENSOR_NAMES
+                else:
+                    names = tuple(f"column{i}" for i in range(count + 1))
+                self.names[count + 1] = names
+            _add_block(blocks, names, block, b",", counts=counts)
+        return blocks
+
+
+class ChannelParser:
+
+    def __init__(self):
+        """
+        incremental parser for the lines of a test_client.ChannelConnection.
+        The names of channel <id> are prefixed with "l<id>-", so the loggers stay apart like the l<id> directories
+        of Server_GeneralLogger.
+        """
+        self.buffer = bytearray()
+        self.names = {}
+
+    def feed(self, data):
+        block = _complete_lines(self.buffer, data)
+        if block is None:
+            return []
+
+        # the headers come before the values of their channel
+        for channel_id, header in CHANNEL_HEADER.findall(block):
+            _id = channel_id.decode('ascii')
+            self.names[channel_id] = tuple(f"l{_id}-{name}"
+                                           for name in header.decode('ascii', errors='replace').rstrip().split(","))
+        blocks = []
+        for channel_id, names in self.names.items():
+            _add_block(blocks, names, block, b",", channel_id + b",")
+        return blocks
+
+
+class BinaryParser:
+
+    def __init__(self):
+        """
+        codec.Decoder handing on blocks like the text parsers: successive records of the same stream become one block
+        """
+        self.decoder = codec.Decoder()
+
+    def feed(self, data):
+        groups = []
+        for names, values in self.decoder.feed(data):
+            if len(groups) > 0 and groups[-1][0] == names:
+                groups[-1][1].append(values)
+            else:
+                groups.append((names, [values]))
+
+        blocks = []
+        for names, rows in groups:
+            if names == codec.CONSOLE_NAMES:
+                blocks.append((names, [[row[0] for row in rows]]))
+            else:
+                blocks.append((names, list(np.array(rows, dtype=np.float64).T.copy())))
+        return blocks
+
+
+def _is_number(string):
+    try:
+        float(string)
+        return True
+    except ValueError:
+        return False
+
+
+def detect_format(head):
+    """
+    finds the wire format from the first bytes of a stream
+
+    :param head: first bytes received
+    :return: one of the FORMAT_* constants, None if more bytes are needed
+    """
+    if head[:len(codec.MAGIC)] == codec.MAGIC:
+        return FORMAT_BINARY
+    if len(head) < len(codec.MAGIC) and codec.MAGIC.startswith(head):
+        return None
+
+    end = head.find(b"\n")
+    if end == -1:
+        if len(head) > MAX_SNIFF:
+            raise Exception("detect_format: no line break in the first " + str(MAX_SNIFF) + " bytes, unknown format")
+        return None
+
+    line = bytes(head[:end]).decode('ascii', errors='replace').rstrip()
+    if "$" in line:
+        return FORMAT_TEXT
+    first = line.split(",")[0]
+    if first.startswith("#") and first[1:].isdigit():
+        return FORMAT_CHANNELS
+    if all(_is_number(value) for value in line.split(",")):
+        return FORMAT_CSV
+    return FORMAT_CSV_HEADER
+
+
+class AutoParser:
+
+    def __init__(self):
+        """
+        buffers the first bytes of a stream until its format is known (see detect_format),
+        then hands everything to the parser of that format
+        """
+        self.buffer = bytearray()
+        self.format = None
+        self.parser = None
+
+    def feed(self, data):
+        if self.parser is not None:
+            return self.parser.feed(data)
+
+        self.buffer.extend(data)
+        self.format = detect_format(self.buffer)
+        if self.format is None:
+            return []
+        self.parser = PARSERS[self.format]()
+        data = bytes(self.buffer)
+        self.buffer = None
+        return self.parser.feed(data)
+
+
+# every parser has feed(data) returning a list of blocks (names, columns) of the complete records received:
+# names is a tuple of str, columns a float64 array per name with the values of the block (NaN for values that are
+# no number), console messages have the names codec.CONSOLE_NAMES and a list of the message str as only column
+PARSERS = {
+    FORMAT_TEXT: TextParser,
+    FORMAT_BINARY: BinaryParser,
+    FORMAT_CSV_HEADER: HeaderCsvParser,
+    FORMAT_CSV: CsvParser,
+    FORMAT_CHANNELS: ChannelParser,
+    FORMAT_AUTO: AutoParser,
+}
+
+
+# INGEST SERVER ------------------------------------------------------------------------------------------
+
+
+class EndpointStats:
+
+    def __init__(self, name, fmt):
+        self.name = name
+        self.format = fmt
+        self.connected = False
+        self.bytes = 0
+        self.records = 0
+        self.connects = 0
+        # connections closed because of data that couldn't be parsed (or a failing sink)
+        self.errors = 0
+        self.last_error = None
+
+    def __repr__(self):
+        return (f"{self.name}: format={self.format} connected={self.connected} bytes={self.bytes} "
+                f"records={self.records} errors={self.errors}")
+
+
+class IngestServer:
+
+    def __init__(self, read_size=65536, retry_period=1.0):
+        """
+        Receives the data of many robots / loggers in a single asyncio event loop instead of one thread per connection.
+        Every connection gets its own incremental parser, the parsed records are handed to a sink function
+        sink(names, columns) a block at a time, e.g. Server2.RobotServer(..., start=False).handle_columns.
+
+        :param read_size: max bytes read from a connection at once
+        :param retry_period: time in seconds between connection attempts while a robot isn't listening yet
+        """
+        self.read_size = read_size
+        self.retry_period = retry_period
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        self.servers = []
+        # the event loop only keeps weak references to its tasks, without these a connection task can be
+        # garbage collected while it waits for data
+        self.tasks = []
+        self.stats = {}
+
+    def _submit(self, coro):
+        # works before and after the loop was started
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        self.tasks.append(future)
+        return future
+
+    def connect(self, host, port, sink, fmt=FORMAT_AUTO, on_close=None):
+        """
+        connects to a robot that is listening (dataio.NetworkIOHandler, test_client.Logger_NetworkConnection)
+
+        :param host: IP of the robot
+        :param port: port of the robot
+        :param sink: function(names, columns) called for every block of records (see PARSERS)
+        :param fmt: one of the FORMAT_* constants, FORMAT_AUTO detects it from the first bytes
+        :param on_close: function() called once the connection is closed, also after an error,
+                         e.g. Server2.RobotServer.finish
+        :return: EndpointStats of the connection
+        """
+        stats = EndpointStats(f"{host}:{port}", fmt)
+        self.stats[stats.name] = stats
+        self._submit(self._connect(host, port, sink, fmt, stats, on_close))
+        return stats
+
+    def listen(self, host, port, sink_factory, fmt=FORMAT_AUTO, on_close=None):
+        """
+        accepts connections of robots that connect to the server
+
+        :param host: local address to listen on
+        :param port: local port
+        :param sink_factory: function(peer) returning the sink for a new connection, peer is "ip:port"
+        :param fmt: one of the FORMAT_* constants, FORMAT_AUTO detects it from the first bytes
+        :param on_close: function(peer) called once a connection is closed, also after an error
+        """
+        self._submit(self._listen(host, port, sink_factory, fmt, on_close))
+
+    async def _connect(self, host, port, sink, fmt, stats, on_close):
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                break
+            except OSError:
+                await asyncio.sleep(self.retry_period)
+        await self._read(reader, writer, sink, PARSERS[fmt](), stats, on_close)
+
+    async def _listen(self, host, port, sink_factory, fmt, on_close):
+        async def accepted(reader, writer):
+            peer = writer.get_extra_info('peername')
+            stats = EndpointStats(f"{peer[0]}:{peer[1]}", fmt)
+            self.stats[stats.name] = stats
+            await self._read(reader, writer, sink_factory(stats.name), PARSERS[fmt](), stats,
+                             None if on_close is None else lambda: on_close(stats.name))
+
+        self.servers.append(await asyncio.start_server(accepted, host, port))
+
+    async def _read(self, reader, writer, sink, parser, stats, on_close=None):
+        stats.connected = True
+        stats.connects += 1
+        try:
+            while True:
+                data = await reader.read(self.read_size)
+                if len(data) == 0:
+                    break
+                stats.bytes += len(data)
+                blocks = parser.feed(data)
+                if stats.format == FORMAT_AUTO and parser.format is not None:
+                    stats.format = parser.format
+                for names, columns in blocks:
+                    stats.records += len(columns[0])
+                    sink(names, columns)
+        except OSError:
+            pass
+        except Exception as error:
+            # malformed input: only this connection is closed, the event loop keeps serving the others
+            stats.errors += 1
+            stats.last_error = repr(error)
+            print(f"IngestServer: closing {stats.name} after {stats.records} records, {error!r}")
+        finally:
+            stats.connected = False
+            writer.close()
+            if on_close is not None:
+                on_close()
+
+    def start(self):
+        """
+        runs the event loop in a background thread, so the main thread stays free for matplotlib
+        """
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        self.loop.run_forever()
+
+    def stop(self):
+        for server in self.servers:
+            self.loop.call_soon_threadsafe(server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(robot_count=10, frequency=200, duration=5.0, first_port=65440):
+    """
+    starts robot_count simulated robots sending lf-* records at the given frequency (text format)
+    and measures how much CPU time ingesting all of them costs
+    """
+    import socket
+
+    def robot(port):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(('127.0.0.1', port))
+        s.listen(1)
+        conn, addr = s.accept()
+        s.close()
+        period = 1.0 / frequency
+        t = time.time()
+        t_end = t + duration
+        while t < t_end:
+            line = f"lf-time;lf-e;lf-i;lf-d;lf-u${t};{-3.2};{12.4};{55.1};{-80.7}\n"
+            conn.send(line.encode('ascii'))
+            t += period
+            delta = t - time.time()
+            if delta > 0:
+                time.sleep(delta)
+        conn.close()
+
+    robots = [threading.Thread(target=robot, args=(first_port + i,)) for i in range(robot_count)]
+    for thread in robots:
+        thread.start()
+
+    counted = [0]
+
+    def sink(names, columns):
+        counted[0] += len(columns[0])
+
+    server = IngestServer(retry_period=0.05)
+    for i in range(robot_count):
+        server.connect('127.0.0.1', first_port + i, sink)
+
+    cpu0 = time.process_time()
+    server.start()
+    for thread in robots:
+        thread.join()
+    time.sleep(0.5)
+    cpu = time.process_time() - cpu0
+    server.stop()
+
+    expected = robot_count * frequency * duration
+    print(f"{robot_count} robots at {frequency} Hz: received {counted[0]} of {expected:.0f} records, "
+          f"{cpu:.2f}s CPU for {duration:.1f}s of data (includes the simulated robots)")
+
+
+if __name__ == "__main__":
+
+    # usage: python ingest.py [format] host:port [host:port ...]    (format defaults to auto)
+    #        python ingest.py benchmark
+    args = sys.argv[1:]
+    if len(args) == 1 and args[0] == 'benchmark':
+        benchmark()
+        sys.exit(0)
+
+    import Server2
+
+    fmt = FORMAT_AUTO
+    if len(args) > 0 and args[0] in PARSERS:
+        fmt = args[0]
+        args = args[1:]
+
+    ingest = IngestServer()
+    for endpoint in args:
+        host, port = endpoint.split(":")
+        sink = Server2.RobotServer(host, int(port), data_root=os.path.join(Server2.DATA_ROOT, f"{host}_{port}"),
+                                   binary=fmt == FORMAT_BINARY, start=False)
+        ingest.connect(host, int(port), sink.handle_columns, fmt, on_close=sink.finish)
+
+    ingest.start()
+    while True:
+        time.sleep(5)
+        for stats in ingest.stats.values():
+            print(stats)
@@ -0,0 +1,262 @@
+import sys
+import time
+
+import matplotlib.pyplot as plt
+
+import numpy as np
+
+# part of the window added in front of the newest x when the x axis scrolls, the axes are redrawn
+# only once per SCROLL_MARGIN * window seconds instead of every frame
+SCROLL_MARGIN = 0.25
+# part of the value range added above and below when the y axis grows
+Y_MARGIN = 0.25
+
+
+def decimate(x, y, x0, x1, pixels):
+    """
+    Reduces a line to the samples with the min and max value of every pixel column of [x0, x1], in their order.
+    The drawn line looks the same (spikes stay visible) but has at most 2 * pixels points, however many
+    samples the window holds.
+
+    :param x: sorted x values
+    :param y: y values
+    :param x0: left x limit of the axes
+    :param x1: right x limit of the axes
+    :param pixels: width of the axes in pixels
+    :return: (x, y), unchanged if there are no more samples than points
+    """
+    pixels = int(pixels)
+    if len(x) <= 2 * pixels or pixels < 1 or not x1 > x0:
+        return x, y
+    # the sample on each side of the window keeps the line running into the edge of the axes
+    first = max(int(np.searchsorted(x, x0, side='left')) - 1, 0)
+    end = min(int(np.searchsorted(x, x1, side='right')) + 1, len(x))
+    x = x[first:end]
+    y = y[first:end]
+    if len(x) <= 2 * pixels:
+        return x, y
+
+    columns = np.clip(((x - x0) * (pixels / (x1 - x0))).astype(np.int64), -1, pixels)
+    starts = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+    counts = np.diff(np.r_[starts, len(x)])
+    low = np.repeat(np.fmin.reduceat(y, starts), counts)
+    high = np.repeat(np.fmax.reduceat(y, starts), counts)
+    index = np.arange(len(x))
+    # first sample of every column with its min / max, the start of the column if it only has NaN
+    i_min = np.minimum.reduceat(np.where(y == low, index, len(x)), starts)
+    i_max = np.minimum.reduceat(np.where(y == high, index, len(x)), starts)
+    i_min = np.where(i_min == len(x), starts, i_min)
+    i_max = np.where(i_max == len(x), starts, i_max)
+
+    selected = np.empty(2 * len(starts), dtype=np.int64)
+    selected[0::2] = np.minimum(i_min, i_max)
+    selected[1::2] = np.maximum(i_min, i_max)
+    return x[selected], y[selected]
+
+
+class LivePanel:
+
+    def __init__(self, axes, line, data, window, xlim, ylim):
+        """
+        one line of a BlitAnimator, see BlitAnimator.add
+        """
+        self.axes = axes
+        self.line = line
+        self.data = data
+        self.window = window
+        self.xlim = xlim
+        self.ylim = ylim
+
+
+class BlitAnimator:
+
+    def __init__(self, fig, interval=1 / 30, decimation=True):
+        """
+        Live plotting with persistent lines: every frame only calls set_data() and draws the lines over a cached
+        background (axes, ticks, labels) with blitting. The whole figure is only drawn again when data leaves the
+        axis limits, the window is resized or the user zooms, so a frame costs the same for any number of points
+        and the receiver thread keeps the GIL most of the time.
+
+        :param fig: matplotlib figure with the axes
+        :param interval: time in seconds between two frames
+        :param decimation: draw only the min / max samples of every pixel column (see decimate), so the cost of
+                           a frame doesn't grow with the sample rate
+        """
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.interval = interval
+        self.decimation = decimation
+        self.panels = []
+        self.background = None
+
+        # metrics
+        self.frames = 0
+        self.full_draws = 0
+        self.last_frame_time = 0.0
+        self.max_frame_time = 0.0
+
+        # every full draw (resize, zoom, rescale) gives a new background
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.timer = self.canvas.new_timer(interval=int(interval * 1000))
+        self.timer.add_callback(self.update)
+
+    def add(self, axes, data, window=None, xlim=None, ylim=None, **line_kwargs):
+        """
+        :param axes: matplotlib axes of the line
+        :param data: function returning the current (x, y) arrays, called once per frame
+        :param window: width in seconds of the visible x range that scrolls with the newest x, None for all data
+        :param xlim: fixed x limits, None to follow the data
+        :param ylim: fixed y limits, None to grow with the data
+        :return: the Line2D
+        """
+        line, = axes.plot([], [], animated=True, **line_kwargs)
+        if xlim is not None:
+            axes.set_xlim(xlim)
+        if ylim is not None:
+            axes.set_ylim(ylim)
+        self.panels.append(LivePanel(axes, line, data, window, xlim, ylim))
+        return line
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for panel in self.panels:
+            panel.axes.draw_artist(panel.line)
+
+    def _rescale(self, panel, x, y):
+        # True if the limits of the axes had to change
+        changed = False
+        axes = panel.axes
+        if panel.xlim is None and len(x) > 0 and np.isfinite(x[-1]):
+            x0, x1 = axes.get_xlim()
+            first = x[0] if panel.window is None else x[-1] - panel.window
+            if x[-1] > x1 or first < x0 - (x1 - x0):
+                width = x[-1] - first if panel.window is None else panel.window
+                axes.set_xlim(first, x[-1] + max(width, 1e-9) * SCROLL_MARGIN)
+                changed = True
+        if panel.ylim is None and np.isfinite(y).any():
+            low = float(np.nanmin(y))
+            high = float(np.nanmax(y))
+            y0, y1 = axes.get_ylim()
+            if low < y0 or high > y1:
+                margin = (high - low) * Y_MARGIN if high > low else 1.0
+                axes.set_ylim(low - margin, high + margin)
+                changed = True
+        return changed
+
+    def update(self):
+        """
+        draws one frame, called by the timer
+        """
+        t0 = time.perf_counter()
+        rescale = False
+        for panel in self.panels:
+            x, y = panel.data()
+            length = min(len(x), len(y))
+            x = x[:length]
+            y = y[:length]
+            rescale = self._rescale(panel, x, y) or rescale
+            if self.decimation:
+                x0, x1 = panel.axes.get_xlim()
+                x, y = decimate(x, y, x0, x1, panel.axes.bbox.width)
+            panel.line.set_data(x, y)
+
+        if rescale or self.background is None:
+            # _on_draw takes the new background and draws the lines
+            self.canvas.draw()
+            self.full_draws += 1
+        else:
+            self.canvas.restore_region(self.background)
+            self._draw_lines()
+        self.canvas.blit(self.fig.bbox)
+
+        self.frames += 1
+        frame_time = time.perf_counter() - t0
+        self.last_frame_time = frame_time
+        if frame_time > self.max_frame_time:
+            self.max_frame_time = frame_time
+
+    def start(self):
+        """
+        starts the timer and shows the figure (blocks until it is closed)
+        """
+        self.timer.start()
+        plt.show()
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'full_draws': self.full_draws,
+            'last_frame_time': self.last_frame_time,
+            'max_frame_time': self.max_frame_time,
+        }
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(channels=8, frequency=200.0, window=10.0, frames=100):
+    """
+    frame time of clear() + plot() of every axes against BlitAnimator with channels lines of window seconds
+    at frequency Hz, the data moves on by one frame (1/30 s) every frame, then BlitAnimator with and without
+    decimation at frequency and 10 * frequency
+    """
+    fig = plt.figure()
+    # two columns of axes, as many rows as needed
+    axes = [fig.add_subplot((channels + 1) // 2, 2, i + 1) for i in range(channels)]
+    count = int(window * frequency)
+    state = {'t': 0.0, 'rate': frequency}
+
+    def data(i):
+        x = state['t'] + np.arange(int(window * state['rate'])) / state['rate']
+        # a spike per second that has to stay visible
+        return x, np.sin(x + i) + (np.arange(len(x)) % int(state['rate']) == 0)
+
+    t0 = time.perf_counter()
+    for frame in range(frames):
+        state['t'] += 1 / 30
+        for i in range(channels):
+            axes[i].clear()
+            axes[i].plot(*data(i))
+            axes[i].set_ylim([-1.5, 2.5])
+        fig.canvas.draw()
+    t_clear = (time.perf_counter() - t0) / frames
+
+    for ax in axes:
+        ax.clear()
+    animator = BlitAnimator(fig)
+    for i in range(channels):
+        animator.add(axes[i], lambda i=i: data(i), window=window, ylim=[-1.5, 2.5])
+    fig.canvas.draw()
+    t0 = time.perf_counter()
+    for frame in range(frames):
+        state['t'] += 1 / 30
+        animator.update()
+    t_blit = (time.perf_counter() - t0) / frames
+
+    print(f"{channels} channels x {count} points: clear + plot {t_clear * 1000:.1f} ms/frame ({1 / t_clear:.0f} fps), "
+          f"blitted {t_blit * 1000:.1f} ms/frame ({1 / t_blit:.0f} fps)")
+    print(animator.stats())
+
+    # higher sample rates: the decimated line keeps the cost of a frame
+    for rate in [frequency, frequency * 10]:
+        state['rate'] = rate
+        count = int(window * rate)
+        frame_times = []
+        for decimation in [False, True]:
+            animator.decimation = decimation
+            t0 = time.perf_counter()
+            for frame in range(frames // 4):
+                state['t'] += 1 / 30
+                animator.update()
+            frame_times.append((time.perf_counter() - t0) / (frames // 4))
+        print(f"{rate:.0f} Hz ({count} points per line): all points {frame_times[0] * 1000:.1f} ms/frame, "
+              f"decimated {frame_times[1] * 1000:.1f} ms/frame")
+
+
+if __name__ == "__main__":
+
+    # usage: python liveplot.py [channels]   (benchmark, MPLBACKEND=Agg for headless)
+    benchmark(*[int(arg) for arg in sys.argv[1:2]])
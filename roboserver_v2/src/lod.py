@@ -0,0 +1,257 @@
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import archive
+import convert
+import runstore
+import timeslice
+
+LOD_SUFFIX = ".lod.npz"
+# records per bucket of the finest level, every further level halves the number of buckets
+BASE_BUCKET = 4
+
+
+def _source_signature(data_root, names):
+    # changes when one of the source parameters gets new values
+    signature = []
+    if archive.is_archive(data_root):
+        path = os.path.join(data_root, archive.ARCHIVE)
+        return np.array([os.path.getsize(path), os.path.getmtime(path)], dtype=np.float64)
+    if runstore.is_run_store(data_root):
+        reader = runstore.RunReader(data_root)
+        for name in names:
+            signature.append(reader.count(name) if name in reader.names else -1)
+        return np.array(signature, dtype=np.float64)
+    for name in names:
+        path = os.path.join(data_root, name + ".txt")
+        if os.path.exists(path):
+            signature.extend([os.path.getsize(path), os.path.getmtime(path)])
+        else:
+            signature.extend([-1, -1])
+    return np.array(signature, dtype=np.float64)
+
+
+def _first_level(x, y):
+    starts = np.arange(0, len(x), BASE_BUCKET)
+    valid = ~np.isnan(y)
+    # fmin / fmax ignore NaN, buckets without any number stay NaN
+    return {
+        'x': x[starts],
+        'min': np.fmin.reduceat(y, starts),
+        'max': np.fmax.reduceat(y, starts),
+        'sum': np.add.reduceat(np.where(valid, y, 0.0), starts),
+        'count': np.add.reduceat(valid.astype(np.int64), starts),
+    }
+
+
+def _next_level(level):
+    starts = np.arange(0, len(level['x']), 2)
+    return {
+        'x': level['x'][starts],
+        'min': np.fmin.reduceat(level['min'], starts),
+        'max': np.fmax.reduceat(level['max'], starts),
+        'sum': np.add.reduceat(level['sum'], starts),
+        'count': np.add.reduceat(level['count'], starts),
+    }
+
+
+class Pyramid:
+
+    def __init__(self, levels, x_name, y_name, signature, x_last=None):
+        """
+        Level of detail pyramid of a parameter of a stored run: level k has min, max and mean of buckets of
+        BASE_BUCKET * 2^k records, with the first time of the bucket as x. A view of the run only needs the level
+        with about as many buckets as the plot has pixels, spikes stay visible in min / max.
+        Use load_or_build() to get one.
+
+        :param levels: list of dicts with the arrays x, min, max, sum, count, finest level first
+        :param x_last: last x of the run, the x of a bucket is its first one
+        """
+        self.levels = levels
+        self.x_name = x_name
+        self.y_name = y_name
+        self.signature = signature
+        self.x_last = x_last
+
+    @staticmethod
+    def build(data_root, x_name, y_name):
+        signature = _source_signature(data_root, [x_name, y_name])
+        x, (y,) = timeslice.load_window(data_root, x_name, [y_name])
+        levels = []
+        if len(x) > 0:
+            levels.append(_first_level(x, y))
+            while len(levels[-1]['x']) > 1:
+                levels.append(_next_level(levels[-1]))
+        return Pyramid(levels, x_name, y_name, signature, float(x[-1]) if len(x) > 0 else None)
+
+    def save(self, path):
+        arrays = {'signature': self.signature, 'level_count': len(self.levels),
+                  'x_last': np.nan if self.x_last is None else self.x_last}
+        for k, level in enumerate(self.levels):
+            for key, array in level.items():
+                arrays[f"{k}_{key}"] = array
+        # written under another name first, a viewer never loads half a pyramid
+        with open(path + ".tmp", 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load(path, x_name, y_name):
+        with np.load(path) as data:
+            levels = []
+            for k in range(int(data['level_count'])):
+                levels.append({key: data[f"{k}_{key}"] for key in ['x', 'min', 'max', 'sum', 'count']})
+            # pyramids stored before x_last was added have to be built again
+            x_last = float(data['x_last']) if 'x_last' in data.files else None
+            return Pyramid(levels, x_name, y_name, data['signature'], x_last)
+
+    @property
+    def record_count(self):
+        return 0 if len(self.levels) == 0 else int(len(self.levels[0]['x'])) * BASE_BUCKET
+
+    def bounds(self):
+        """
+        :return: (first, last) x of the run, None if it is empty
+        """
+        if len(self.levels) == 0:
+            return None
+        return float(self.levels[0]['x'][0]), self.x_last
+
+    def level_for(self, x0, x1, pixels):
+        """
+        :return: the coarsest level with at least two buckets per pixel in [x0, x1],
+                 None if the raw values are not more than that
+        """
+        if len(self.levels) == 0:
+            return None
+        first = self.levels[0]['x']
+        buckets = np.searchsorted(first, x1, side='right') - np.searchsorted(first, x0, side='left') + 1
+        visible = buckets * BASE_BUCKET
+        if visible <= 2 * pixels:
+            return None
+        level = int(math.floor(math.log2(visible / (BASE_BUCKET * 2 * pixels))))
+        return max(0, min(level, len(self.levels) - 1))
+
+    def window(self, level, x0, x1):
+        """
+        :return: (x, min, max, mean) of the buckets of a level overlapping [x0, x1]
+        """
+        data = self.levels[level]
+        first = max(0, int(np.searchsorted(data['x'], x0, side='right')) - 1)
+        end = min(len(data['x']), int(np.searchsorted(data['x'], x1, side='right')) + 1)
+        count = data['count'][first:end]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = data['sum'][first:end] / count
+        return data['x'][first:end], data['min'][first:end], data['max'][first:end], mean
+
+
+def pyramid_path(data_root, y_name):
+    return os.path.join(data_root, y_name + LOD_SUFFIX)
+
+
+def load_or_build(data_root, x_name, y_name):
+    """
+    :return: the Pyramid of a parameter, built (and stored as <data_root>/<y_name>.lod.npz)
+             if it doesn't exist or the parameter got new values since
+    """
+    path = pyramid_path(data_root, y_name)
+    if os.path.exists(path):
+        pyramid = Pyramid.load(path, x_name, y_name)
+        if np.array_equal(pyramid.signature, _source_signature(data_root, [x_name, y_name])) and \
+                (pyramid.x_last is not None or len(pyramid.levels) == 0):
+            return pyramid
+    pyramid = Pyramid.build(data_root, x_name, y_name)
+    try:
+        pyramid.save(path)
+    except OSError:
+        # read only run directory, the pyramid is just not cached
+        pass
+    return pyramid
+
+
+def series_pairs(names):
+    """
+    :param names: parameter names of a run
+    :return: (time name, parameter name) for every parameter with a time parameter of the same prefix,
+             e.g. ("lf-time", "lf-e"); the gap reports of dataio.SeriesCounter go with their own time,
+             e.g. ("lf-gap-time", "lf-dropped")
+    """
+    names = set(names)
+    pairs = []
+    for name in sorted(names):
+        if runstore.is_time_name(name):
+            continue
+        x_name = name.split("-")[0] + "-time"
+        for suffix in convert.REPORT_SUFFIXES:
+            if name.endswith(suffix):
+                x_name = name[:-len(suffix)] + "-gap-time"
+        if x_name in names:
+            pairs.append((x_name, name))
+    return pairs
+
+
+def build_in_background(data_root, names):
+    """
+    builds the pyramids of all parameters of a run in a thread
+
+    :param data_root: directory of the run
+    :param names: parameter names of the run
+    :return: the started thread
+    """
+    def build():
+        for x_name, y_name in series_pairs(names):
+            load_or_build(data_root, x_name, y_name)
+
+    thread = threading.Thread(target=build)
+    thread.start()
+    return thread
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(data_root, pixels=1000):
+    """
+    builds the pyramid of lf-e of a run (e.g. the one written by the timeslice benchmark)
+    and times views of the whole run and of a zoomed in range
+    """
+    t0 = time.perf_counter()
+    pyramid = Pyramid.build(data_root, "lf-time", "lf-e")
+    pyramid.save(pyramid_path(data_root, "lf-e"))
+    t_build = time.perf_counter() - t0
+    first, last = pyramid.bounds()
+    print(f"{pyramid.record_count} records, {len(pyramid.levels)} levels built in {t_build * 1000:.0f} ms")
+
+    t0 = time.perf_counter()
+    pyramid = load_or_build(data_root, "lf-time", "lf-e")
+    print(f"loaded in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    for width in [last - first, (last - first) / 100, 10.0, 1.0]:
+        x0 = first + (last - first - width) / 2
+        t0 = time.perf_counter()
+        level = pyramid.level_for(x0, x0 + width, pixels)
+        if level is None:
+            x, _ys = timeslice.load_window(data_root, "lf-time", ["lf-e"], x0, x0 + width)
+        else:
+            x = pyramid.window(level, x0, x0 + width)[0]
+        print(f"view of {width:8.1f}s: level {level}, {len(x)} points in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+
+    # usage: python lod.py <run directory>   (builds the pyramids of all parameters)
+    #        python lod.py benchmark <run directory with lf-time / lf-e>
+    if len(sys.argv) > 2 and sys.argv[1] == 'benchmark':
+        benchmark(sys.argv[2])
+    else:
+        run_root = sys.argv[1]
+        if runstore.is_run_store(run_root):
+            run_names = runstore.RunReader(run_root).names
+        else:
+            run_names = [name[:-len(".txt")] for name in os.listdir(run_root) if name.endswith(".txt")]
+        build_in_background(run_root, run_names).join()
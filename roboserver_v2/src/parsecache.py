@@ -0,0 +1,150 @@
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+import batchparse
+import catalog
+
+# <file>.txt.<size>-<mtime in ns>.cache.npy, the name says which version of the file was parsed
+CACHE_SUFFIX = ".cache.npy"
+# disk budget for all sidecars below a catalog (or run) directory
+MAX_BYTES = 256 << 20
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def sidecar_paths(path):
+    """
+    :return: paths of all cache sidecars of a text file, current or stale
+    """
+    return glob.glob(glob.escape(path) + ".*" + CACHE_SUFFIX)
+
+
+def _cache_root(path):
+    # the sidecars of a whole catalog share the budget, otherwise the ones of the run
+    directory = os.path.dirname(os.path.abspath(path))
+    candidate = directory
+    while True:
+        if os.path.exists(os.path.join(candidate, catalog.INDEX)):
+            return candidate
+        parent = os.path.dirname(candidate)
+        if parent == candidate:
+            return directory
+        candidate = parent
+
+
+def load(path, max_bytes=MAX_BYTES):
+    """
+    Loads the values of a text file with one value per line (NaN for values that are no number).
+    The first load stores the parsed values as .npy sidecar next to the file, later loads memory-map it as long as
+    size and mtime of the file are unchanged. When the sidecars below the catalog directory use more than
+    max_bytes, the least recently used ones are deleted.
+
+    :param path: path of the text file
+    :param max_bytes: disk budget of the sidecars, None for no limit
+    :return: float64 array (read only memory map if it came from the cache)
+    """
+    sidecar = path + "." + _signature(path) + CACHE_SUFFIX
+    if os.path.exists(sidecar):
+        try:
+            values = np.load(sidecar, mmap_mode='r')
+            # the mtime of a sidecar is the time it was last used
+            os.utime(sidecar)
+            return values
+        except (OSError, ValueError):
+            pass
+
+    with open(path, 'rb') as file:
+        values = batchparse.parse_csv_block(file.read(), 1)[0][:, 0]
+
+    try:
+        for stale in sidecar_paths(path):
+            os.remove(stale)
+        # written under another name first, a reader never maps half a file
+        with open(sidecar + ".tmp", 'wb') as file:
+            np.save(file, values)
+        os.replace(sidecar + ".tmp", sidecar)
+    except OSError:
+        # read only run directory, the values are just not cached
+        return values
+    if max_bytes is not None:
+        evict(_cache_root(path), max_bytes, keep=sidecar)
+    return values
+
+
+def evict(root, max_bytes, keep=None):
+    """
+    deletes the least recently used sidecars below root until they use at most max_bytes
+
+    :param keep: sidecar that is never deleted (the one just written)
+    :return: number of deleted sidecars
+    """
+    sidecars = []
+    total = 0
+    for directory, dirs, files in os.walk(root):
+        for name in files:
+            if name.endswith(CACHE_SUFFIX):
+                sidecar = os.path.join(directory, name)
+                try:
+                    stat = os.stat(sidecar)
+                except OSError:
+                    continue
+                sidecars.append((stat.st_mtime, stat.st_size, sidecar))
+                total += stat.st_size
+
+    deleted = 0
+    for last_used, size, sidecar in sorted(sidecars):
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(sidecar) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(sidecar)
+        except OSError:
+            continue
+        total -= size
+        deleted += 1
+    return deleted
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(path):
+    """
+    compares readlines(), the first (parsing) and a cached load of a text file
+    """
+    for sidecar in sidecar_paths(path):
+        os.remove(sidecar)
+
+    t0 = time.perf_counter()
+    with open(path, 'r') as file:
+        values = [float(line.strip()) for line in file.readlines()]
+    t_readlines = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    load(path)
+    t_first = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    cached = load(path)
+    t_cached = time.perf_counter() - t0
+
+    print(f"{len(values)} values: readlines {t_readlines * 1000:.0f} ms, first load {t_first * 1000:.0f} ms, "
+          f"cached {t_cached * 1000:.2f} ms, equal: {np.array_equal(np.array(values), cached)}")
+
+
+if __name__ == "__main__":
+
+    # usage: python parsecache.py <text file>   (benchmark)
+    #        python parsecache.py evict <directory> <max MB>
+    if len(sys.argv) > 3 and sys.argv[1] == 'evict':
+        print(f"{evict(sys.argv[2], float(sys.argv[3]) * 1e6)} sidecars deleted")
+    else:
+        benchmark(sys.argv[1])
@@ -0,0 +1,264 @@
+import concurrent.futures
+import json
+import math
+import os
+import sys
+import time
+
+from matplotlib.figure import Figure
+
+import numpy as np
+
+import align
+import archive
+import convert
+import liveplot
+import runstore
+import timeslice
+
+REPORT_NAME = "report"
+# <report>.json next to the report: layout and data files it was rendered from
+INFO_SUFFIX = ".json"
+FORMATS = ("png", "svg")
+PANEL_WIDTH = 6.0     # inches
+PANEL_HEIGHT = 2.5    # inches
+DPI = 100
+
+
+def parameter_names(data_root):
+    """
+    :return: names of the parameters of a stored run (text files, runstore or archive), without console messages
+    """
+    if archive.is_archive(data_root):
+        return archive.ArchiveReader(data_root).names
+    if runstore.is_run_store(data_root):
+        return runstore.RunReader(data_root).names
+    names = sorted(name[:-len(".txt")] for name in os.listdir(data_root) if name.endswith(".txt"))
+    return [name for name in names if name.split("-")[-1] not in archive.TEXT_NAMES]
+
+
+def _data_roots(run_root):
+    # the run directory and, for Server_GeneralLogger runs, its l<N> directories, if they have parameters
+    directories = [run_root] + [os.path.join(run_root, name) for name in sorted(os.listdir(run_root))
+                                if convert.LOGGER_DIRECTORY.match(name)]
+    return [directory for directory in directories
+            if archive.is_archive(directory) or len(parameter_names(directory)) > 0]
+
+
+def find_runs(root):
+    """
+    :param root: directory with runs of any layout (text files, runstore, archive), e.g. a data2 directory or
+                 a run catalog
+    :return: list of run directories
+    """
+    runs = []
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        try:
+            is_run = len(_data_roots(directory)) > 0
+        except Exception:
+            # e.g. a broken manifest or archive index, render_run reports the error of the run
+            is_run = True
+        if is_run:
+            runs.append(directory)
+        # the l<N> directories belong to their run
+        dirs[:] = [name for name in dirs if not convert.LOGGER_DIRECTORY.match(name)]
+    return runs
+
+
+def auto_panels(names):
+    """
+    :param names: parameter names of a data root
+    :return: a panel {'x': time parameter, 'y': parameter} for every parameter that isn't a time
+    """
+    times = [name for name in names if runstore.is_time_name(name)]
+    panels = []
+    for name in names:
+        if runstore.is_time_name(name):
+            continue
+        x_name = align.time_name(name)
+        if x_name not in times:
+            # e.g. 1_time / 3_e of Server_ColorSensorLogger, the only time of the run
+            if len(times) != 1:
+                continue
+            x_name = times[0]
+        panels.append({'x': x_name, 'y': name})
+    return panels
+
+
+def run_panels(run_root, layout=None):
+    """
+    :param run_root: run directory
+    :param layout: {'columns': n, 'panels': [{'x': x name, 'y': y name, 'ylim': [min, max]}, ...]},
+                   None for a panel per parameter (see auto_panels)
+    :return: list of (data root, panel) of the panels the run has the parameters of
+    """
+    panels = []
+    for data_root in _data_roots(run_root):
+        names = parameter_names(data_root)
+        candidates = auto_panels(names) if layout is None else layout['panels']
+        for panel in candidates:
+            if panel['x'] in names and panel['y'] in names:
+                panels.append((data_root, panel))
+    return panels
+
+
+def _signature(run_root, layout, file_format):
+    # changes when the layout or one of the data files of the run changes
+    files = []
+    for data_root in _data_roots(run_root):
+        for name in sorted(os.listdir(data_root)):
+            if name.endswith(".txt") or name.endswith(runstore.COLUMN_SUFFIX) or \
+                    name in (runstore.MANIFEST, archive.ARCHIVE):
+                stat = os.stat(os.path.join(data_root, name))
+                files.append([os.path.relpath(os.path.join(data_root, name), run_root), stat.st_size,
+                              stat.st_mtime_ns])
+    return {'layout': layout, 'format': file_format, 'files': files}
+
+
+def report_path(run_root, output=None, root=None, file_format="png"):
+    """
+    :param output: directory of the reports, same relative paths as the runs below root; None for the run directory
+    :return: path of the report of a run
+    """
+    directory = run_root
+    if output is not None:
+        directory = os.path.normpath(os.path.join(output, os.path.relpath(run_root, root)))
+    return os.path.join(directory, REPORT_NAME + "." + file_format)
+
+
+def is_up_to_date(run_root, path, layout=None, file_format="png"):
+    """
+    :return: True if the report at path was rendered with this layout from the current data files of the run
+    """
+    info_path = path + INFO_SUFFIX
+    if not os.path.exists(path) or not os.path.exists(info_path):
+        return False
+    try:
+        with open(info_path, 'r') as file:
+            info = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return info == json.loads(json.dumps(_signature(run_root, layout, file_format)))
+
+
+def render_run(run_root, path, layout=None, file_format="png", force=False):
+    """
+    renders the panels of a run into one figure file, with the non-interactive Agg canvas (no window)
+
+    :param run_root: run directory
+    :param path: path of the report file
+    :param layout: see run_panels
+    :param file_format: "png" or "svg"
+    :param force: also render if the report is up to date
+    :return: report dict (run, output, skipped, panels, seconds), {'run': run_root, 'error': message} if the run
+             couldn't be rendered
+    """
+    try:
+        return _render_run(run_root, path, layout, file_format, force)
+    except Exception as error:
+        # a run that can't be read doesn't stop the reports of the others
+        return {'run': run_root, 'error': repr(error)}
+
+
+def _render_run(run_root, path, layout, file_format, force):
+    t0 = time.perf_counter()
+    report = {'run': run_root, 'output': path, 'skipped': False, 'panels': 0, 'seconds': 0.0}
+    if not force and is_up_to_date(run_root, path, layout, file_format):
+        report['skipped'] = True
+        return report
+
+    signature = _signature(run_root, layout, file_format)
+    panels = run_panels(run_root, layout)
+    columns = 2 if layout is None else layout.get('columns', 2)
+    rows = max(int(math.ceil(len(panels) / columns)), 1)
+    fig = Figure(figsize=(PANEL_WIDTH * columns, PANEL_HEIGHT * rows), dpi=DPI)
+    fig.suptitle(os.path.basename(os.path.normpath(run_root)))
+    pixels = PANEL_WIDTH * DPI
+
+    for i in range(len(panels)):
+        data_root, panel = panels[i]
+        ax = fig.add_subplot(rows, columns, i + 1)
+        x, (y,) = timeslice.load_window(data_root, panel['x'], [panel['y']])
+        if len(x) > 0 and runstore.is_time_name(panel['x']):
+            # seconds since the start of the run
+            x = x - x[0]
+            if not np.any(x[1:] < x[:-1]):
+                x, y = liveplot.decimate(x, y, x[0], x[-1], pixels)
+        ax.plot(x, y, linewidth=0.8)
+        if panel.get('ylim') is not None:
+            ax.set_ylim(panel['ylim'])
+        label = panel['y'] if data_root == run_root else os.path.basename(data_root) + "/" + panel['y']
+        ax.set_title(label, fontsize='small')
+        ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written under another name first, an interrupted run never leaves half a report that counts as up to date
+    with open(path + ".tmp", 'wb') as file:
+        fig.savefig(file, format=file_format)
+    os.replace(path + ".tmp", path)
+    with open(path + INFO_SUFFIX, 'w') as file:
+        json.dump(signature, file)
+
+    report['panels'] = len(panels)
+    report['seconds'] = time.perf_counter() - t0
+    return report
+
+
+def render_all(root, output=None, layout=None, file_format="png", workers=None, force=False):
+    """
+    renders the reports of all runs below root with a process pool, one run per process at a time
+
+    :param root: directory searched for runs (see find_runs)
+    :param output: see report_path
+    :param layout: see run_panels
+    :param file_format: "png" or "svg"
+    :param workers: number of processes, None for the number of CPUs
+    :param force: also render the reports that are up to date
+    :return: list of the reports of render_run
+    """
+    if file_format not in FORMATS:
+        raise Exception(f"render_all: unknown format {file_format}, use one of {list(FORMATS)}")
+    runs = find_runs(root)
+    reports = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_run, run, report_path(run, output, root, file_format), layout, file_format,
+                               force): run for run in runs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as error:
+                # e.g. the worker process died
+                report = {'run': futures[future], 'error': repr(error)}
+            print_report(report)
+            reports.append(report)
+    return reports
+
+
+def print_report(report):
+    if 'error' in report:
+        print(f"{report['run']}: failed, {report['error']}")
+        return
+    if report['skipped']:
+        print(f"{report['run']}: up to date")
+        return
+    print(f"{report['run']}: {report['panels']} panels in {report['seconds']:.2f}s -> {report['output']}")
+
+
+if __name__ == "__main__":
+
+    # usage: python report.py <directory with runs> [output directory | -] [png | svg] [layout file | -] [workers]
+    #                          [force]
+    #        without output directory the reports are written into the run directories, without layout file
+    #        there is a panel per parameter; a layout file for the e / i / d / u of Server2 runs:
+    #        {"columns": 2, "panels": [{"x": "lf-time", "y": "lf-e", "ylim": [-100, 100]},
+    #                                  {"x": "lf-time", "y": "lf-i"}, {"x": "lf-time", "y": "lf-d"},
+    #                                  {"x": "lf-time", "y": "lf-u"}]}
+    arguments = [arg if arg != "-" else None for arg in sys.argv[1:6]] + [None] * 5
+    report_layout = None
+    if arguments[3] is not None:
+        with open(arguments[3], 'r') as layout_file:
+            report_layout = json.load(layout_file)
+    render_all(arguments[0], output=arguments[1], layout=report_layout, file_format=arguments[2] or "png",
+               workers=int(arguments[4]) if arguments[4] is not None else None, force='force' in sys.argv[6:])
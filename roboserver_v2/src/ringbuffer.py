@@ -0,0 +1,264 @@
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+class RingBuffer:
+
+    def __init__(self, capacity=1 << 16, columns=1):
+        """
+        Fixed capacity buffer of a time series (a time and columns values per sample) for live plots.
+        The samples are kept in arrays of twice the capacity: append writes behind the last sample and
+        only when the end is reached the kept samples are moved to the front once (O(1) per sample on average).
+        The kept samples are always contiguous, times and values are returned as views without a copy.
+
+        :param capacity: max number of samples kept, older ones are dropped
+        :param columns: number of values per sample
+        """
+        if capacity < 1:
+            raise Exception("RingBuffer: capacity has to be at least 1")
+        self.capacity = capacity
+        self.columns = columns
+        self._times = np.empty(2 * capacity, dtype=np.float64)
+        # one row per column, a column is contiguous as well
+        self._values = np.empty((columns, 2 * capacity), dtype=np.float64)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _compact(self):
+        # moves the newest capacity - 1 samples to the front, there is room for at least one more behind them
+        keep = min(self.end - self.start, self.capacity - 1)
+        first = self.end - keep
+        self._times[:keep] = self._times[first:self.end]
+        self._values[:, :keep] = self._values[:, first:self.end]
+        self.start = 0
+        self.end = keep
+
+    def append(self, t, *values):
+        """
+        :param t: time of the sample
+        :param values: columns values of the sample
+        """
+        if self.end == len(self._times):
+            self._compact()
+        elif self.end - self.start == self.capacity:
+            self.start += 1
+        self._times[self.end] = t
+        self._values[:, self.end] = values
+        self.end += 1
+
+    def extend(self, times, values):
+        """
+        appends a block of samples at once
+
+        :param times: times of the samples
+        :param values: array of shape (columns, number of samples)
+        """
+        n = len(times)
+        if n >= self.capacity:
+            # only the newest capacity samples are kept
+            times = times[n - self.capacity:]
+            values = values[:, n - self.capacity:]
+            n = self.capacity
+            self.start = 0
+            self.end = 0
+        elif self.end + n > len(self._times):
+            keep = min(self.end - self.start, self.capacity - n)
+            self._times[:keep] = self._times[self.end - keep:self.end]
+            self._values[:, :keep] = self._values[:, self.end - keep:self.end]
+            self.start = 0
+            self.end = keep
+        self._times[self.end:self.end + n] = times
+        self._values[:, self.end:self.end + n] = values
+        self.end += n
+        if self.end - self.start > self.capacity:
+            self.start = self.end - self.capacity
+
+    def trim(self, width):
+        """
+        drops the samples more than width seconds older than the newest one (times have to be increasing)
+
+        :return: number of dropped samples
+        """
+        if self.end == self.start or width is None:
+            return 0
+        last = self._times[self.end - 1]
+        if np.isnan(last):
+            return 0
+        first = self.start + int(np.searchsorted(self._times[self.start:self.end], last - width, side='left'))
+        dropped = first - self.start
+        self.start = first
+        return dropped
+
+    def clear(self):
+        self.start = 0
+        self.end = 0
+
+    @property
+    def times(self):
+        """
+        :return: view of the times of the kept samples, valid until the next append
+        """
+        return self._times[self.start:self.end]
+
+    def column(self, i=0):
+        """
+        :return: view of the values of column i of the kept samples, valid until the next append
+        """
+        return self._values[i, self.start:self.end]
+
+    def last(self):
+        """
+        :return: (time, values) of the newest sample
+        """
+        if self.end == self.start:
+            raise Exception("RingBuffer: no samples")
+        return self._times[self.end - 1], self._values[:, self.end - 1]
+
+
+class SharedRingBuffer(RingBuffer):
+
+    def __init__(self, capacity=1 << 16, columns=1, window=None):
+        """
+        RingBuffer written by a receiver thread and read by a plotting thread. Both only hold the lock for an append
+        or for copying the kept samples (a memcpy of a few kB), never while parsing or drawing. The plotting thread
+        works on read only snapshots; a snapshot is only copied again after new samples arrived.
+
+        :param window: width in seconds the buffer is trimmed to on every append, None to keep capacity samples
+        """
+        RingBuffer.__init__(self, capacity, columns)
+        self.window = window
+        self.lock = threading.Lock()
+        # number of appends, tells if the last snapshot is still current
+        self.version = 0
+        self._snapshot = None
+        self._snapshot_version = -1
+
+    def append(self, t, *values):
+        with self.lock:
+            RingBuffer.append(self, t, *values)
+            if self.window is not None:
+                RingBuffer.trim(self, self.window)
+            self.version += 1
+
+    def extend(self, times, values):
+        with self.lock:
+            RingBuffer.extend(self, times, values)
+            if self.window is not None:
+                RingBuffer.trim(self, self.window)
+            self.version += 1
+
+    def trim(self, width):
+        with self.lock:
+            return RingBuffer.trim(self, width)
+
+    def clear(self):
+        with self.lock:
+            RingBuffer.clear(self)
+            self.version += 1
+
+    def snapshot(self):
+        """
+        :return: (times, [values of column 0, ...]) read only copies of the kept samples
+        """
+        with self.lock:
+            if self._snapshot_version != self.version:
+                times = self.times.copy()
+                columns = [self.column(i).copy() for i in range(self.columns)]
+                for array in [times] + columns:
+                    array.flags.writeable = False
+                self._snapshot = (times, columns)
+                self._snapshot_version = self.version
+            return self._snapshot
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(sample_count=200000, frequency=200.0, window=7.0, draw_every=7):
+    """
+    LiveSubPlot windows of window seconds at frequency Hz: deque with a popleft() loop and an array
+    conversion every draw_every samples (30 fps) against RingBuffer with views
+    """
+    import collections
+
+    t0 = time.perf_counter()
+    x_deque = collections.deque(np.array([]))
+    y_deque = collections.deque(np.array([]))
+    for i in range(sample_count):
+        x_deque.append(i / frequency)
+        y_deque.append(1.5)
+        while not len(x_deque) == 0 and x_deque[-1] - x_deque[0] > window:
+            x_deque.popleft()
+            y_deque.popleft()
+        if i % draw_every == 0:
+            np.asarray(x_deque)
+            np.asarray(y_deque)
+    t_deque = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    buffer = RingBuffer(1 << 14)
+    for i in range(sample_count):
+        buffer.append(i / frequency, 1.5)
+        buffer.trim(window)
+        if i % draw_every == 0:
+            buffer.times
+            buffer.column()
+    t_ring = time.perf_counter() - t0
+
+    print(f"{sample_count} samples, {len(buffer)} in the window: deque {t_deque * 1e6 / sample_count:.2f} us/sample, "
+          f"ring buffer {t_ring * 1e6 / sample_count:.2f} us/sample, "
+          f"equal: {np.array_equal(np.asarray(x_deque), buffer.times)}")
+
+
+def benchmark_shared(duration=2.0, frequency=200.0, draw_time=0.03):
+    """
+    longest wait of a receiver thread appending at frequency Hz while a plotting thread draws (draw_time seconds
+    of work per frame): lock held for the whole draw as in the old RoboServer._draw_plot, against snapshots
+    """
+    def run(shared):
+        buffer = SharedRingBuffer(columns=6, window=10.0)
+        lock = threading.Lock()
+        waits = []
+        done = threading.Event()
+
+        def plotter():
+            while not done.is_set():
+                if shared:
+                    buffer.snapshot()
+                    time.sleep(draw_time)
+                else:
+                    lock.acquire()
+                    time.sleep(draw_time)
+                    lock.release()
+
+        thread = threading.Thread(target=plotter, daemon=True)
+        thread.start()
+        for i in range(int(duration * frequency)):
+            t0 = time.perf_counter()
+            if shared:
+                buffer.append(i / frequency, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0)
+            else:
+                lock.acquire()
+                buffer.append(i / frequency, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0)
+                lock.release()
+            waits.append(time.perf_counter() - t0)
+            time.sleep(1 / frequency)
+        done.set()
+        thread.join()
+        return max(waits)
+
+    print(f"longest append while drawing: lock held while drawing {run(False) * 1000:.2f} ms, "
+          f"snapshots {run(True) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+
+    # usage: python ringbuffer.py [sample count]   (benchmarks)
+    benchmark(*[int(arg) for arg in sys.argv[1:2]])
+    benchmark_shared()
@@ -0,0 +1,314 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+MANIFEST = "manifest.json"
+COLUMN_SUFFIX = ".f64"
+COLUMN_DTYPE = "<f8"
+MANIFEST_VERSION = 1
+
+
+def is_time_name(name):
+    # same convention as codec.default_type: time stamps are the parameters ending in "time"
+    return name.endswith("time")
+
+
+def to_float(value):
+    """
+    :param value: str, bytes or number as received
+    :return: float, NaN for values that are no number (e.g. the 'E' placeholders of test_client)
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+# WRITER -------------------------------------------------------------------------------------------------
+
+
+class Column:
+
+    def __init__(self, path, chunk_records):
+        """
+        one parameter of a run, stored as raw little endian float64 values.
+        The file is grown in chunks of chunk_records values and written through a memory map,
+        appending a value is a memory write instead of a write() + flush() syscall.
+
+        :param path: path of the column file
+        :param chunk_records: number of values the file grows by
+        """
+        self.path = path
+        self.chunk_records = chunk_records
+        self.count = 0
+        self.capacity = 0
+        self.array = None
+        self.min = None
+        self.max = None
+        open(self.path, 'wb').close()
+
+    def _grow(self, needed):
+        capacity = (needed // self.chunk_records + 1) * self.chunk_records
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+        with open(self.path, 'r+b') as file:
+            # extending with truncate allocates the chunk without writing it
+            file.truncate(capacity * 8)
+        self.array = np.memmap(self.path, dtype=COLUMN_DTYPE, mode='r+', shape=(capacity,))
+        self.capacity = capacity
+
+    def append(self, value):
+        if self.count >= self.capacity:
+            self._grow(self.count + 1)
+        self.array[self.count] = value
+        self.count += 1
+        if value == value:
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def extend(self, values):
+        """
+        :param values: float64 array
+        """
+        n = len(values)
+        if n == 0:
+            return
+        if self.count + n > self.capacity:
+            self._grow(self.count + n)
+        self.array[self.count:self.count + n] = values
+        self.count += n
+        if not np.isnan(values).all():
+            low = float(np.nanmin(values))
+            high = float(np.nanmax(values))
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+
+    def flush(self):
+        if self.array is not None:
+            self.array.flush()
+
+    def close(self):
+        self.flush()
+        self.array = None
+
+
+class RunStore:
+
+    def __init__(self, run_root, chunk_records=65536, manifest_period=1.0, info=None):
+        """
+        Append-only columnar store of a run: every parameter is a float64 column file <name>.f64
+        next to a manifest.json with the schema, the record counts and the time bounds.
+        The manifest is rewritten (atomically) every manifest_period seconds, so readers (see RunReader)
+        can memory-map the columns while the run is still written.
+
+        :param run_root: directory of the run, has to exist
+        :param chunk_records: number of values a column file grows by
+        :param manifest_period: max time in seconds between two manifest updates
+        :param info: dict with additional information stored in the manifest (e.g. robot build)
+        """
+        self.run_root = run_root
+        self.chunk_records = chunk_records
+        self.manifest_period = manifest_period
+        self.info = info if info is not None else {}
+        self.columns = {}
+        # names of the streams, in the order they were first seen
+        self.streams = {}
+        self.created = time.time()
+        self.last_manifest = 0.0
+        self.closed = False
+        self.write_manifest()
+
+    def _column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            column = Column(os.path.join(self.run_root, name + COLUMN_SUFFIX), self.chunk_records)
+            self.columns[name] = column
+        return column
+
+    def append(self, names, values):
+        """
+        appends one record
+
+        :param names: parameter names
+        :param values: values in the same order (str, bytes or numbers)
+        """
+        self._count_records(names, 1)
+        for i in range(len(names)):
+            self._column(names[i]).append(to_float(values[i]))
+        self._maybe_write_manifest()
+
+    def extend(self, names, columns):
+        """
+        appends many records at once
+
+        :param names: parameter names
+        :param columns: one float64 array per parameter, all of the same length
+        """
+        self._count_records(names, len(columns[0]))
+        for i in range(len(names)):
+            self._column(names[i]).extend(columns[i])
+        self._maybe_write_manifest()
+
+    def _count_records(self, names, n):
+        names = tuple(names)
+        self.streams[names] = self.streams.get(names, 0) + n
+
+    def _maybe_write_manifest(self):
+        if time.time() - self.last_manifest >= self.manifest_period:
+            self.write_manifest()
+
+    def manifest(self):
+        columns = {}
+        time_bounds = {}
+        for name, column in self.columns.items():
+            columns[name] = {
+                'file': os.path.basename(column.path),
+                'dtype': COLUMN_DTYPE,
+                'count': column.count,
+                'capacity': column.capacity,
+            }
+            if is_time_name(name) and column.min is not None:
+                time_bounds[name] = [column.min, column.max]
+        return {
+            'version': MANIFEST_VERSION,
+            'created': self.created,
+            'updated': time.time(),
+            'closed': self.closed,
+            'info': self.info,
+            'streams': [{'names': list(names), 'records': count} for names, count in self.streams.items()],
+            'columns': columns,
+            'time_bounds': time_bounds,
+        }
+
+    def write_manifest(self):
+        # the column data has to be on disk before a manifest counts it
+        for column in self.columns.values():
+            column.flush()
+        path = os.path.join(self.run_root, MANIFEST)
+        with open(path + ".tmp", 'w') as file:
+            json.dump(self.manifest(), file, indent=1)
+        os.replace(path + ".tmp", path)
+        self.last_manifest = time.time()
+
+    def close(self):
+        self.closed = True
+        for column in self.columns.values():
+            column.close()
+        self.write_manifest()
+
+
+# READER -------------------------------------------------------------------------------------------------
+
+
+def is_run_store(run_root):
+    return os.path.exists(os.path.join(run_root, MANIFEST))
+
+
+class RunReader:
+
+    def __init__(self, run_root):
+        """
+        reads a run written by RunStore, also while it is still being written (call refresh() for new data)
+
+        :param run_root: directory of the run
+        """
+        self.run_root = run_root
+        self.manifest = None
+        self.refresh()
+
+    def refresh(self):
+        with open(os.path.join(self.run_root, MANIFEST), 'r') as file:
+            self.manifest = json.load(file)
+
+    @property
+    def names(self):
+        return list(self.manifest['columns'].keys())
+
+    @property
+    def closed(self):
+        return self.manifest['closed']
+
+    def count(self, name):
+        return self.manifest['columns'][name]['count']
+
+    def time_bounds(self, name):
+        """
+        :return: (first, last) time of a time column, None if it has no values yet
+        """
+        bounds = self.manifest['time_bounds'].get(name)
+        return None if bounds is None else tuple(bounds)
+
+    def column(self, name):
+        """
+        :param name: parameter name
+        :return: read only memory mapped float64 array with the values counted in the manifest
+        """
+        info = self.manifest['columns'].get(name)
+        if info is None:
+            raise Exception(f"RunReader: no parameter {name} in {self.run_root}")
+        if info['count'] == 0:
+            return np.zeros(0, dtype=info['dtype'])
+        return np.memmap(os.path.join(self.run_root, info['file']), dtype=info['dtype'], mode='r',
+                         shape=(info['count'],))
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(run_root, record_count=200000):
+    """
+    writes record_count lf-* records as text files with a flush per value (like Server2 did)
+    and into a RunStore, and compares the time
+    """
+    import shutil
+
+    names = ("lf-time", "lf-e", "lf-i", "lf-d", "lf-u")
+    rng = np.random.default_rng(0)
+    data = rng.normal(0, 50, (record_count, len(names)))
+    data[:, 0] = time.time() + np.arange(record_count) * 0.005
+    rows = [[str(value) for value in row] for row in data.tolist()]
+
+    for title in ["text", "columns"]:
+        root = os.path.join(run_root, title)
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        os.makedirs(root)
+        t0 = time.perf_counter()
+        if title == "text":
+            files = {name: open(os.path.join(root, name + ".txt"), 'wb+') for name in names}
+            for row in rows:
+                for i in range(len(names)):
+                    file = files[names[i]]
+                    file.write(row[i].encode('utf-8'))
+                    file.write(b"\n")
+                    file.flush()
+            for file in files.values():
+                file.close()
+        else:
+            store = RunStore(root)
+            for row in rows:
+                store.append(names, row)
+            store.close()
+        print(f"{title:8s} {record_count} records: {time.perf_counter() - t0:6.2f}s")
+
+    reader = RunReader(os.path.join(run_root, "columns"))
+    print(f"read back: {reader.count('lf-e')} values of lf-e, time bounds {reader.time_bounds('lf-time')}, "
+          f"equal: {np.array_equal(reader.column('lf-e'), data[:, 1])}")
+
+
+if __name__ == "__main__":
+
+    # usage: python runstore.py <run directory>   (shows the manifest)
+    #        python runstore.py benchmark <directory>
+    if len(sys.argv) > 2 and sys.argv[1] == 'benchmark':
+        benchmark(sys.argv[2])
+    else:
+        reader = RunReader(sys.argv[1])
+        for name in reader.names:
+            print(f"{name}: {reader.count(name)} values, time bounds {reader.time_bounds(name)}")
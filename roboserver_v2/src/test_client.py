@@ -121,6 +121,84 @@ class Logger_NetworkConnection(Logger):
         self.conn.close()
 
 
+# MULTIPLEXED LOGGING --------------------------------------------------------------------------
+
+
+class ChannelConnection:
+
+    def __init__(self, host=HOST, port=PORT):
+        """
+        A single connection shared by many loggers (see Logger_Channel), instead of one socket per logger.
+        Every logger gets a channel id, its header line is sent as "#<id>,name,name" and its values as "<id>,value,value".
+        The server side is Server_GeneralLogger.MultiplexedRobotServer.
+
+        :param host: IP of the EV3
+        :param port: port the server connects to
+        """
+        self.host = host
+        self.port = port
+        self.channel_count = 0
+        # loggers of different threads share the connection, a line must never be interrupted by another one
+        self.lock = threading.Lock()
+
+        try:
+            print("creating socket")
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            print("socket created")
+            s.bind((self.host, self.port))
+            print("multiplexed server listening")
+            s.listen(10)
+            self.conn, addr = s.accept()
+            print("accepted")
+            self.conn.settimeout(25)
+            s.close()
+
+        except:
+            print("connection failed")
+            raise Exception("ChannelConnection: Connection to host failed")
+
+    def open_channel(self, value_names):
+        """
+        :param value_names: names of the values logged on the channel
+        :return: id of the new channel
+        """
+        self.lock.acquire()
+        channel_id = self.channel_count
+        self.channel_count += 1
+        self.lock.release()
+        self.send("#" + str(channel_id) + "," + ",".join([name for name in value_names]) + "\n")
+        return channel_id
+
+    def send(self, string):
+        data = string.encode('ascii')
+        self.lock.acquire()
+        try:
+            self.conn.sendall(data)
+        finally:
+            self.lock.release()
+
+    def __del__(self):
+        self.conn.close()
+
+
+class Logger_Channel(Logger):
+
+    def __init__(self, value_names, connection, log_every_nth=1):
+        """
+        logger that sends its values on its own channel of a ChannelConnection
+
+        :param value_names: names of the logged values
+        :param connection: ChannelConnection shared with the other loggers
+        """
+        super().__init__(value_names, log_every_nth)
+        self.connection = connection
+        self.id_num = connection.open_channel(value_names)
+        self.tag = str(self.id_num) + ","
+
+    def log(self, values):
+        self.connection.send(self.tag + ",".join([str(value) for value in values]) + '\n')
+
+
 # LOG LOOP FOR LOGING DATA AT A GIVEN FREQUENCY---------------------------------------------------------------------
 
 
@@ -163,6 +241,11 @@ if __name__ == "__main__":
     logger1 = Logger_NetworkConnection(["time", "cs-v", "cs-e", "cs-i", "cs-d"], HOST, PORT, log_every_nth=2)
     # logger2 = Logger_NetworkConnection(["time", "cs-v", "cs-e", "cs-i", "cs-d"], HOST, PORT, log_every_nth=2)
 
+    # all loggers over one connection (Server_GeneralLogger.MultiplexedRobotServer):
+    # connection = ChannelConnection(HOST, PORT)
+    # logger1 = Logger_Channel(["time", "cs-v", "cs-e", "cs-i", "cs-d"], connection, log_every_nth=2)
+    # logger2 = Logger_Channel(["time", "lf-e", "lf-i", "lf-d", "lf-u"], connection)
+
     '''
     for i in range(1000):
         logger1.log([time.time(), 1, 2, 3, 4])
@@ -0,0 +1,313 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+import archive
+import batchparse
+import parsecache
+import runstore
+
+INDEX_SUFFIX = ".idx.npz"
+READ_SIZE = 1 << 24
+
+
+class LineIndex:
+
+    def __init__(self, path, stride=1024, time_column=False):
+        """
+        Sparse index of a text column file (one value per line): the byte offset of every stride-th line and,
+        for a time column, the time on that line. The index is stored next to the file as <file>.idx.npz and
+        only the part of the file that was appended since is scanned when it is opened again.
+        Time columns have to be in increasing order, like the time stamps of the robot.
+
+        :param path: path of the text file
+        :param stride: number of lines between two index entries
+        :param time_column: also index the values (needed for time_range / lines_between)
+        """
+        self.path = path
+        self.stride = stride
+        self.time_column = time_column
+        self.offsets = np.zeros(0, dtype=np.int64)
+        self.times = np.zeros(0)
+        self.line_count = 0
+        # byte offset behind the last complete line that is indexed
+        self.end = 0
+        self._load()
+        self.update()
+
+    def _index_path(self):
+        return self.path + INDEX_SUFFIX
+
+    def _load(self):
+        try:
+            index = np.load(self._index_path())
+        except (OSError, ValueError):
+            return
+        if int(index['stride']) != self.stride or bool(index['time_column']) != self.time_column:
+            return
+        if int(index['end']) > os.path.getsize(self.path):
+            # the file was replaced by a shorter one
+            return
+        self.offsets = index['offsets']
+        self.times = index['times']
+        self.line_count = int(index['line_count'])
+        self.end = int(index['end'])
+
+    def _save(self):
+        try:
+            with open(self._index_path(), 'wb') as file:
+                np.savez(file, offsets=self.offsets, times=self.times, line_count=self.line_count, end=self.end,
+                         stride=self.stride, time_column=self.time_column)
+        except OSError:
+            # read only run directory, the index is just not cached
+            pass
+
+    def update(self):
+        """
+        indexes the lines appended to the file since the last update
+        """
+        size = os.path.getsize(self.path)
+        if size <= self.end:
+            return
+
+        offsets = []
+        sample_lines = []
+        with open(self.path, 'rb') as file:
+            file.seek(self.end)
+            # file offset of the first byte of chunk
+            base = self.end
+            rest = b""
+            while True:
+                data = file.read(READ_SIZE)
+                if len(data) == 0:
+                    break
+                chunk = rest + data
+                newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == batchparse.NEWLINE)
+                if len(newlines) == 0:
+                    rest = chunk
+                    continue
+                # line m of the chunk is line self.line_count + m of the file
+                starts = np.r_[0, newlines[:-1] + 1]
+                picked = np.arange((-self.line_count) % self.stride, len(starts), self.stride)
+                offsets.append(base + starts[picked])
+                if self.time_column:
+                    sample_lines.extend(chunk[starts[m]:newlines[m]] for m in picked)
+                self.line_count += len(newlines)
+                consumed = int(newlines[-1]) + 1
+                base += consumed
+                self.end = base
+                rest = chunk[consumed:]
+
+        if len(offsets) == 0:
+            return
+        self.offsets = np.concatenate([self.offsets] + offsets)
+        if self.time_column:
+            values, _valid = batchparse.parse_csv_block(b"\n".join(sample_lines) + b"\n", 1)
+            times = np.concatenate([self.times, values[:, 0]])
+            # broken time stamps must not break the order searchsorted relies on
+            times[np.isnan(times)] = -np.inf
+            self.times = np.maximum.accumulate(times)
+        self._save()
+
+    def lines_between(self, t0, t1):
+        """
+        :param t0: start time, None for the start of the file
+        :param t1: end time, None for the end of the file
+        :return: (first line, end line) of the index blocks containing all lines with t0 <= time <= t1
+        """
+        if not self.time_column:
+            raise Exception("LineIndex: " + self.path + " is not indexed as time column")
+        first = 0
+        if t0 is not None:
+            first = max(0, int(np.searchsorted(self.times, t0, side='right')) - 1) * self.stride
+        end = self.line_count
+        if t1 is not None:
+            block = int(np.searchsorted(self.times, t1, side='right'))
+            end = min(self.line_count, block * self.stride)
+        return first, max(first, end)
+
+    def _offset(self, line):
+        if line >= self.line_count:
+            return self.end
+        block = line // self.stride
+        if line % self.stride != 0:
+            raise Exception("LineIndex: lines can only be read from index entries")
+        return int(self.offsets[block])
+
+    def read_lines(self, first, end):
+        """
+        :param first: first line, a multiple of stride
+        :param end: line behind the last line, any line (the lines of another column of a ragged run
+                    don't end at the index entries of this one)
+        :return: float64 array with the values of the lines (NaN for values that are no number)
+        """
+        first = min(first, self.line_count)
+        end = min(end, self.line_count)
+        # read up to the next index entry and drop the lines behind end
+        read_end = min(-(-end // self.stride) * self.stride, self.line_count)
+        start_offset = self._offset(first)
+        end_offset = self._offset(read_end)
+        with open(self.path, 'rb') as file:
+            file.seek(start_offset)
+            block = file.read(end_offset - start_offset)
+        values, _valid = batchparse.parse_csv_block(block, 1)
+        return values[:max(end - first, 0), 0]
+
+
+def _text_path(data_root, name):
+    return os.path.join(data_root, name + ".txt")
+
+
+def time_bounds(data_root, time_name):
+    """
+    :return: (first, last) time of a time parameter of a stored run
+    """
+    if runstore.is_run_store(data_root):
+        return runstore.RunReader(data_root).time_bounds(time_name)
+    if archive.is_archive(data_root):
+        return archive.ArchiveReader(data_root).time_bounds(time_name)
+    index = LineIndex(_text_path(data_root, time_name), time_column=True)
+    if index.line_count == 0:
+        return None
+    last_block = (index.line_count - 1) // index.stride * index.stride
+    return float(index.times[0]), float(index.read_lines(last_block, index.line_count)[-1])
+
+
+def load_window(data_root, x_name, y_names, t0=None, t1=None, relative=False, stride=1024):
+    """
+    loads the values of a stored run (text files, runstore columns or archive) with t0 <= x <= t1
+    without reading the rest of the files
+
+    :param data_root: directory of the run
+    :param x_name: time parameter the window refers to, e.g. "lf-time"
+    :param y_names: parameters recorded with x_name, e.g. ["lf-e", "lf-u"]
+    :param t0: start of the window, None for the start of the run
+    :param t1: end of the window, None for the end of the run
+    :param relative: t0 and t1 are seconds since the first time of the run
+    :param stride: lines between two entries of the sparse index
+    :return: (x, [y, ...]) float64 arrays of the same length
+    """
+    if relative:
+        bounds = time_bounds(data_root, x_name)
+        start = 0.0 if bounds is None else bounds[0]
+        t0 = None if t0 is None else t0 + start
+        t1 = None if t1 is None else t1 + start
+
+    if runstore.is_run_store(data_root):
+        reader = runstore.RunReader(data_root)
+        x = reader.column(x_name)
+        # binary search on the memory map only touches a few pages
+        first = 0 if t0 is None else int(np.searchsorted(x, t0, side='left'))
+        end = len(x) if t1 is None else int(np.searchsorted(x, t1, side='right'))
+        ys = [np.array(reader.column(name)[first:end]) for name in y_names]
+        x = np.array(x[first:end])
+    elif archive.is_archive(data_root):
+        # only the chunks overlapping the window are decompressed
+        return archive.ArchiveReader(data_root).load_window(x_name, y_names, t0, t1)
+    elif t0 is None and t1 is None:
+        # whole files, parsed once and then mapped from the .npy sidecars
+        x = parsecache.load(_text_path(data_root, x_name))
+        ys = [parsecache.load(_text_path(data_root, name)) for name in y_names]
+    else:
+        x_index = LineIndex(_text_path(data_root, x_name), stride=stride, time_column=True)
+        first, end = x_index.lines_between(t0, t1)
+        x = x_index.read_lines(first, end)
+        ys = [LineIndex(_text_path(data_root, name), stride=stride).read_lines(first, end) for name in y_names]
+
+        # the index blocks are larger than the window
+        mask = np.ones(len(x), dtype=bool)
+        if t0 is not None:
+            mask &= x >= t0
+        if t1 is not None:
+            mask &= x <= t1
+        length = min([len(x)] + [len(y) for y in ys])
+        mask = mask[:length]
+        x = x[:length][mask]
+        ys = [y[:length][mask] for y in ys]
+
+    length = min([len(x)] + [len(y) for y in ys])
+    return x[:length], [y[:length] for y in ys]
+
+
+# BENCHMARK ----------------------------------------------------------------------------------------------
+
+
+def benchmark(data_root, duration=3600.0, frequency=200.0, window=10.0):
+    """
+    writes an hour of lf-time / lf-e text files (if they don't exist) and compares reading a
+    window seconds slice with readlines() of the whole files
+    """
+    os.makedirs(data_root, exist_ok=True)
+    x_path = _text_path(data_root, "lf-time")
+    y_path = _text_path(data_root, "lf-e")
+    if not os.path.exists(x_path):
+        count = int(duration * frequency)
+        t = 1.7e9 + np.arange(count) / frequency
+        with open(x_path, 'w') as file:
+            file.write("\n".join(map(str, t.tolist())) + "\n")
+        with open(y_path, 'w') as file:
+            file.write("\n".join(map(str, np.sin(t).tolist())) + "\n")
+
+    t0 = time.perf_counter()
+    with open(x_path, 'r') as file:
+        x_all = [float(line.strip()) for line in file.readlines()]
+    with open(y_path, 'r') as file:
+        y_all = [float(line.strip()) for line in file.readlines()]
+    t_full = time.perf_counter() - t0
+
+    for path in [x_path, y_path]:
+        if os.path.exists(path + INDEX_SUFFIX):
+            os.remove(path + INDEX_SUFFIX)
+    t0 = time.perf_counter()
+    load_window(data_root, "lf-time", ["lf-e"], 0, window, relative=True)
+    t_first = time.perf_counter() - t0
+
+    middle = (x_all[-1] - x_all[0]) / 2
+    t0 = time.perf_counter()
+    x, (y,) = load_window(data_root, "lf-time", ["lf-e"], middle, middle + window, relative=True)
+    t_window = time.perf_counter() - t0
+
+    print(f"{len(x_all)} lines: readlines {t_full * 1000:.0f} ms, "
+          f"first window (builds the index) {t_first * 1000:.0f} ms, {window:.0f}s window {t_window * 1000:.1f} ms "
+          f"({len(x)} values)")
+
+
+def check_ragged(data_root, stride=1024):
+    """
+    regression check: windows of a run whose columns have different line counts (a writer that didn't flush
+    all files, a run cut off mid-record) are the same as the records both whole files have
+    """
+    os.makedirs(data_root, exist_ok=True)
+    t = 1.7e9 + np.arange(2000) / 100
+    for name, values in [("lf-time", t[:1500]), ("lf-e", np.sin(t)), ("lf-u", np.cos(t[:700]))]:
+        path = _text_path(data_root, name)
+        with open(path, 'w') as file:
+            file.write("".join(repr(value) + "\n" for value in values.tolist()))
+        if os.path.exists(path + INDEX_SUFFIX):
+            os.remove(path + INDEX_SUFFIX)
+
+    for t0, t1 in [(5, 100), (0, 3), (6.5, 9), (14, 15), (None, 12)]:
+        x, (e, u) = load_window(data_root, "lf-time", ["lf-e", "lf-u"], t0, t1, relative=True, stride=stride)
+        length = min(1500, 700)
+        mask = np.ones(length, dtype=bool)
+        if t0 is not None:
+            mask &= t[:length] >= t[0] + t0
+        if t1 is not None:
+            mask &= t[:length] <= t[0] + t1
+        if not (np.array_equal(x, t[:length][mask]) and np.array_equal(e, np.sin(t)[:length][mask]) and
+                np.array_equal(u, np.cos(t)[:length][mask])):
+            raise Exception(f"check_ragged: wrong window {t0} ... {t1}")
+    print("ragged columns: ok")
+
+
+if __name__ == "__main__":
+
+    # usage: python timeslice.py <directory>         (benchmark)
+    #        python timeslice.py check <directory>   (regression check of ragged columns)
+    if len(sys.argv) > 2 and sys.argv[1] == 'check':
+        check_ragged(sys.argv[2])
+        check_ragged(sys.argv[2], stride=7)
+    else:
+        benchmark(sys.argv[1] if len(sys.argv) > 1 else "timeslice_benchmark")